@@ -0,0 +1,62 @@
+"""Compares two benchmark reports of `benchmarks.run` (or `benchmarks.import_time`).
+
+Usage: python -m benchmarks.compare baseline.json candidate.json [--threshold 1.2]
+
+The exit code is 1, if a benchmark of the candidate is slower than the baseline by more than the
+threshold factor (median timings).
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _timings(report: dict) -> dict:
+    return {
+        (result["name"], result["size"]): result["seconds"]["median"]
+        for result in report.get("results", list())
+    }
+
+
+def compare(baseline: dict, candidate: dict, threshold: float = 1.2) -> list:
+    """Returns (name, size, baseline seconds, candidate seconds, ratio, regression) for all benchmarks in both reports."""
+    baseline_timings = _timings(baseline)
+    candidate_timings = _timings(candidate)
+    comparison = list()
+    for key in sorted(baseline_timings.keys() & candidate_timings.keys()):
+        ratio = candidate_timings[key] / baseline_timings[key]
+        comparison.append(
+            (
+                *key,
+                baseline_timings[key],
+                candidate_timings[key],
+                ratio,
+                ratio > threshold,
+            )
+        )
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args()
+
+    comparison = compare(
+        json.loads(args.baseline.read_text()),
+        json.loads(args.candidate.read_text()),
+        args.threshold,
+    )
+    for name, size, baseline, candidate, ratio, regression in comparison:
+        marker = "REGRESSION" if regression else ""
+        print(
+            f"{name:<28} {size:>9} {baseline:>10.4f}s {candidate:>10.4f}s {ratio:>6.2f}x {marker}"
+        )
+    sys.exit(1 if any(row[-1] for row in comparison) else 0)
+
+
+if __name__ == "__main__":
+    main()
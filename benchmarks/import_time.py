@@ -0,0 +1,106 @@
+"""Import-time benchmark for the Pivot Track CLI.
+
+Runs `import pivot_track.cli` in fresh interpreters and reports wall-clock startup time, the
+cumulative import time reported by `python -X importtime` and heavy dependencies, that got loaded
+although no connector was used.
+
+Usage: python -m benchmarks.import_time [--runs 10] [--output import_time.json]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPOSITORY_PATH = Path(__file__).parent.parent
+HEAVY_MODULES = [
+    "shodan",
+    "censys",
+    "opensearchpy",
+    "common_osint_model",
+    "pydantic",
+    "rich.table",
+]
+IMPORT_STATEMENT = "import pivot_track.cli"
+
+
+def measure_wall_clock(runs: int) -> list:
+    """Returns the wall-clock time (in seconds) of one interpreter start with the CLI import per run."""
+    timings = list()
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", IMPORT_STATEMENT], cwd=REPOSITORY_PATH, check=True
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def measure_import_time() -> dict:
+    """Returns the cumulative import time (in microseconds) per top-level module, as reported by `-X importtime`."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_STATEMENT],
+        cwd=REPOSITORY_PATH,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    cumulative = dict()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, module = line.removeprefix("import time:").split("|")
+        if not cumulative_us.strip().isdigit():
+            continue
+        cumulative[module.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def loaded_heavy_modules() -> list:
+    """Returns all heavy modules, that are imported by the CLI without running a command."""
+    check = f"import sys; {IMPORT_STATEMENT}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    completed = subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=REPOSITORY_PATH,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return [module for module in completed.stdout.strip().split(",") if module]
+
+
+def run(runs: int = 10) -> dict:
+    wall_clock = measure_wall_clock(runs)
+    cumulative = measure_import_time()
+    return {
+        "benchmark": "import_time",
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "wall_clock_seconds": {
+            "min": min(wall_clock),
+            "median": statistics.median(wall_clock),
+            "max": max(wall_clock),
+        },
+        "pivot_track_cli_import_us": cumulative.get("pivot_track.cli"),
+        "heavy_modules_loaded": loaded_heavy_modules(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    report = json.dumps(result, indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Offline micro- and macro-benchmarks for Pivot Track.
+
+Micro-benchmarks measure single pipeline stages (Common OSINT Model conversion, the conversion of
+query result lists and the detection of new elements), the macro-benchmark measures full
+`Tracking.track_definitions` cycles. All benchmarks run against the in-process stand-ins in
+`tests.mocks`, so no API credits are used. Results are written as JSON, see `benchmarks.compare`.
+
+Usage: python -m benchmarks.run [--sizes 1000 10000] [--repeat 3] [--output results.json]
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pivot_track.lib.query import QueryResult
+from pivot_track.lib.track import Tracking, TrackingDefinition
+
+from tests import mocks
+
+PAGE_SIZE = 100  # Hosts per source response, like a result page of Shodan or Censys
+
+
+def _definition(sources=("shodan", "censys")) -> TrackingDefinition:
+    return mocks.tracking_definition(
+        *sources, query="benchmark", title="Benchmark definition"
+    )
+
+
+def _pages(size: int, payload) -> list:
+    """Returns query results with `size` hosts in total, split into pages of PAGE_SIZE hosts."""
+    return [
+        QueryResult(
+            payload(min(PAGE_SIZE, size - offset), offset=offset),
+            query_command="generic",
+            search_term="benchmark",
+        )
+        for offset in range(0, size, PAGE_SIZE)
+    ]
+
+
+def bench_com_result_shodan(size: int):
+    pages = _pages(size, mocks.shodan_search)
+    start = time.perf_counter()
+    for page in pages:
+        page.com_result
+    return time.perf_counter() - start
+
+
+def bench_com_result_censys(size: int):
+    pages = _pages(size, mocks.censys_search)
+    start = time.perf_counter()
+    for page in pages:
+        page.com_result
+    return time.perf_counter() - start
+
+
+def bench_query_result_to_com_list(size: int):
+    pages = _pages(size // 2, mocks.shodan_search) + _pages(
+        size - size // 2, mocks.censys_search
+    )
+    connector = mocks.fake_opensearch_connector()
+    start = time.perf_counter()
+    connector.query_result_to_com_list(pages)
+    return time.perf_counter() - start
+
+
+def bench_new_element_detection(size: int):
+    """Half of the hosts are already known for the definition, the other half is new."""
+    definition = _definition()
+    connector = mocks.fake_opensearch_connector()
+    pages = _pages(size, mocks.shodan_search)
+    connector.tracking_output(
+        query_result=pages[: len(pages) // 2], definition=definition
+    )
+    hosts = connector.query_result_to_com_list(pages)
+    start = time.perf_counter()
+    for host in hosts:
+        connector.tracking_get_new_elements(host, definition)
+    return time.perf_counter() - start
+
+
+def bench_tracking_cycle(size: int):
+    """Two full tracking cycles for one definition on both sources: the first one finds only new
+    hosts, the second one only known hosts."""
+    definition = _definition()
+    source_connections = [
+        mocks.FakeShodanSourceConnector(size // 2),
+        mocks.FakeCensysSourceConnector(size - size // 2, offset=size // 2),
+    ]
+    output_connection = mocks.fake_opensearch_connector()
+    start = time.perf_counter()
+    for _ in range(2):
+        Tracking.track_definitions(
+            definitions=[definition],
+            source_connections=source_connections,
+            output_connection=output_connection,
+        )
+    return (time.perf_counter() - start) / 2
+
+
+BENCHMARKS = {
+    "com_result_shodan": bench_com_result_shodan,
+    "com_result_censys": bench_com_result_censys,
+    "query_result_to_com_list": bench_query_result_to_com_list,
+    "new_element_detection": bench_new_element_detection,
+    "tracking_cycle": bench_tracking_cycle,
+}
+
+
+def run(sizes: list, repeat: int = 3, names: list = None) -> dict:
+    results = list()
+    for name, benchmark in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for size in sizes:
+            timings = [benchmark(size) for _ in range(repeat)]
+            result = {
+                "name": name,
+                "size": size,
+                "repeat": repeat,
+                "seconds": {
+                    "min": min(timings),
+                    "median": statistics.median(timings),
+                    "max": max(timings),
+                },
+                "per_host_us": min(timings) / size * 1_000_000,
+            }
+            print(
+                f"{name:<28} {size:>9} hosts {result['seconds']['median']:>10.4f}s {result['per_host_us']:>10.2f}us/host",
+                file=sys.stderr,
+            )
+            results.append(result)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--benchmark", action="append", choices=BENCHMARKS.keys(), default=None
+    )
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, force=True)
+    report = json.dumps(run(args.sizes, args.repeat, args.benchmark), indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
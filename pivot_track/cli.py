@@ -1,18 +1,22 @@
 import typer
 import logging
+import sys
 import time
 from typing_extensions import Annotated
 from rich.console import Console
 from pathlib import Path
+from typing import List, TYPE_CHECKING
+from contextlib import nullcontext
 
-from pivot_track.lib import utils
-from pivot_track.lib.track import Tracking
-from pivot_track.lib.query import Querying
-from pivot_track.lib.connectors import (
-    OpenSearchConnector,
-    SourceConnector,
-    FileConnector,
-)
+from pivot_track.lib import utils, metrics, log
+from pivot_track.lib.profiling import Profiler
+from pivot_track.lib.query import Querying, MergedQueryResult
+from pivot_track.lib.cache import QueryCache
+from pivot_track.lib.connections import ConnectionManager
+from pivot_track.lib.connectors import SourceConnector, HostQuery
+
+if TYPE_CHECKING:
+    from pivot_track.lib.connectors import OpenSearchConnector
 
 
 def init_logging(config) -> dict:
@@ -26,8 +30,7 @@ def init_logging(config) -> dict:
         basic_config_handlers.append(logging.FileHandler(logfilepath))
     logging.basicConfig(
         level=config.get("logging").get("level"),
-        handlers=basic_config_handlers,
-        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+        handlers=log.configure_handlers(basic_config_handlers, config.get("logging")),
     )
 
 
@@ -41,8 +44,87 @@ query_app = typer.Typer(
     pretty_exceptions_show_locals=False,
 )
 app.add_typer(query_app, name="query")
+cache_app = typer.Typer(
+    help="This module helps to inspect and maintain the local query cache.",
+    pretty_exceptions_show_locals=False,
+)
+app.add_typer(cache_app, name="cache")
 
 err_console = Console(stderr=True, style="bold red")
+status_console = Console(stderr=True, style="dim")
+
+
+def _host_query_connections(connections: ConnectionManager, service: str) -> list:
+    """Returns the source connections for a service: one source, a comma-separated list of sources or "all"
+    (every enabled source with host queries)."""
+    names = None if service == "all" else [name.strip() for name in service.split(",")]
+    source_connections = [
+        connection
+        for connection in connections.source_connections(names)
+        if isinstance(connection, HostQuery)
+    ]
+    if names is not None and len(source_connections) != len(names):
+        return list()
+    return source_connections
+
+
+def _output_sources(
+    config: dict,
+    source_results,
+    output: str,
+    raw: bool,
+    merge: bool,
+    connections: ConnectionManager,
+    query_command: str,
+    search_term: str,
+):
+    """Writes the results of a query on several sources, as they arrive. With merge, the hosts of all sources are
+    merged by IP into one output, once the slowest source answered."""
+    query_results = list()
+
+    def results():
+        for connection, result in source_results:
+            # Sources, that do not know the host, return results without raw result
+            result = [
+                element
+                for element in (result if isinstance(result, list) else [result])
+                if element is not None and element.raw_result is not None
+            ]
+            if not result:
+                status_console.print(
+                    f"{connection.short_name}: no results", markup=False
+                )
+                continue
+            status_console.print(
+                f"{connection.short_name}: {len(result)} result(s)", markup=False
+            )
+            yield result
+
+    if raw or not merge:
+        Querying.output_stream(
+            config=config,
+            query_results=results(),
+            output_format=output,
+            raw=raw,
+            connections=connections,
+        )
+        return
+    for result in results():
+        query_results.extend(result)
+    Querying.output(
+        config=config,
+        query_result=MergedQueryResult(query_results, query_command, search_term),
+        output_format=output,
+        raw=raw,
+        connections=connections,
+    )
+
+
+def _profiler(command: str, profile: Path = None, cprofile: bool = False):
+    """Returns a `Profiler` for the run, if a report directory was given with `--profile`."""
+    if profile is None:
+        return nullcontext()
+    return Profiler(command, cprofile=cprofile)
 
 
 # TODO rename "raw" format to "source" format
@@ -54,6 +136,11 @@ def query_host(
     host: str,
     raw: Annotated[bool, typer.Option()] = False,
     output: Annotated[str, typer.Option()] = "cli",
+    merge: Annotated[bool, typer.Option()] = True,
+    no_cache: Annotated[bool, typer.Option("--no-cache")] = False,
+    refresh: Annotated[bool, typer.Option("--refresh")] = False,
+    profile: Annotated[Path, typer.Option("--profile")] = None,
+    cprofile: Annotated[bool, typer.Option("--cprofile")] = False,
     config_path: Annotated[str, typer.Option(envvar="PIVOTTRACK_CONFIG")] = None,
 ):
     if raw and output == "cli":
@@ -70,18 +157,115 @@ def query_host(
 
     init_logging(config)
 
-    # Find source connection and setup for query
-    source_connections = utils.init_source_connections(config, filter=service)
-    if not len(source_connections) == 1:
+    # Find source connections ("all" or comma-separated sources) and setup for query
+    connections = ConnectionManager(config)
+    source_connections = _host_query_connections(connections, service)
+    if not source_connections:
         err_console.print(f'Source "{service}" is not available.')
         exit(-1)
-    service_connection = source_connections[0]
+    cache = None if no_cache else QueryCache.from_config(config)
 
     try:
-        host_query_result = Querying.host(host=host, connection=service_connection)
-        Querying.output(
-            config=config, query_result=host_query_result, output_format=output, raw=raw
+        with _profiler("query-host", profile, cprofile) as profiler:
+            if len(source_connections) > 1:
+                # All sources are queried concurrently
+                _output_sources(
+                    config,
+                    Querying.fan_out(
+                        source_connections,
+                        lambda connection: Querying.host(
+                            host=host,
+                            connection=connection,
+                            cache=cache,
+                            refresh=refresh,
+                        ),
+                    ),
+                    output=output,
+                    raw=raw,
+                    merge=merge,
+                    connections=connections,
+                    query_command="host",
+                    search_term=host,
+                )
+            else:
+                host_query_result = Querying.host(
+                    host=host,
+                    connection=source_connections[0],
+                    cache=cache,
+                    refresh=refresh,
+                )
+                Querying.output(
+                    config=config,
+                    query_result=host_query_result,
+                    output_format=output,
+                    raw=raw,
+                    connections=connections,
+                )
+        if profiler is not None:
+            profiler.write_report(profile)
+
+    except NotImplementedError:
+        err_console.print(
+            'This data source does not exist. Use this command with "--help" for more information.'
+        )
+        exit(-1)
+
+
+@query_app.command(
+    "hosts",
+    help='This command looks up many hosts (IPs) from a file, or from stdin with "-", on a given OSINT source.',
+)
+def query_hosts(
+    service: str,
+    file: Annotated[typer.FileText, typer.Argument()] = "-",
+    raw: Annotated[bool, typer.Option()] = False,
+    output: Annotated[str, typer.Option()] = "cli",
+    workers: Annotated[int, typer.Option("--workers")] = 4,
+    no_cache: Annotated[bool, typer.Option("--no-cache")] = False,
+    refresh: Annotated[bool, typer.Option("--refresh")] = False,
+    profile: Annotated[Path, typer.Option("--profile")] = None,
+    cprofile: Annotated[bool, typer.Option("--cprofile")] = False,
+    config_path: Annotated[str, typer.Option(envvar="PIVOTTRACK_CONFIG")] = None,
+):
+    if raw and output == "cli":
+        err_console.print(
+            "This combination does not work. CLI output does only work with normalized data handling."
         )
+        exit(-1)
+
+    if config_path is None:
+        err_console.print("Configuration file must not be None.")
+        exit(-1)
+
+    config = utils.load_config(Path(config_path))
+    init_logging(config)
+
+    connections = ConnectionManager(config)
+    service_connection = connections.source_connection(service)
+    if service_connection is None:
+        err_console.print(f'Source "{service}" is not available.')
+        exit(-1)
+    cache = None if no_cache else QueryCache.from_config(config)
+    hosts = Querying.read_hosts(file)
+
+    try:
+        with _profiler("query-hosts", profile, cprofile) as profiler:
+            # Results are written to the output batch by batch, as they arrive
+            Querying.output_stream(
+                config=config,
+                query_results=Querying.hosts(
+                    hosts,
+                    connection=service_connection,
+                    cache=cache,
+                    refresh=refresh,
+                    workers=workers,
+                ),
+                output_format=output,
+                raw=raw,
+                connections=connections,
+            )
+        if profiler is not None:
+            profiler.write_report(profile)
 
     except NotImplementedError:
         err_console.print(
@@ -99,6 +283,11 @@ def query_generic(
     raw: Annotated[bool, typer.Option()] = False,
     expand: Annotated[bool, typer.Option()] = True,
     output: Annotated[str, typer.Option()] = "cli",
+    merge: Annotated[bool, typer.Option()] = True,
+    no_cache: Annotated[bool, typer.Option("--no-cache")] = False,
+    refresh: Annotated[bool, typer.Option("--refresh")] = False,
+    profile: Annotated[Path, typer.Option("--profile")] = None,
+    cprofile: Annotated[bool, typer.Option("--cprofile")] = False,
     config_path: Annotated[str, typer.Option(envvar="PIVOTTRACK_CONFIG")] = None,
 ):
     if raw and output == "cli":
@@ -114,31 +303,65 @@ def query_generic(
     config = utils.load_config(Path(config_path))
     init_logging(config)
 
-    # Find source connection and setup for query
-    source_connections = utils.init_source_connections(config, filter=service)
-    if not len(source_connections) == 1:
+    # Find source connections ("all" or comma-separated sources) and setup for query
+    connections = ConnectionManager(config)
+    source_connections = _host_query_connections(connections, service)
+    if not source_connections:
         err_console.print(f'Source "{service}" is not available.')
         exit(-1)
-    service_connection = source_connections[0]
+    cache = None if no_cache else QueryCache.from_config(config)
 
     try:
-        generic_query_result, expanded_query_result = Querying.host_query(
-            search=search, connection=service_connection, expand=expand
-        )
-        if not expand:
-            Querying.output(
-                config=config,
-                query_result=generic_query_result,
-                output_format=output,
-                raw=raw,
-            )
-        else:
-            Querying.output(
-                config=config,
-                query_result=expanded_query_result,
-                output_format=output,
-                raw=raw,
-            )
+        with _profiler("query-generic", profile, cprofile) as profiler:
+            if len(source_connections) > 1:
+
+                def generic_query(connection):
+                    generic_query_result, expanded_query_result = Querying.host_query(
+                        search=search,
+                        connection=connection,
+                        expand=expand,
+                        cache=cache,
+                        refresh=refresh,
+                    )
+                    return expanded_query_result if expand else generic_query_result
+
+                # All sources are queried concurrently
+                _output_sources(
+                    config,
+                    Querying.fan_out(source_connections, generic_query),
+                    output=output,
+                    raw=raw,
+                    merge=merge,
+                    connections=connections,
+                    query_command="generic",
+                    search_term=search,
+                )
+            else:
+                generic_query_result, expanded_query_result = Querying.host_query(
+                    search=search,
+                    connection=source_connections[0],
+                    expand=expand,
+                    cache=cache,
+                    refresh=refresh,
+                )
+                if not expand:
+                    Querying.output(
+                        config=config,
+                        query_result=generic_query_result,
+                        output_format=output,
+                        raw=raw,
+                        connections=connections,
+                    )
+                else:
+                    Querying.output(
+                        config=config,
+                        query_result=expanded_query_result,
+                        output_format=output,
+                        raw=raw,
+                        connections=connections,
+                    )
+        if profiler is not None:
+            profiler.write_report(profile)
 
     except NotImplementedError:
         err_console.print(
@@ -147,6 +370,66 @@ def query_generic(
         exit(-1)
 
 
+@app.command(
+    "pivot",
+    help="This command pivots automatically from seeds (IPs, domains, certificate or JARM fingerprints) over the found hosts, and writes the graph as JSON Lines.",
+)
+def pivot(
+    seeds: Annotated[List[str], typer.Argument()],
+    service: Annotated[str, typer.Option("--service")] = "all",
+    depth: Annotated[int, typer.Option("--depth")] = None,
+    max_credits: Annotated[int, typer.Option("--max-credits")] = None,
+    max_seconds: Annotated[float, typer.Option("--max-seconds")] = None,
+    max_nodes: Annotated[int, typer.Option("--max-nodes")] = None,
+    workers: Annotated[int, typer.Option("--workers")] = None,
+    no_cache: Annotated[bool, typer.Option("--no-cache")] = False,
+    profile: Annotated[Path, typer.Option("--profile")] = None,
+    cprofile: Annotated[bool, typer.Option("--cprofile")] = False,
+    config_path: Annotated[str, typer.Option(envvar="PIVOTTRACK_CONFIG")] = None,
+):
+    if config_path is None:
+        err_console.print("Configuration file must not be None.")
+        exit(-1)
+
+    from pivot_track.lib.pivot import PivotEngine
+    from pivot_track.lib.connectors.printer import json_encoder
+
+    config = utils.load_config(Path(config_path))
+    init_logging(config)
+
+    connections = ConnectionManager(config)
+    source_connections = _host_query_connections(connections, service)
+    if not source_connections:
+        err_console.print(f'Source "{service}" is not available.')
+        exit(-1)
+    cache = None if no_cache else QueryCache.from_config(config)
+    engine = PivotEngine.from_config(
+        config,
+        source_connections,
+        cache=cache,
+        max_depth=depth,
+        max_credits=max_credits,
+        max_seconds=max_seconds,
+        max_nodes=max_nodes,
+        workers=workers,
+    )
+
+    encode = json_encoder()
+    with _profiler("pivot", profile, cprofile) as profiler:
+        # Nodes and edges are written as they are found
+        for element in engine.run(seeds):
+            sys.stdout.buffer.write(encode(element.to_dict()) + b"\n")
+            sys.stdout.buffer.flush()
+    if profiler is not None:
+        profiler.write_report(profile)
+    status_console.print(
+        f"{len(engine.nodes)} node(s), {len(engine.edges)} edge(s), {len(engine.queries)} query(s), "
+        f"{engine.credits} credit(s)"
+        + (f", stopped by {engine.stop_reason} budget" if engine.stop_reason else ""),
+        markup=False,
+    )
+
+
 @app.command(
     "track",
     help="This command runs Pivot Track in non-interactive mode, to execute queries automatically.",
@@ -160,44 +443,141 @@ def automatic_track(
     interval: Annotated[
         int, typer.Option(envvar="PIVOTTRACK_TRACK_INTERVAL")
     ] = 600,  # Default to 10 minutes
+    # Tracking does not use the query cache by default, cached responses would hide new elements
+    use_cache: Annotated[bool, typer.Option("--cache/--no-cache")] = False,
+    profile: Annotated[Path, typer.Option("--profile")] = None,
+    cprofile: Annotated[bool, typer.Option("--cprofile")] = False,
+    plan: Annotated[bool, typer.Option("--plan")] = False,
 ):
     if config_path is None:
         err_console.print("Configuration file must not be None.")
         exit(-1)
 
+    from pivot_track.lib.track import Tracking
+    from pivot_track.lib.budget import BudgetPlanner
+    from pivot_track.lib.state import TrackingState
+    from pivot_track.lib.connectors import (
+        FileConnector,
+        WebhookConnector,
+        NotificationGroup,
+        FanoutOutputConnector,
+    )
+
     config = utils.load_config(Path(config_path))
     init_logging(config)
+    budget = BudgetPlanner.from_config(config)
+
+    if plan:
+        # Dry run: print the plan of the next cycle without calling any API
+        definitions = Tracking.load_yaml_definition_files(Path(definition_path))
+        _print_plan((budget or BudgetPlanner()).plan(definitions))
+        return
     logger = logging.getLogger(__name__)
     logger.info(
-        f'Starting automatic tracking service with config file "{config_path}" and tracking definitions "{definition_path}".'
+        'Starting automatic tracking service with config file "%s" and tracking definitions "%s".',
+        config_path,
+        definition_path,
     )
 
-    source_connections = utils.init_source_connections(config)
-    # For now we assume, that there is just one output connection (OpenSearch), this will change soon
-    output_connections = utils.init_output_connections(config)[0]
-    notification_connection = FileConnector(Path(config.get("tracking_file")))
+    # Connections are created on first use and kept for all tracking cycles
+    connections = ConnectionManager(config)
+    # Tracking results are written to all tracking outputs, the first one detects new elements
+    tracking_outputs = (config.get("outputs") or dict()).get("tracking", ["opensearch"])
+    output_connections = dict()
+    for name in tracking_outputs:
+        output_connections[name] = connections.output_connection(name)
+        if output_connections[name] is None:
+            err_console.print(f'Output "{name}" is not available.')
+            exit(-1)
+    if len(output_connections) == 1:
+        output_connection = output_connections[tracking_outputs[0]]
+    else:
+        output_connection = FanoutOutputConnector.from_config(
+            config, output_connections
+        )
+    notification_connections = [
+        connection
+        for connection in (
+            FileConnector.from_config(config),
+            WebhookConnector.from_config(config),
+        )
+        if connection is not None
+    ]
+    notification_connection = (
+        notification_connections[0]
+        if len(notification_connections) == 1
+        else NotificationGroup(notification_connections)
+    )
+    cache = QueryCache.from_config(config) if use_cache else None
+    if cache is not None and not run_once:
+        for command, ttl in cache.ttl.items():
+            if ttl > interval:
+                logger.warning(
+                    'Cache TTL of "%s" (%d s) exceeds the tracking interval (%d s). Cycles may use stale results.',
+                    command,
+                    ttl,
+                    interval,
+                )
+    state = TrackingState.from_config(config)
 
-    init_opensearch(config_path)
+    if "opensearch" in output_connections:
+        _init_opensearch_indices(output_connections["opensearch"])
+    metrics.init_metrics(config)
+    metrics_textfile = (config.get("metrics") or dict()).get("textfile")
     running = True
 
     while running:
         definitions = Tracking.load_yaml_definition_files(Path(definition_path))
-        Tracking.track_definitions(
-            definitions=definitions,
-            source_connections=source_connections,
-            output_connection=output_connections,
-            notification_connection=notification_connection,
+        required_sources = sorted(
+            {source for definition in definitions for source in definition.sources}
         )
+        with _profiler("track", profile, cprofile) as profiler:
+            Tracking.track_definitions(
+                definitions=definitions,
+                source_connections=connections.source_connections(required_sources),
+                output_connection=output_connection,
+                notification_connection=notification_connection,
+                cache=cache,
+                budget=budget,
+                state=state,
+            )
+        if profiler is not None:
+            profiler.write_report(profile)
+        if metrics_textfile is not None:
+            metrics.registry.write_textfile(Path(metrics_textfile))
         if not run_once:
             logger.info(
-                f"Done tracking for now. Waiting {interval} seconds for next try."
+                "Done tracking for now. Waiting %s seconds for next try.", interval
             )
             time.sleep(interval)
         else:
             running = False
+            notification_connection.close()
+            if isinstance(output_connection, FanoutOutputConnector):
+                output_connection.close()
             logger.info("Tracking finished.")
 
 
+def _print_plan(plan):
+    from rich.table import Table
+
+    table = Table("Priority", "Definition", "Source", "Credits", "Status")
+    for entry in plan.entries:
+        table.add_row(
+            str(entry.definition.priority),
+            entry.definition.title or str(entry.definition.uuid),
+            entry.source,
+            str(entry.credits),
+            "run" if entry.run else f"skip ({entry.reason})",
+        )
+    Console().print(table)
+    for source, available in plan.available.items():
+        Console().print(
+            f"{source}: {plan.credits(source)} credit(s) planned, "
+            f"{'unlimited' if available is None else available} available."
+        )
+
+
 @app.command(
     "init-opensearch",
     help="This command helps you initializing opensearch indicies, required for the '--output opensearch' option.",
@@ -212,8 +592,14 @@ def init_opensearch(
     config = utils.load_config(Path(config_path))
     init_logging(config)
 
+    from pivot_track.lib.connectors import OpenSearchConnector
+
     opensearch = OpenSearchConnector(config["connectors"]["opensearch"])
-    for connector in utils.subclasses_by_parent(SourceConnector):
+    _init_opensearch_indices(opensearch)
+
+
+def _init_opensearch_indices(opensearch: "OpenSearchConnector"):
+    for connector in utils.connectors_by_parent(SourceConnector):
         if connector.OPENSEARCH_FIELD_PROPERTIES is not None:
             for (
                 index_name,
@@ -225,5 +611,64 @@ def init_opensearch(
     opensearch.init_pivottrack_tracking_index()
 
 
+@cache_app.command(
+    "stats", help="This command shows hit-rate statistics of the query cache."
+)
+def cache_stats(
+    config_path: Annotated[str, typer.Option(envvar="PIVOTTRACK_CONFIG")] = None,
+):
+    if config_path is None:
+        err_console.print("Configuration file must not be None.")
+        exit(-1)
+
+    config = utils.load_config(Path(config_path))
+    cache = QueryCache.from_config(config)
+    if cache is None:
+        err_console.print("Query cache is not configured.")
+        exit(-1)
+
+    from rich.table import Table
+
+    stats = cache.stats()
+    table = Table("Source", "Command", "Hits", "Misses", "Hit Rate")
+    for command_stats in stats["commands"]:
+        table.add_row(
+            command_stats["source"],
+            command_stats["command"],
+            str(command_stats["hits"]),
+            str(command_stats["misses"]),
+            f"{command_stats['hit_rate']:.1%}",
+        )
+    table.add_row(
+        "total",
+        "",
+        str(stats["hits"]),
+        str(stats["misses"]),
+        f"{stats['hit_rate']:.1%}",
+    )
+    Console().print(table)
+    Console().print(
+        f"{stats['entries']} entries, {stats['size_bytes']} of {stats['max_size_bytes']} bytes used."
+    )
+
+
+@cache_app.command(
+    "clear", help="This command removes all entries from the query cache."
+)
+def cache_clear(
+    config_path: Annotated[str, typer.Option(envvar="PIVOTTRACK_CONFIG")] = None,
+):
+    if config_path is None:
+        err_console.print("Configuration file must not be None.")
+        exit(-1)
+
+    config = utils.load_config(Path(config_path))
+    cache = QueryCache.from_config(config)
+    if cache is None:
+        err_console.print("Query cache is not configured.")
+        exit(-1)
+    cache.clear()
+
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, TYPE_CHECKING
+
+from pivot_track.lib.connectors import SourceConnector, connector_registry
+
+if TYPE_CHECKING:
+    from pivot_track.lib.track import TrackingDefinition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPAND_ESTIMATE = 100  # Hosts per result page of Shodan and Censys
+
+
+class PlanEntry:
+    """A `PlanEntry` holds the estimated credits of one definition on one source, and whether it runs in the cycle."""
+
+    def __init__(
+        self,
+        definition: "TrackingDefinition",
+        source: str,
+        credits: int,
+        run: bool = True,
+        reason: str = None,
+    ):
+        self.definition = definition
+        self.source = source
+        self.credits = credits
+        self.run = run
+        self.reason = reason
+
+    def to_dict(self) -> dict:
+        return {
+            "definition": str(self.definition.uuid),
+            "title": self.definition.title,
+            "priority": self.definition.priority,
+            "source": self.source,
+            "credits": self.credits,
+            "run": self.run,
+            "reason": self.reason,
+        }
+
+
+class Plan:
+    """A `Plan` holds the plan entries of a tracking cycle, in the order of execution."""
+
+    def __init__(self, entries: List[PlanEntry], available: dict):
+        self.entries = entries
+        self.available = available
+
+    def definitions_for(self, source: str) -> list:
+        return [
+            entry.definition
+            for entry in self.entries
+            if entry.source == source and entry.run
+        ]
+
+    def credits(self, source: str = None, run: bool = True) -> int:
+        return sum(
+            entry.credits
+            for entry in self.entries
+            if entry.run == run and (source is None or entry.source == source)
+        )
+
+    @property
+    def skipped(self) -> List[PlanEntry]:
+        return [entry for entry in self.entries if not entry.run]
+
+    def to_dict(self) -> dict:
+        return {
+            "available": self.available,
+            "entries": [entry.to_dict() for entry in self.entries],
+        }
+
+
+class BudgetPlanner:
+    """The `BudgetPlanner` class estimates the API credits of tracking cycles and fits them into the
+    configured daily and monthly budgets per source (and the quota reported by the account endpoints).
+    Definitions with higher priority are planned first, definitions that do not fit anymore are skipped.
+    Spent credits are kept in a state file, so that budgets survive restarts."""
+
+    def __init__(
+        self,
+        budgets: dict = None,
+        expand_estimate: int = DEFAULT_EXPAND_ESTIMATE,
+        state_file: Path = None,
+    ):
+        self.budgets = budgets or dict()
+        self.expand_estimate = expand_estimate
+        self.state_file = Path(state_file) if state_file is not None else None
+        self.state = self._load_state()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "BudgetPlanner":
+        """Returns a `BudgetPlanner` for the `budget` section of the configuration, or None if there is none."""
+        budget_config = (config or dict()).get("budget")
+        if not budget_config:
+            return None
+        return cls(
+            budgets={
+                source: budget
+                for source, budget in budget_config.items()
+                if isinstance(budget, dict)
+            },
+            expand_estimate=budget_config.get(
+                "expand_estimate", DEFAULT_EXPAND_ESTIMATE
+            ),
+            state_file=budget_config.get("state_file"),
+        )
+
+    def _load_state(self) -> dict:
+        if self.state_file is None or not self.state_file.exists():
+            return dict()
+        try:
+            return json.loads(self.state_file.read_text())
+        except ValueError:
+            logger.error(
+                'Could not read budget state file "%s". Starting with empty budgets.',
+                self.state_file,
+            )
+            return dict()
+
+    def _save_state(self):
+        if self.state_file is None:
+            return
+        temporary_path = self.state_file.with_name(f".{self.state_file.name}.tmp")
+        temporary_path.write_text(json.dumps(self.state, indent=2))
+        os.replace(temporary_path, self.state_file)
+
+    def _source_state(self, source: str, now: datetime = None) -> dict:
+        now = now or datetime.now(timezone.utc)
+        day, month = now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+        state = self.state.setdefault(source, dict())
+        # Spendings are reset, when a new day (or month) starts
+        if state.get("day") != day:
+            state["day"], state["day_spent"] = day, 0
+        if state.get("month") != month:
+            state["month"], state["month_spent"] = month, 0
+        return state
+
+    def spent(self, source: str) -> dict:
+        with self._lock:
+            state = self._source_state(source)
+            return {"daily": state["day_spent"], "monthly": state["month_spent"]}
+
+    def record(self, source: str, credits: int):
+        """Adds spent credits of a source to the daily and monthly budgets."""
+        if not credits:
+            return
+        with self._lock:
+            state = self._source_state(source)
+            state["day_spent"] += credits
+            state["month_spent"] += credits
+            self._save_state()
+        logger.info('Recorded %d spent credit(s) for source "%s".', credits, source)
+
+    def remaining(self, source: str, quota: int = None) -> int:
+        """Returns the credits, that may still be spent on a source, or None if unlimited."""
+        limits = list()
+        budget = self.budgets.get(source, dict())
+        spent = self.spent(source)
+        for period in ("daily", "monthly"):
+            if budget.get(period) is not None:
+                limits.append(max(budget[period] - spent[period], 0))
+        if quota is not None:
+            limits.append(quota)
+        return min(limits) if limits else None
+
+    def estimate_definition(self, definition: "TrackingDefinition", source: str) -> int:
+        """Estimates the credits of all queries of a definition on a source. Expanded searches add one host
+        lookup per expected result, host queries one per watched host."""
+        connector = connector_registry.load(source, SourceConnector)
+        costs = connector.CREDIT_COSTS if connector is not None else dict()
+        credits = 0
+        for query in definition.queries_by_source(source):
+            if query.command == "host":
+                credits += costs.get("host", 0) * max(len(query.hosts), 1)
+            else:
+                # The count stage of the pre-check only runs on sources with costs, if the query opts in
+                if query.precheck and query.precheck_count:
+                    credits += costs.get("count", 0)
+                credits += costs.get("generic", 0)
+                if query.expand:
+                    credits += costs.get("host", 0) * self.expand_estimate
+        return credits
+
+    def plan(
+        self, definitions: List["TrackingDefinition"], quotas: dict = None
+    ) -> Plan:
+        """Plans a tracking cycle. `quotas` maps sources to their remaining account quota (None if unknown)."""
+        quotas = quotas or dict()
+        sources = sorted(
+            {source for definition in definitions for source in definition.sources}
+        )
+        available = {
+            source: self.remaining(source, quotas.get(source)) for source in sources
+        }
+        left = dict(available)
+        entries = list()
+        # sorted() is stable, definitions with the same priority keep their order
+        for definition in sorted(
+            definitions, key=lambda definition: definition.priority, reverse=True
+        ):
+            for source in sorted(definition.sources):
+                credits = self.estimate_definition(definition, source)
+                if left[source] is not None and credits > left[source]:
+                    entries.append(
+                        PlanEntry(
+                            definition,
+                            source,
+                            credits,
+                            run=False,
+                            reason=f"needs {credits} credit(s), {left[source]} left",
+                        )
+                    )
+                    continue
+                if left[source] is not None:
+                    left[source] -= credits
+                entries.append(PlanEntry(definition, source, credits))
+        plan = Plan(entries, available)
+        for entry in plan.skipped:
+            logger.warning(
+                'Skipping definition "%s" on source "%s" in this cycle: %s.',
+                entry.definition.uuid,
+                entry.source,
+                entry.reason,
+            )
+        return plan
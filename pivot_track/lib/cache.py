@@ -0,0 +1,259 @@
+import functools
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_QUOTED = re.compile(r"(\"[^\"]*\"|'[^']*')")
+
+
+def _locked(method):
+    """Serializes calls of a `QueryCache` method, which share one SQLite connection."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class QueryCache:
+    """The `QueryCache` class is a persistent on-disk cache for raw source responses. It sits between
+    `Querying` and the `HostQuery` connectors and is shared by the CLI and the tracking daemon.
+    Entries are keyed by source, command and normalized query, expire after a per-command TTL and
+    are evicted in least recently used order once the configured size cap is reached. The cache may be
+    used from several threads (e.g. concurrent queries on several sources)."""
+
+    DEFAULT_TTL = {"host": 86400, "generic": 3600}  # Seconds
+    DEFAULT_MAX_SIZE_MB = 256
+    FLUSH_INTERVAL = 30  # Seconds
+    FLUSH_PENDING = 100  # Buffered lookups
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.path = Path(config.get("path", "pivottrack-cache.sqlite"))
+        self.ttl = dict(self.DEFAULT_TTL)
+        self.ttl.update(config.get("ttl") or dict())
+        self.max_size = int(
+            config.get("max_size_mb", self.DEFAULT_MAX_SIZE_MB) * 1024 * 1024
+        )
+        self._lock = threading.RLock()
+        # Access times and hit/miss counters of lookups, written in batches
+        self._pending_access = dict()
+        self._pending_counts = dict()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                source TEXT NOT NULL,
+                command TEXT NOT NULL,
+                query TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (source, command, query)
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+            CREATE TABLE IF NOT EXISTS statistics (
+                source TEXT NOT NULL,
+                command TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, command)
+            );
+            """
+        )
+        self._connection.commit()
+        logger.debug('Opened query cache "%s".', self.path)
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Returns a `QueryCache` for the `cache` section of the configuration, or None if caching is not configured."""
+        cache_config = config.get("cache") if config is not None else None
+        if cache_config is None or not cache_config.get("enabled", True):
+            return None
+        return cls(cache_config)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Normalizes a query string, so that trivially different spellings share one cache entry.
+        Whitespace inside quoted phrases is significant for the sources and is kept as is."""
+        parts = _QUOTED.split(str(query))
+        return "".join(
+            part if index % 2 else re.sub(r"\s+", " ", part)
+            for index, part in enumerate(parts)
+        ).strip()
+
+    @_locked
+    def get(self, source: str, command: str, query: str):
+        """Returns the cached raw response or None, if there is no valid entry."""
+        query = self.normalize_query(query)
+        now = time.time()
+        row = self._connection.execute(
+            "SELECT payload, created FROM responses WHERE source = ? AND command = ? AND query = ?",
+            (source, command, query),
+        ).fetchone()
+        if row is not None and now - row[1] <= self.ttl.get(command, 0):
+            self._pending_access[(source, command, query)] = now
+            self._count(source, command, hit=True)
+            logger.debug('Cache hit for %s %s "%s".', source, command, query)
+            return json.loads(row[0])
+
+        self._count(source, command, hit=False)
+        logger.debug('Cache miss for %s %s "%s".', source, command, query)
+        return None
+
+    @_locked
+    def set(self, source: str, command: str, query: str, raw_result):
+        """Stores a raw response and evicts least recently used entries above the size cap."""
+        if raw_result is None:
+            return
+        query = self.normalize_query(query)
+        payload = json.dumps(raw_result)
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (source, command, query, payload, len(payload), now, now),
+        )
+        self._pending_access.pop((source, command, query), None)
+        self._flush()
+        self._evict()
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache fits into the size cap."""
+        total_size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        evicted = 0
+        for rowid, size in self._connection.execute(
+            "SELECT rowid, size FROM responses ORDER BY last_access ASC"
+        ).fetchall():
+            if total_size <= self.max_size:
+                break
+            self._connection.execute("DELETE FROM responses WHERE rowid = ?", (rowid,))
+            total_size -= size
+            evicted += 1
+        self._connection.commit()
+        logger.info("Evicted %d entries from query cache.", evicted)
+
+    def _count(self, source: str, command: str, hit: bool):
+        hits, misses = self._pending_counts.get((source, command), (0, 0))
+        self._pending_counts[(source, command)] = (
+            (hits + 1, misses) if hit else (hits, misses + 1)
+        )
+        self._pending += 1
+        if (
+            self._pending >= self.FLUSH_PENDING
+            or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL
+        ):
+            self._flush()
+
+    def _flush(self):
+        """Writes buffered access times and statistics and commits the open transaction."""
+        if self._pending_access:
+            self._connection.executemany(
+                "UPDATE responses SET last_access = ? WHERE source = ? AND command = ? AND query = ?",
+                [
+                    (last_access, source, command, query)
+                    for (
+                        source,
+                        command,
+                        query,
+                    ), last_access in self._pending_access.items()
+                ],
+            )
+        if self._pending_counts:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO statistics (source, command) VALUES (?, ?)",
+                list(self._pending_counts),
+            )
+            self._connection.executemany(
+                "UPDATE statistics SET hits = hits + ?, misses = misses + ? WHERE source = ? AND command = ?",
+                [
+                    (hits, misses, source, command)
+                    for (source, command), (
+                        hits,
+                        misses,
+                    ) in self._pending_counts.items()
+                ],
+            )
+        self._connection.commit()
+        self._pending_access.clear()
+        self._pending_counts.clear()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    @_locked
+    def invalidate(self, source: str, command: str, query: str):
+        """Removes a single entry from the cache."""
+        self._connection.execute(
+            "DELETE FROM responses WHERE source = ? AND command = ? AND query = ?",
+            (source, command, self.normalize_query(query)),
+        )
+        self._connection.commit()
+
+    @_locked
+    def clear(self):
+        """Removes all entries and statistics from the cache."""
+        self._pending_access.clear()
+        self._pending_counts.clear()
+        self._pending = 0
+        self._connection.execute("DELETE FROM responses")
+        self._connection.execute("DELETE FROM statistics")
+        self._connection.commit()
+
+    @_locked
+    def stats(self) -> dict:
+        """Returns hit-rate statistics per source and command, plus the current cache size."""
+        self._flush()
+        entries, size = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        per_command = list()
+        total_hits, total_misses = 0, 0
+        for source, command, hits, misses in self._connection.execute(
+            "SELECT source, command, hits, misses FROM statistics ORDER BY source, command"
+        ):
+            total_hits += hits
+            total_misses += misses
+            per_command.append(
+                {
+                    "source": source,
+                    "command": command,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses > 0 else 0.0,
+                }
+            )
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "max_size_bytes": self.max_size,
+            "hits": total_hits,
+            "misses": total_misses,
+            "hit_rate": (
+                total_hits / (total_hits + total_misses)
+                if total_hits + total_misses > 0
+                else 0.0
+            ),
+            "commands": per_command,
+        }
+
+    @_locked
+    def close(self):
+        self._flush()
+        self._connection.close()
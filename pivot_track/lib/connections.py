@@ -0,0 +1,90 @@
+import logging
+import threading
+from typing import List
+
+from pivot_track.lib import utils
+from pivot_track.lib.connectors import SourceConnector, OutputConnector
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionManager:
+    """The `ConnectionManager` class owns all connectors of a Pivot Track process. Connectors are
+    created lazily on first use and are reused afterwards, so that HTTP sessions (and their
+    keep-alive connection pools) survive across queries and tracking cycles."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self._connections = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def connector_configs(self) -> dict:
+        return self.config.get("connectors", dict()) or dict()
+
+    def connection(self, name: str, parent_class=SourceConnector):
+        """Returns the connector configured under `name`, creating it on first use. Returns None for unknown or disabled connectors."""
+        with self._lock:
+            if name in self._connections:
+                connection = self._connections[name]
+                if not isinstance(connection, parent_class):
+                    logger.debug(
+                        'Connector "%s" is not a %s.', name, parent_class.__name__
+                    )
+                    return None
+                return connection
+
+            connector_config = self.connector_configs.get(name)
+            if connector_config is None or not connector_config.get("enabled", True):
+                logger.debug('Connector "%s" is not configured or disabled.', name)
+                return None
+
+            connector = utils.connector_by_config(parent_class, name, connector_config)
+            if connector is None:
+                logger.debug(
+                    'Did not find a %s for connector "%s".', parent_class.__name__, name
+                )
+                return None
+
+            logger.info('Creating connection for connector "%s".', name)
+            connection = connector(connector_config)
+            self._connections[name] = connection
+            return connection
+
+    def source_connection(self, name: str) -> SourceConnector:
+        return self.connection(name, SourceConnector)
+
+    def output_connection(self, name: str) -> OutputConnector:
+        return self.connection(name, OutputConnector)
+
+    def source_connections(self, names: List[str] = None) -> List[SourceConnector]:
+        """Returns connections for the given source names (or for all configured sources, if names is None)."""
+        if names is None:
+            names = self.connector_configs.keys()
+        connections = list()
+        for name in names:
+            connection = self.source_connection(name)
+            if connection is not None:
+                connections.append(connection)
+        return connections
+
+    def output_connections(self, names: List[str] = None) -> List[OutputConnector]:
+        """Returns connections for the given output names (or for all configured outputs, if names is None)."""
+        if names is None:
+            names = self.connector_configs.keys()
+        connections = list()
+        for name in names:
+            connection = self.output_connection(name)
+            if connection is not None:
+                connections.append(connection)
+        return connections
+
+    def close(self):
+        """Closes all open connections."""
+        with self._lock:
+            for name, connection in self._connections.items():
+                close = getattr(connection, "close", None)
+                if callable(close):
+                    logger.debug('Closing connection for connector "%s".', name)
+                    close()
+            self._connections = dict()
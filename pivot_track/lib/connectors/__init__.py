@@ -1,11 +1,80 @@
+import importlib
+
 from .interface import (
     SourceConnector,
     HostQuery,
     OutputConnector,
     NotificationConnector,
+    tracking_output_arguments,
 )
-from .opensearch import OpenSearchConnector
-from .shodan import ShodanSourceConnector
-from .censys import CensysSourceConnector
-from .printer import CLIPrinter, JSONPrinter
-from .file import FileConnector
+from .registry import ConnectorRegistry, connector_registry
+from .resilience import (
+    SourceError,
+    TransientSourceError,
+    RateLimitError,
+    AuthenticationError,
+    CreditsExhaustedError,
+    QueryError,
+    NotFoundError,
+    RetryPolicy,
+    CircuitBreaker,
+)
+from .credentials import CredentialPool, PooledCredential
+
+# Connector implementations are imported on first access. This keeps heavy dependencies (client
+# libraries, rich, Common OSINT Model) out of commands, that do not use the matching connector.
+_LAZY_CONNECTORS = {
+    "OpenSearchConnector": "opensearch",
+    "ShodanSourceConnector": "shodan",
+    "CensysSourceConnector": "censys",
+    "CLIPrinter": "printer",
+    "JSONPrinter": "printer",
+    "FileConnector": "file",
+    "WebhookConnector": "webhook",
+    "BufferedNotificationConnector": "notification",
+    "NotificationGroup": "notification",
+    "FanoutOutputConnector": "fanout",
+    "SQLiteConnector": "sqlite",
+    "ParquetConnector": "parquet",
+}
+
+__all__ = [
+    "SourceConnector",
+    "HostQuery",
+    "OutputConnector",
+    "NotificationConnector",
+    "tracking_output_arguments",
+    "ConnectorRegistry",
+    "connector_registry",
+    "SourceError",
+    "TransientSourceError",
+    "RateLimitError",
+    "AuthenticationError",
+    "CreditsExhaustedError",
+    "QueryError",
+    "NotFoundError",
+    "RetryPolicy",
+    "CircuitBreaker",
+    "CredentialPool",
+    "PooledCredential",
+    # Lazily imported, see `_LAZY_CONNECTORS`
+    "OpenSearchConnector",
+    "ShodanSourceConnector",
+    "CensysSourceConnector",
+    "CLIPrinter",
+    "JSONPrinter",
+    "FileConnector",
+    "WebhookConnector",
+    "BufferedNotificationConnector",
+    "NotificationGroup",
+    "FanoutOutputConnector",
+    "SQLiteConnector",
+    "ParquetConnector",
+]
+
+
+def __getattr__(name: str):
+    if name in _LAZY_CONNECTORS:
+        module = importlib.import_module(f".{_LAZY_CONNECTORS[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,16 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from censys.search import SearchClient
-from censys.common.exceptions import CensysAPIException
-
+from pivot_track.lib import profiling
 from .interface import SourceConnector, HostQuery
+from .resilience import (
+    TransientSourceError,
+    RateLimitError,
+    AuthenticationError,
+    CreditsExhaustedError,
+    QueryError,
+    NotFoundError,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,50 +32,137 @@ class CensysSourceConnector(SourceConnector, HostQuery):
             "result.services.port": {"type": "integer"},
         },
     }
+    # Every search page and host view counts against the quota
+    CREDIT_COSTS = {"generic": 1, "host": 1, "count": 1}
+    HOST_BULK_SIZE = 100
 
     def __init__(self, config):
         logger.debug("Created new instance of class CensysSourceConnector")
         self.config = config  # Set Config data
-        self.censys_client = SearchClient(
-            api_id=self.config["api_id"], api_secret=self.config["api_secret"]
+        # One Censys client per API ID and secret of the pool
+        self._init_credential_pool(keys=("api_id", "api_secret"))
+        self.censys_client = self.credential_pool.credentials[0].client
+        self.session = self.censys_client.v2.hosts._session
+
+    def _create_client(self, credential_config: dict):
+        from censys.search import SearchClient
+
+        # Retries are handled by the connector, so the client library does not retry on its own
+        client = SearchClient(
+            api_id=credential_config["api_id"],
+            api_secret=credential_config["api_secret"],
+            timeout=self.config.get("timeout", 30),
+            max_retries=1,
         )
-        # Set Last Call Timestamp for Throttling
-        self._update_last_call()
+        self._configure_session(client.v2.hosts._session)
+        return client
+
+    def _default_client(self):
+        return getattr(self, "censys_client", None)
+
+    def _account_credits(self, client) -> int:
+        quota = client.v2.hosts.account().get("quota", dict())
+        if quota.get("allowance") is None:
+            return None
+        return max(quota["allowance"] - quota.get("used", 0), 0)
+
+    def close(self):
+        for credential in self.credential_pool.credentials:
+            if credential.client is not None:
+                credential.client.v2.hosts._session.close()
 
     def query_host(self, host: str):
-        logger.info(f'Query host "{host}"')
-
-        self._api_throttle()
-        try:
-            hosts = self.censys_client.v2.hosts
-            query_result = hosts.view(document_id=host)
-            self._update_last_call()
-            return query_result
-        except CensysAPIException as e:
-            logger.error(
-                f'CensysAPIException while querying for host "{host}". Message {e}'
+        logger.info('Query host "%s"', host)
+        return self._request(
+            "host",
+            lambda client: client.v2.hosts.view(document_id=host),
+            f'Censys query for host "{host}"',
+        )
+
+    def query_hosts(self, hosts: list) -> dict:
+        """Views several hosts concurrently (`bulk_workers`, default 4). Every view goes through the throttle, retries
+        and circuit breaker of the connector (unlike `bulk_view` of the client library, which uses its own threads).
+        Hosts, that Censys does not know or that failed, are left out."""
+        logger.info("Query %d hosts", len(hosts))
+        workers = max(min(self.config.get("bulk_workers", 4), len(hosts)), 1)
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pivottrack-censys"
+        ) as executor:
+            raw_results = dict(
+                zip(hosts, executor.map(profiling.propagate(self.query_host), hosts))
             )
-            return None
+        return {
+            host: raw_result
+            for host, raw_result in raw_results.items()
+            if raw_result is not None and "error" not in raw_result
+        }
 
     def query_host_search(self, query: str):
-        logger.info(f'Query for hosts with query "{query}"')
-
-        self._api_throttle()
-        try:
-            hosts = self.censys_client.v2.hosts
-            query_result = hosts.search(query=query)()
-            self._update_last_call()
-            return query_result
-        except CensysAPIException as e:
-            logger.error(
-                f'CensysAPIException while searching for hosts with query "{query}". Message {e}'
+        logger.info('Query for hosts with query "%s"', query)
+        return self._request(
+            "generic",
+            lambda client: client.v2.hosts.search(query=query)(),
+            f'Censys search for hosts with query "{query}"',
+        )
+
+    def query_host_count(self, query: str) -> int:
+        logger.info('Query host count with query "%s"', query)
+        result = self._request(
+            "count",
+            # The smallest possible aggregation, only its total is used
+            lambda client: client.v2.hosts.aggregate(
+                query, field="services.port", num_buckets=1
+            ),
+            f'Censys aggregation for hosts with query "{query}"',
+        )
+        return result.get("total") if result is not None else None
+
+    def _classify_error(self, exception: Exception):
+        from censys.common.exceptions import (
+            CensysAPIException,
+            CensysRateLimitExceededException,
+            CensysTooManyRequestsException,
+            CensysSearchAPITimeoutException,
+            CensysUnauthorizedException,
+            CensysNotFoundException,
+        )
+
+        if not isinstance(exception, CensysAPIException):
+            return super()._classify_error(exception)
+        if "quota" in str(exception).lower():
+            return CreditsExhaustedError(str(exception))
+        if (
+            isinstance(
+                exception,
+                (CensysRateLimitExceededException, CensysTooManyRequestsException),
             )
-            return None
+            or exception.status_code == 429
+        ):
+            return RateLimitError(str(exception))
+        if (
+            isinstance(exception, CensysSearchAPITimeoutException)
+            or exception.status_code in (408, 502, 503, 504)
+            or (exception.status_code or 0) >= 500
+        ):
+            return TransientSourceError(str(exception))
+        if isinstance(
+            exception, CensysUnauthorizedException
+        ) or exception.status_code in (
+            401,
+            403,
+        ):
+            return AuthenticationError(str(exception))
+        if (
+            isinstance(exception, CensysNotFoundException)
+            or exception.status_code == 404
+        ):
+            return NotFoundError(str(exception))
+        return QueryError(str(exception))
 
     def _api_throttle(self):
         logger.debug('Call "_api_throttle()" in parent class')
-        super()._api_throttle()
+        return super()._api_throttle()
 
-    def _update_last_call(self):
+    def _update_last_call(self, credential=None, credits_used: int = 0):
         logger.debug('Call "_update_last_call()" in parent class')
-        super()._update_last_call()
+        super()._update_last_call(credential, credits_used)
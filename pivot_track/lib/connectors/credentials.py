@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from typing import List
+
+from pivot_track.lib import metrics
+
+logger = logging.getLogger(__name__)
+
+CREDENTIAL_REMAINING_CREDITS = metrics.registry.gauge(
+    "pivottrack_source_credential_remaining_credits",
+    "Remaining API credits per credential of a source (if known).",
+    ["source", "credential"],
+)
+CREDENTIALS_AVAILABLE = metrics.registry.gauge(
+    "pivottrack_source_credentials_available",
+    "Credentials of a source, that are currently in rotation.",
+    ["source"],
+)
+
+
+class PooledCredential:
+    """A `PooledCredential` holds one set of API credentials of a source, together with its client,
+    its rate limit and its remaining credits. Credentials are identified by their name in logs and
+    metrics, never by the secret itself."""
+
+    def __init__(
+        self,
+        name: str,
+        client=None,
+        rate_limit: float = None,
+        remaining_credits: int = None,
+    ):
+        self.name = name
+        self.client = client
+        # Default to 1 request per second, like the single-key connectors always did
+        self.rate_limit = rate_limit if rate_limit else 1
+        self.remaining_credits = remaining_credits
+        self.next_call = 0.0
+        self.disabled_until = 0.0
+        self.disabled_reason = None
+        self.calls = 0
+
+    @property
+    def interval(self) -> float:
+        return 1 / self.rate_limit
+
+    def usable(self, now: float) -> bool:
+        # Exhausted credentials are tried again after their cooldown, credits might have been reset
+        return self.disabled_until <= now and (
+            self.remaining_credits is None
+            or self.remaining_credits > 0
+            or self.disabled_reason == "exhausted"
+        )
+
+
+class CredentialPool:
+    """The `CredentialPool` class spreads the API calls of a source across several credentials. Every
+    call reserves a slot at the credential, that is ready first, so that the per-credential rate limits
+    hold even for concurrent callers. Exhausted or failing credentials are taken out of rotation for
+    a cooldown period."""
+
+    def __init__(
+        self,
+        source: str,
+        credentials: List[PooledCredential],
+        cooldown: float = 3600.0,
+    ):
+        self.source = source
+        self.credentials = list(credentials)
+        self.cooldown = cooldown
+        self.credits_used = 0
+        self._lock = threading.Lock()
+        self._update_available()
+
+    def _update_available(self):
+        now = time.monotonic()
+        CREDENTIALS_AVAILABLE.set(
+            sum(1 for credential in self.credentials if credential.usable(now)),
+            source=self.source,
+        )
+
+    def available(self) -> List[PooledCredential]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                credential for credential in self.credentials if credential.usable(now)
+            ]
+
+    @property
+    def remaining_credits(self) -> int:
+        """Returns the sum of the remaining credits of all usable credentials, or None if unknown."""
+        credits = [credential.remaining_credits for credential in self.available()]
+        if not credits or any(credit is None for credit in credits):
+            return None
+        return sum(credits)
+
+    def rate_limited_for(self) -> float:
+        """Returns the seconds until the first rate limited credential is back in rotation, or None if no
+        credential is rate limited."""
+        now = time.monotonic()
+        with self._lock:
+            waits = [
+                max(credential.disabled_until - now, 0.0)
+                for credential in self.credentials
+                if credential.disabled_reason == "rate limited"
+                and credential.disabled_until > now
+            ]
+        return min(waits) if waits else None
+
+    def reserve(self) -> tuple[PooledCredential, float]:
+        """Reserves the next call slot and returns the credential and the seconds to wait for it. Returns (None, 0) if no credential is usable."""
+        with self._lock:
+            now = time.monotonic()
+            usable = [
+                credential for credential in self.credentials if credential.usable(now)
+            ]
+            if not usable:
+                return None, 0.0
+            credential = min(
+                usable, key=lambda credential: (credential.next_call, credential.calls)
+            )
+            start = max(now, credential.next_call)
+            credential.next_call = start + credential.interval
+            credential.calls += 1
+            return credential, start - now
+
+    def release(self, credential: PooledCredential, credits_used: int = 0):
+        """Records the end of a call: the rate limit interval starts again and used credits are subtracted."""
+        with self._lock:
+            credential.next_call = max(
+                credential.next_call, time.monotonic() + credential.interval
+            )
+            self.credits_used += credits_used
+            if credits_used and credential.remaining_credits is not None:
+                credential.remaining_credits = max(
+                    credential.remaining_credits - credits_used, 0
+                )
+                CREDENTIAL_REMAINING_CREDITS.set(
+                    credential.remaining_credits,
+                    source=self.source,
+                    credential=credential.name,
+                )
+                if credential.remaining_credits == 0:
+                    credential.disabled_until = time.monotonic() + self.cooldown
+                    credential.disabled_reason = "exhausted"
+                    logger.warning(
+                        'Credential "%s" of source "%s" has no credits left.',
+                        credential.name,
+                        self.source,
+                    )
+            self._update_available()
+
+    def set_remaining_credits(self, credential: PooledCredential, credits: int):
+        with self._lock:
+            credential.remaining_credits = credits
+            if credits is not None:
+                CREDENTIAL_REMAINING_CREDITS.set(
+                    credits, source=self.source, credential=credential.name
+                )
+                if credits > 0 and credential.disabled_reason == "exhausted":
+                    credential.disabled_until = 0.0
+                    credential.disabled_reason = None
+            self._update_available()
+
+    def take_out(
+        self, credential: PooledCredential, reason: str, seconds: float = None
+    ):
+        """Takes a credential out of rotation for the given seconds (or the cooldown of the pool)."""
+        seconds = self.cooldown if seconds is None else seconds
+        with self._lock:
+            credential.disabled_until = time.monotonic() + seconds
+            credential.disabled_reason = reason
+            if reason == "exhausted":
+                credential.remaining_credits = 0
+            self._update_available()
+        logger.warning(
+            'Took credential "%s" of source "%s" out of rotation for %s seconds (%s).',
+            credential.name,
+            self.source,
+            seconds,
+            reason,
+        )
+
+
+def credential_configs(config: dict, keys: tuple) -> List[dict]:
+    """Returns the credential configurations of a connector configuration. Credentials are either
+    configured as list under `credentials`, or directly in the connector configuration (a pool of one)."""
+    credentials = config.get("credentials")
+    if not credentials:
+        credentials = [{key: config.get(key) for key in keys}]
+    configs = list()
+    for index, credential in enumerate(credentials):
+        configs.append(
+            {
+                "name": str(credential.get("name", index)),
+                "rate_limit": credential.get("rate_limit", config.get("rate_limit")),
+                **{key: credential.get(key) for key in keys},
+            }
+        )
+    return configs
@@ -0,0 +1,188 @@
+import contextvars
+import logging
+import queue
+import threading
+from typing import List
+
+from pivot_track.lib import metrics, profiling
+from .interface import OutputConnector, tracking_output_arguments
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_QUEUE_DEPTH = metrics.registry.gauge(
+    "pivottrack_output_queue_depth",
+    "Batches waiting in the queue of an output sink.",
+    ["sink"],
+)
+OUTPUT_BATCHES = metrics.registry.counter(
+    "pivottrack_output_batches_total",
+    "Batches handed to output sinks by the fan-out layer, by status (ok, error, dropped).",
+    ["sink", "operation", "status"],
+)
+OUTPUT_SECONDS = metrics.registry.histogram(
+    "pivottrack_output_seconds",
+    "Time spent by output sinks on one batch.",
+    ["sink", "operation"],
+)
+
+_STOP = object()
+
+
+class OutputSink:
+    """An `OutputSink` wraps one output connector of the fan-out layer with its own queue and worker
+    thread, so that a slow or failing connector does not hold back the others."""
+
+    def __init__(
+        self,
+        name: str,
+        connection: OutputConnector,
+        queue_size: int = 100,
+        put_timeout: float = 30.0,
+    ):
+        self.name = name
+        self.connection = connection
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._thread = threading.Thread(
+            target=self._work, name=f"pivottrack-output-{name}", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, operation: str, *args, **kwargs) -> bool:
+        """Queues a call of the connector. If the queue stays full for `put_timeout` seconds, the batch is
+        dropped for this sink (and only for this sink). Returns if the batch was queued."""
+        try:
+            # The call runs in the context of the caller, with its profiler span and log correlation
+            self.queue.put(
+                (contextvars.copy_context(), operation, args, kwargs),
+                timeout=self.put_timeout,
+            )
+        except queue.Full:
+            self.dropped += 1
+            OUTPUT_BATCHES.inc(sink=self.name, operation=operation, status="dropped")
+            logger.error(
+                'Output queue of sink "%s" is full. Dropping %s batch.',
+                self.name,
+                operation,
+            )
+            return False
+        OUTPUT_QUEUE_DEPTH.set(self.queue.qsize(), sink=self.name)
+        return True
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                context, operation, args, kwargs = item
+                context.run(self.call, operation, *args, **kwargs)
+            finally:
+                self.queue.task_done()
+                OUTPUT_QUEUE_DEPTH.set(self.queue.qsize(), sink=self.name)
+
+    def call(self, operation: str, *args, **kwargs):
+        """Calls the connector directly. Errors are logged and counted, not raised."""
+        try:
+            with OUTPUT_SECONDS.time(sink=self.name, operation=operation):
+                result = getattr(self.connection, operation)(*args, **kwargs)
+            OUTPUT_BATCHES.inc(sink=self.name, operation=operation, status="ok")
+            return result
+        except Exception as e:
+            OUTPUT_BATCHES.inc(sink=self.name, operation=operation, status="error")
+            logger.error('Output sink "%s" failed on %s: %s', self.name, operation, e)
+            logger.debug("Output sink exception:", exc_info=True)
+            return None
+
+    def join(self):
+        self.queue.join()
+
+    def stop(self):
+        self.queue.put(_STOP)
+        self._thread.join()
+
+
+class FanoutOutputConnector(OutputConnector):
+    """The `FanoutOutputConnector` class sends every batch of results to several output connectors
+    concurrently. Every connector gets its own queue and worker thread. The first connector is the
+    primary one: its tracking output runs in the calling thread and decides, which elements are new
+    (like a single output connector does). Connectors without tracking output only get query output."""
+
+    def __init__(
+        self,
+        connections: dict,
+        queue_size: int = 100,
+        put_timeout: float = 30.0,
+    ):
+        if not connections:
+            raise ValueError(
+                "FanoutOutputConnector needs at least one output connector."
+            )
+        names = list(connections.keys())
+        self.primary_name = names[0]
+        self.primary = OutputSink(
+            self.primary_name, connections[self.primary_name], queue_size, put_timeout
+        )
+        self.sinks = [
+            OutputSink(name, connections[name], queue_size, put_timeout)
+            for name in names[1:]
+        ]
+
+    @classmethod
+    def from_config(cls, config: dict, connections: dict) -> "FanoutOutputConnector":
+        """Returns a `FanoutOutputConnector` for the given connections (name to connector), with the queue
+        settings of the `outputs` section of the configuration."""
+        outputs_config = (config or dict()).get("outputs") or dict()
+        return cls(
+            connections,
+            queue_size=outputs_config.get("queue_size", 100),
+            put_timeout=outputs_config.get("put_timeout", 30.0),
+        )
+
+    @property
+    def connections(self) -> List[OutputConnector]:
+        return [self.primary.connection] + [sink.connection for sink in self.sinks]
+
+    @property
+    def available(self) -> bool:
+        return getattr(self.primary.connection, "available", True)
+
+    def query_output(self, query_result, raw=False):
+        for sink in [self.primary] + self.sinks:
+            sink.submit("query_output", query_result=query_result, raw=raw)
+
+    def tracking_output(self, query_result, definition, known: set = None):
+        for sink in self.sinks:
+            if hasattr(sink.connection, "tracking_output"):
+                sink.submit(
+                    "tracking_output",
+                    **tracking_output_arguments(
+                        sink.connection, query_result, definition, known
+                    ),
+                )
+        # Query outputs of the primary connector are queued, so they are written first
+        self.primary.join()
+        with profiling.span("tracking_output_primary", sink=self.primary_name):
+            new_elements = self.primary.call(
+                "tracking_output",
+                **tracking_output_arguments(
+                    self.primary.connection, query_result, definition, known
+                ),
+            )
+        return new_elements if new_elements is not None else list()
+
+    def query_result_to_com_list(self, query_result) -> list:
+        return super().query_result_to_com_list(query_result)
+
+    def flush(self):
+        """Waits, until all queued batches are written by all connectors, and flushes the connectors."""
+        for sink in [self.primary] + self.sinks:
+            sink.join()
+            if callable(getattr(sink.connection, "flush", None)):
+                sink.call("flush")
+
+    def close(self):
+        self.flush()
+        for sink in [self.primary] + self.sinks:
+            sink.stop()
@@ -1,52 +1,88 @@
+import os
 from pathlib import Path
-from typing import List, Union
+from typing import List
 
-from common_osint_model import Host, Domain
-from pivot_track.lib.connectors import NotificationConnector
-from pivot_track.lib.track import TrackingDefinition
+from pivot_track.lib.connectors.notification import (
+    BufferedNotificationConnector,
+    Notification,
+    render_text,
+)
 
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class FileConnector(NotificationConnector):
+class FileConnector(BufferedNotificationConnector):
+    """The `FileConnector` class appends notifications to a findings file. Notifications are buffered and
+    written in batches (or as digest per tracking cycle). With `max_bytes`, the file is rotated like log
+    files (findings.txt.1, findings.txt.2, ...), keeping `backup_count` old files."""
+
     file_path: Path = None
 
-    def __init__(self, file_path: Path) -> None:
+    def __init__(
+        self,
+        file_path: Path,
+        batch_size: int = 500,
+        digest: bool = False,
+        dedup_window: float = 0,
+        max_bytes: int = None,
+        backup_count: int = 5,
+    ) -> None:
+        super().__init__(
+            batch_size=batch_size, digest=digest, dedup_window=dedup_window
+        )
         if file_path.exists and file_path.is_file:
             self.file_path = file_path
         else:
             raise FileNotFoundError
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
 
-    def _com_to_strings(self, notify_items: List[Union[Host, Domain]]) -> list:
-        """This function transfers a set of Common OSINT Model items to a list of identifiable strings (hostnames and IPs for now)."""
-        notify_strings = list()
-        for element in notify_items:
-            if isinstance(element, Host):
-                notify_strings.append(element.ip)
-            elif isinstance(element, Domain):
-                notify_strings.append(element.domain)
-        return notify_strings
-
-    def notify(
-        self,
-        definition: TrackingDefinition = None,
-        notify_items: List[Union[Host, Domain]] = None,
-    ):
-        logger.debug(
-            f'Got {len(notify_items)} for last run of  "{str(definition.uuid)}".'
+    @classmethod
+    def from_config(cls, config: dict) -> "FileConnector":
+        """Returns a `FileConnector` for the `tracking_file` of the configuration, with the options of the
+        `notifications` section (and its `file` subsection). Returns None, if there is no tracking file."""
+        config = config or dict()
+        if config.get("tracking_file") is None:
+            return None
+        notification_config = config.get("notifications") or dict()
+        file_config = notification_config.get("file") or dict()
+        return cls(
+            Path(config.get("tracking_file")),
+            batch_size=notification_config.get("batch_size", 500),
+            digest=notification_config.get("digest", False),
+            dedup_window=notification_config.get("dedup_window", 0),
+            max_bytes=file_config.get("max_bytes"),
+            backup_count=file_config.get("backup_count", 5),
         )
-        notification = "🚨🚨🚨 New Tracking Results"
-        if definition is not None:
-            notification += f' for "{definition.title}" ({str(definition.uuid)}):\n'
-        if notify_items is not None and len(notify_items) > 0:
-            logger.info(f"Appending notification for {len(notify_items)} items.")
-            notification += f"{'\n'.join([notify_string for notify_string in self._com_to_strings(notify_items)])}"
+
+    def _rotation_path(self, index: int) -> Path:
+        return self.file_path.with_name(f"{self.file_path.name}.{index}")
+
+    def _rotate(self, incoming_bytes: int):
+        if not self.max_bytes or not self.file_path.exists():
+            return
+        if self.file_path.stat().st_size + incoming_bytes <= self.max_bytes:
+            return
+        logger.info("Rotating notification output %s.", self.file_path.as_posix())
+        if self.backup_count <= 0:
+            self.file_path.unlink()
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            if self._rotation_path(index).exists():
+                os.replace(self._rotation_path(index), self._rotation_path(index + 1))
+        os.replace(self.file_path, self._rotation_path(1))
+
+    def deliver(self, notifications: List[Notification]):
+        logger.info("Appending notification for %d items.", len(notifications))
+        data = f"{render_text(notifications, digest=self.digest)}\n\n".encode("utf-8")
+        self._rotate(len(data))
         try:
-            with open(self.file_path, "a") as out_file:
-                out_file.write(f"{notification}\n\n")
+            with open(self.file_path, "ab") as out_file:
+                out_file.write(data)
         except FileNotFoundError:
             logger.error(
-                f"Could not write to notification output: {self.file_path.absolute().as_posix()}"
+                "Could not write to notification output: %s",
+                self.file_path.absolute().as_posix(),
             )
@@ -1,47 +1,362 @@
+import inspect
 import logging
 import time
 
 from abc import ABC, abstractmethod
-from typing import List, Union
-from datetime import datetime
+from typing import List, Union, TYPE_CHECKING
 
-from common_osint_model import Host, Domain
+from pivot_track.lib import metrics
+from .resilience import (
+    SourceError,
+    TransientSourceError,
+    RateLimitError,
+    CreditsExhaustedError,
+    NotFoundError,
+    CircuitBreaker,
+    RetryPolicy,
+)
+from .credentials import CredentialPool, PooledCredential, credential_configs
+
+if TYPE_CHECKING:
+    from common_osint_model import Host, Domain
+    from pivot_track.lib.fingerprint import HostChange
 
 logger = logging.getLogger(__name__)
 
+API_THROTTLE_SECONDS = metrics.registry.histogram(
+    "pivottrack_api_throttle_seconds",
+    "Time spent waiting for the API rate limit of a source.",
+    ["source"],
+)
+SOURCE_REQUEST_SECONDS = metrics.registry.histogram(
+    "pivottrack_source_request_seconds",
+    "Latency of source API requests.",
+    ["source", "command"],
+)
+SOURCE_REQUESTS = metrics.registry.counter(
+    "pivottrack_source_requests_total",
+    "Source API requests by status.",
+    ["source", "command", "status"],
+)
+SOURCE_CIRCUIT_STATE = metrics.registry.gauge(
+    "pivottrack_source_circuit_state",
+    "State of the circuit breaker per source (0 closed, 1 half open, 2 open).",
+    ["source"],
+)
+CIRCUIT_STATE_VALUES = {
+    CircuitBreaker.CLOSED: 0,
+    CircuitBreaker.HALF_OPEN: 1,
+    CircuitBreaker.OPEN: 2,
+}
+
 
 class SourceConnector(ABC):
     """Abstract class, providing shared connector capabilities"""
 
     OPENSEARCH_FIELD_PROPERTIES = None
+    # API credits per call of a command, used for credit tracking and budget planning
+    CREDIT_COSTS = dict()
 
     @abstractmethod
-    def _api_throttle(self):
-        """Function to throttle API consumption (through waiting)."""
+    def _api_throttle(self) -> PooledCredential:
+        """Function to throttle API consumption (through waiting). Returns the credential of the pool, that
+        may be used for the next call, or None if no credential is usable."""
         logger.debug("Throttle API consumption.")
-        # Get current timestamp
-        current_timestamp = int(round(datetime.now().timestamp()) * 1000)
-        # Default to 1 Sec Rate Limit if not set
-        rate_limit = (
-            self.config["rate_limit"] if self.config["rate_limit"] is not None else 1
-        )
-        # Calcuate time between calls
-        time_between_calls = int(round((1000 / rate_limit)))
-        # Calc Time to Wait
-        time_to_wait = (
-            (self.last_call + time_between_calls) - current_timestamp
-        ) / 1000
-        # Wait
+        credential, time_to_wait = self.credential_pool.reserve()
         if time_to_wait > 0:
-            logger.debug(f"Throttle API consumption. Wait {time_to_wait} Seconds.")
+            logger.debug("Throttle API consumption. Wait %s Seconds.", time_to_wait)
             time.sleep(time_to_wait)
+        API_THROTTLE_SECONDS.observe(time_to_wait, source=self.short_name)
+        return credential
 
     @abstractmethod
-    def _update_last_call(self):
-        """Function for updating last_call variable for API consumption throttling."""
+    def _update_last_call(
+        self, credential: PooledCredential = None, credits_used: int = 0
+    ):
+        """Function for updating the last call of a credential for API consumption throttling."""
 
         logger.debug("Update last_call timestamp for API consumption throttling")
-        self.last_call = int(round(datetime.now().timestamp()) * 1000)
+        if credential is not None:
+            self.credential_pool.release(credential, credits_used)
+
+    def _create_client(self, credential_config: dict):
+        """Function to create a client of the source library for one credential."""
+        return None
+
+    def _init_credential_pool(self, keys: tuple) -> CredentialPool:
+        """Function to create the credential pool (and one client per credential) from the connector configuration."""
+        credentials = list()
+        for credential_config in credential_configs(self.config, keys):
+            credentials.append(
+                PooledCredential(
+                    name=credential_config["name"],
+                    client=self._create_client(credential_config),
+                    rate_limit=credential_config["rate_limit"],
+                )
+            )
+        logger.debug(
+            'Created credential pool with %d credential(s) for source "%s".',
+            len(credentials),
+            self.short_name,
+        )
+        self._credential_pool = CredentialPool(
+            self.short_name,
+            credentials,
+            cooldown=self.config.get("credential_cooldown", 3600),
+        )
+        return self._credential_pool
+
+    @property
+    def credential_pool(self) -> CredentialPool:
+        if getattr(self, "_credential_pool", None) is None:
+            # Connectors without a pool (e.g. created without configuration) get a pool of one
+            config = getattr(self, "config", None) or dict()
+            self._credential_pool = CredentialPool(
+                self.short_name,
+                [
+                    PooledCredential(
+                        "0", self._default_client(), config.get("rate_limit")
+                    )
+                ],
+            )
+        return self._credential_pool
+
+    def _default_client(self):
+        return None
+
+    def _credit_cost(self, command: str) -> int:
+        """Function returning the API credits, that one call of the command costs."""
+        return self.CREDIT_COSTS.get(command, 0)
+
+    def _account_credits(self, client) -> int:
+        """Function to request the remaining credits of one credential from the account endpoint of the source."""
+        return None
+
+    def refresh_credits(self) -> int:
+        """Function to refresh the remaining credits of all credentials. Returns the sum, or None if unknown."""
+        for credential in self.credential_pool.credentials:
+            if credential.client is None:
+                continue
+            try:
+                credits = self._account_credits(credential.client)
+            except Exception as e:
+                error = self._classify_error(e)
+                if error is None:
+                    raise
+                logger.error(
+                    'Could not request credits of credential "%s" for source "%s". Message %s',
+                    credential.name,
+                    self.short_name,
+                    e,
+                )
+                continue
+            self.credential_pool.set_remaining_credits(credential, credits)
+        return self.credential_pool.remaining_credits
+
+    def _configure_session(self, session):
+        """Function to configure the (keep-alive) HTTP session of a client library with the connection pool size,
+        compression settings, a default timeout per call and a hook for rate limit hints."""
+        from requests.adapters import HTTPAdapter
+
+        timeout = self.config.get("timeout", 30)
+
+        class TimeoutHTTPAdapter(HTTPAdapter):
+            def send(self, request, **kwargs):
+                if kwargs.get("timeout") is None:
+                    kwargs["timeout"] = timeout
+                return super().send(request, **kwargs)
+
+        pool_maxsize = self.config.get("pool_maxsize", 10)
+        logger.debug("Configure HTTP session with pool size %d.", pool_maxsize)
+        adapter = TimeoutHTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not self.config.get("http_compress", True):
+            session.headers["Accept-Encoding"] = "identity"
+        session.hooks["response"].append(self._record_rate_limit_hint)
+        return session
+
+    def _record_rate_limit_hint(self, response, *args, **kwargs):
+        """Response hook, that keeps the Retry-After hint of rate limited (or unavailable) responses."""
+        retry_after = response.headers.get("Retry-After")
+        if response.status_code in (429, 503) and retry_after is not None:
+            try:
+                self._retry_after = float(retry_after)
+            except ValueError:
+                logger.debug("Ignoring Retry-After header %s.", retry_after)
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        if getattr(self, "_retry_policy", None) is None:
+            self._retry_policy = RetryPolicy.from_config(getattr(self, "config", None))
+        return self._retry_policy
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        if getattr(self, "_circuit_breaker", None) is None:
+            source = self.short_name
+            self._circuit_breaker = CircuitBreaker.from_config(
+                source,
+                getattr(self, "config", None),
+                on_state_change=lambda state: SOURCE_CIRCUIT_STATE.set(
+                    CIRCUIT_STATE_VALUES[state], source=source
+                ),
+            )
+            SOURCE_CIRCUIT_STATE.set(0, source=source)
+        return self._circuit_breaker
+
+    @property
+    def circuit_state(self) -> str:
+        return self.circuit_breaker.state
+
+    def _classify_error(self, exception: Exception) -> SourceError:
+        """Function to map exceptions of a client library to classified `SourceError`s. Returns None for unknown exceptions, which are not handled."""
+        from requests.exceptions import RequestException
+
+        if isinstance(exception, SourceError):
+            return exception
+        if isinstance(exception, RequestException):
+            return TransientSourceError(str(exception))
+        return None
+
+    def _request(
+        self,
+        command: str,
+        call,
+        description: str,
+        cost: int = None,
+        not_found=None,
+    ):
+        """Function to execute an API call with throttling, retries with backoff and the circuit breaker of the source.
+        `call` gets the client of the pooled credential, that is used for the attempt. `cost` overrides the credits of
+        the command (e.g. for bulk calls). Returns None, if the call failed or was skipped, and `not_found` (if given),
+        if the source does not know the requested object."""
+        source = self.short_name
+        breaker = self.circuit_breaker
+        policy = self.retry_policy
+        if not breaker.allow():
+            SOURCE_REQUESTS.inc(source=source, command=command, status="circuit_open")
+            logger.warning(
+                'Skipping %s, because the circuit breaker for source "%s" is open.',
+                description,
+                source,
+            )
+            return None
+
+        for attempt in range(policy.max_attempts):
+            credential = self._api_throttle()
+            rate_limited = None
+            if credential is None:
+                rate_limited = self.credential_pool.rate_limited_for()
+                if rate_limited is not None and rate_limited <= policy.backoff_max:
+                    # All credentials are rate limited, wait for the first one to come back
+                    logger.debug(
+                        'Credentials of source "%s" are rate limited. Wait %.1f seconds.',
+                        source,
+                        rate_limited,
+                    )
+                    time.sleep(rate_limited)
+                    credential = self._api_throttle()
+            if credential is None:
+                SOURCE_REQUESTS.inc(
+                    source=source, command=command, status="no_credentials"
+                )
+                logger.error(
+                    'Skipping %s, because no credential of source "%s" is usable.',
+                    description,
+                    source,
+                )
+                if rate_limited is None:
+                    breaker.record_failure()
+                return None
+            self._retry_after = None
+            try:
+                with SOURCE_REQUEST_SECONDS.time(source=source, command=command):
+                    result = call(credential.client)
+                self._update_last_call(
+                    credential, self._credit_cost(command) if cost is None else cost
+                )
+                breaker.record_success()
+                SOURCE_REQUESTS.inc(source=source, command=command, status="ok")
+                return result
+            except Exception as e:
+                self._update_last_call(credential)
+                error = self._classify_error(e)
+                if error is None:
+                    raise
+                if isinstance(error, RateLimitError) and error.retry_after is None:
+                    error.retry_after = getattr(self, "_retry_after", None)
+                SOURCE_REQUESTS.inc(
+                    source=source, command=command, status=error.__class__.__name__
+                )
+                rotated = False
+                # A rate limited credential stays in rotation, if it is the only usable one. The retry
+                # backs off instead, taking it out would just skip the call.
+                if error.rotates_credential and (
+                    not isinstance(error, RateLimitError)
+                    or self._other_credentials(credential)
+                ):
+                    self._take_out_credential(credential, error)
+                    # Another credential can take over right away
+                    rotated = len(self.credential_pool.available()) > 0
+                if (
+                    not (error.retryable or rotated)
+                    or attempt + 1 >= policy.max_attempts
+                ):
+                    if error.trips_breaker:
+                        breaker.record_failure()
+                    else:
+                        # The source answered, it just rejected this specific call
+                        breaker.record_success()
+                    if isinstance(error, NotFoundError) and not_found is not None:
+                        logger.info("No results for %s. Message %s", description, e)
+                        return not_found
+                    logger.error(
+                        "%s for %s (attempt %d of %d). Message %s",
+                        error.__class__.__name__,
+                        description,
+                        attempt + 1,
+                        policy.max_attempts,
+                        e,
+                    )
+                    return None
+                delay = 0.0 if rotated else policy.delay(attempt, error.retry_after)
+                logger.warning(
+                    "%s for %s (attempt %d of %d). Retrying in %.1f seconds. Message %s",
+                    error.__class__.__name__,
+                    description,
+                    attempt + 1,
+                    policy.max_attempts,
+                    delay,
+                    e,
+                )
+                time.sleep(delay)
+
+    def _other_credentials(self, credential: PooledCredential) -> bool:
+        """Returns if another credential than the given one is usable."""
+        return any(
+            other is not credential for other in self.credential_pool.available()
+        )
+
+    def _take_out_credential(self, credential: PooledCredential, error: SourceError):
+        if isinstance(error, CreditsExhaustedError):
+            self.credential_pool.take_out(credential, "exhausted")
+        elif isinstance(error, RateLimitError):
+            self.credential_pool.take_out(
+                credential,
+                "rate limited",
+                error.retry_after
+                if error.retry_after is not None
+                else self.retry_policy.delay(0),
+            )
+        else:
+            self.credential_pool.take_out(credential, error.__class__.__name__)
+
+    def close(self):
+        """Function to close the HTTP session of the connector."""
+        session = getattr(self, "session", None)
+        if session is not None:
+            session.close()
 
     @property
     def short_name(self):
@@ -51,6 +366,9 @@ class SourceConnector(ABC):
 class HostQuery(ABC):
     """This class represents a interface for requesting host information at a source."""
 
+    # Maximum number of hosts per call of `query_hosts` (1 for sources without a bulk endpoint)
+    HOST_BULK_SIZE = 1
+
     @abstractmethod
     def query_host_search(self, query: str):
         """Abstract function for performing a query for a host search."""
@@ -61,6 +379,44 @@ class HostQuery(ABC):
         """Abstract function for performing a query for a specific host."""
         raise NotImplementedError
 
+    def query_host_count(self, query: str) -> int:
+        """Function for requesting only the total number of hosts of a host search (e.g. for cheap pre-checks).
+        Returns None, if the source does not support it or the call failed."""
+        return None
+
+    def query_hosts(self, hosts: List[str]) -> dict:
+        """Function for requesting several hosts with one call of a bulk endpoint (at most `HOST_BULK_SIZE` hosts).
+        Returns a dictionary of host to result (hosts without information are missing), or None if the source does
+        not support it or the call failed."""
+        return None
+
+
+def tracking_output_arguments(
+    connection, query_result, definition, known: set = None
+) -> dict:
+    """Returns the keyword arguments for the `tracking_output` of a connector. `known` is only passed to
+    connectors, that accept it (connectors written before it was added do not)."""
+    arguments = {"query_result": query_result, "definition": definition}
+    if known is not None and _accepts_known(type(connection)):
+        arguments["known"] = known
+    return arguments
+
+
+_ACCEPTS_KNOWN = dict()
+
+
+def _accepts_known(connector_class) -> bool:
+    if connector_class not in _ACCEPTS_KNOWN:
+        try:
+            parameters = inspect.signature(connector_class.tracking_output).parameters
+        except (AttributeError, TypeError, ValueError):
+            parameters = dict()
+        _ACCEPTS_KNOWN[connector_class] = "known" in parameters or any(
+            parameter.kind is inspect.Parameter.VAR_KEYWORD
+            for parameter in parameters.values()
+        )
+    return _ACCEPTS_KNOWN[connector_class]
+
 
 class OutputConnector(ABC):
     """This class represents a parent class for implementing certain types of outputs.
@@ -75,7 +431,8 @@ class OutputConnector(ABC):
         result = list()
         if isinstance(query_result, list):
             logger.debug(
-                f"List of QueryResult elements identified. Length is {len(query_result)}"
+                "List of QueryResult elements identified. Length is %d",
+                len(query_result),
             )
 
             for query_result_element in query_result:
@@ -95,5 +452,24 @@ class OutputConnector(ABC):
 
 class NotificationConnector(ABC):
     @abstractmethod
-    def notify(definition=None, notify_items: List[Union[Host, Domain]] = None):
+    def notify(definition=None, notify_items: List[Union["Host", "Domain"]] = None):
         raise NotImplementedError
+
+    def notify_removed(
+        self, definition=None, removed_items: List[Union["Host", "Domain"]] = None
+    ):
+        """Called with the elements, that are gone from the results of a definition since the last cycle.
+        Connectors, that do not report removals, can keep this default."""
+        pass
+
+    def notify_changed(self, definition=None, changed_items: List["HostChange"] = None):
+        """Called with the tracked hosts, whose fingerprint changed since the last cycle (if the definition
+        opted in with `notify_changes`). Connectors, that do not report changes, can keep this default."""
+        pass
+
+    def flush(self):
+        """Called at the end of every tracking cycle. Connectors, that buffer notifications, deliver them here."""
+        pass
+
+    def close(self):
+        pass
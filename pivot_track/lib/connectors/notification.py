@@ -0,0 +1,260 @@
+import logging
+import threading
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Union, TYPE_CHECKING
+
+from pivot_track.lib import metrics, profiling
+from .interface import NotificationConnector
+
+if TYPE_CHECKING:
+    from common_osint_model import Host, Domain
+    from pivot_track.lib.fingerprint import HostChange
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS = metrics.registry.counter(
+    "pivottrack_notifications_total",
+    "Notified entities per sink and kind, by delivery status (delivered, deduplicated, failed).",
+    ["sink", "kind", "status"],
+)
+NOTIFICATION_DELIVERIES = metrics.registry.counter(
+    "pivottrack_notification_deliveries_total",
+    "Batched deliveries (file writes or webhook requests) of notification sinks.",
+    ["sink", "status"],
+)
+
+NEW = "new"
+REMOVED = "removed"
+CHANGED = "changed"
+
+HEADLINES = {
+    NEW: "🚨🚨🚨 New Tracking Results",
+    REMOVED: "👻👻👻 Gone Tracking Results",
+    CHANGED: "🔄🔄🔄 Changed Tracking Results",
+}
+
+
+def entity_string(item: Union["Host", "Domain"]) -> str:
+    """Returns the identifying string of a Common OSINT Model item (IP of hosts, name of domains)."""
+    return getattr(item, "ip", None) or getattr(item, "domain", None)
+
+
+class Notification:
+    """A `Notification` holds one notified entity of a tracking definition. `kind` is one of "new",
+    "removed" and "changed", `detail` holds the changed attributes of changed hosts."""
+
+    __slots__ = ("kind", "definition", "title", "entity", "detail")
+
+    def __init__(
+        self, kind: str, definition=None, entity: str = None, detail: str = None
+    ):
+        self.kind = kind
+        self.definition = str(definition.uuid) if definition is not None else None
+        self.title = definition.title if definition is not None else None
+        self.entity = entity
+        self.detail = detail
+
+    @property
+    def key(self) -> tuple:
+        return (self.kind, self.entity, self.detail)
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "definition": self.definition,
+            "title": self.title,
+            "entity": self.entity,
+            "detail": self.detail,
+        }
+
+    def __str__(self) -> str:
+        return self.entity if self.detail is None else f"{self.entity} ({self.detail})"
+
+
+def render_text(notifications: List[Notification], digest: bool = False) -> str:
+    """Renders notifications as text blocks, one block per definition and kind (in order of appearance).
+    Digests start with a summary line of the counts per kind."""
+    blocks = OrderedDict()
+    for notification in notifications:
+        blocks.setdefault(
+            (notification.definition, notification.title, notification.kind), []
+        ).append(str(notification))
+    texts = list()
+    if digest:
+        counts = {kind: 0 for kind in HEADLINES}
+        for notification in notifications:
+            counts[notification.kind] += 1
+        texts.append(
+            f"📋 Tracking digest {datetime.now(timezone.utc).isoformat()}: "
+            f"{counts[NEW]} new, {counts[REMOVED]} gone, {counts[CHANGED]} changed"
+        )
+    for (definition, title, kind), lines in blocks.items():
+        headline = HEADLINES[kind]
+        if definition is not None:
+            headline += f' for "{title}" ({definition})'
+        texts.append(headline + ":\n" + "\n".join(lines))
+    return "\n\n".join(texts)
+
+
+class DedupWindow:
+    """The `DedupWindow` class remembers notified entities for `seconds`. Entities, that are notified
+    again within the window (e.g. by another tracking definition), are reported as duplicates."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._seen = OrderedDict()
+
+    def seen(self, key, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        # Keys are inserted in time order, so expired keys are at the front
+        while self._seen:
+            oldest_key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.seconds:
+                break
+            del self._seen[oldest_key]
+        if key in self._seen:
+            return True
+        self._seen[key] = now
+        return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class BufferedNotificationConnector(NotificationConnector):
+    """The `BufferedNotificationConnector` class is the parent class of notification sinks, that deliver
+    notifications in batches. Notifications are buffered and delivered, when `batch_size` notifications
+    are buffered or when the tracking cycle ends (`flush`). In digest mode, all notifications of a cycle
+    are delivered at once. With a `dedup_window`, the same entity is only notified once per window."""
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        digest: bool = False,
+        dedup_window: float = 0,
+    ):
+        self.batch_size = max(int(batch_size), 1)
+        self.digest = digest
+        self.dedup = DedupWindow(dedup_window) if dedup_window else None
+        self._buffer = list()
+        self._buffer_lock = threading.Lock()
+
+    @property
+    def sink_name(self) -> str:
+        return type(self).__name__.removesuffix("Connector").lower()
+
+    def notify(
+        self,
+        definition=None,
+        notify_items: List[Union["Host", "Domain"]] = None,
+    ):
+        self._add(
+            Notification(NEW, definition, entity_string(item))
+            for item in notify_items or []
+        )
+
+    def notify_removed(
+        self,
+        definition=None,
+        removed_items: List[Union["Host", "Domain"]] = None,
+    ):
+        self._add(
+            Notification(REMOVED, definition, entity_string(item))
+            for item in removed_items or []
+        )
+
+    def notify_changed(self, definition=None, changed_items: List["HostChange"] = None):
+        self._add(
+            Notification(
+                CHANGED, definition, change.host.ip, ", ".join(change.attributes)
+            )
+            for change in changed_items or []
+        )
+
+    def _add(self, notifications):
+        batches = list()
+        with self._buffer_lock:
+            for notification in notifications:
+                if self.dedup is not None and self.dedup.seen(notification.key):
+                    NOTIFICATIONS.inc(
+                        sink=self.sink_name,
+                        kind=notification.kind,
+                        status="deduplicated",
+                    )
+                    continue
+                self._buffer.append(notification)
+            if not self.digest:
+                while len(self._buffer) >= self.batch_size:
+                    batches.append(self._buffer[: self.batch_size])
+                    del self._buffer[: self.batch_size]
+        for batch in batches:
+            self._send(batch)
+
+    def flush(self):
+        """Delivers all buffered notifications (called at the end of every tracking cycle)."""
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, list()
+        if batch:
+            self._send(batch)
+
+    def _send(self, notifications: List[Notification]):
+        status = "delivered"
+        with profiling.span("notification_delivery", sink=self.sink_name):
+            try:
+                self.deliver(notifications)
+                NOTIFICATION_DELIVERIES.inc(sink=self.sink_name, status="ok")
+            except Exception as e:
+                status = "failed"
+                NOTIFICATION_DELIVERIES.inc(sink=self.sink_name, status="error")
+                logger.error(
+                    "Could not deliver %d notification(s) via %s: %s",
+                    len(notifications),
+                    self.sink_name,
+                    e,
+                )
+        for notification in notifications:
+            NOTIFICATIONS.inc(
+                sink=self.sink_name, kind=notification.kind, status=status
+            )
+
+    @abstractmethod
+    def deliver(self, notifications: List[Notification]):
+        """Delivers one batch (or the digest of a cycle) of notifications with one write or request."""
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class NotificationGroup(NotificationConnector):
+    """The `NotificationGroup` class forwards notifications to several notification connectors."""
+
+    def __init__(self, connections: List[NotificationConnector]):
+        self.connections = list(connections)
+
+    def notify(self, definition=None, notify_items=None):
+        for connection in self.connections:
+            connection.notify(definition=definition, notify_items=notify_items)
+
+    def notify_removed(self, definition=None, removed_items=None):
+        for connection in self.connections:
+            connection.notify_removed(
+                definition=definition, removed_items=removed_items
+            )
+
+    def notify_changed(self, definition=None, changed_items=None):
+        for connection in self.connections:
+            connection.notify_changed(
+                definition=definition, changed_items=changed_items
+            )
+
+    def flush(self):
+        for connection in self.connections:
+            connection.flush()
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
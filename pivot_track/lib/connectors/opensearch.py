@@ -2,6 +2,7 @@ from datetime import datetime, timezone
 from opensearchpy import OpenSearch, OpenSearchException
 from common_osint_model import Host, Domain
 
+from pivot_track.lib import metrics, profiling
 from .interface import OutputConnector
 
 import logging
@@ -9,6 +10,17 @@ import uuid
 
 logger = logging.getLogger(__name__)
 
+OPENSEARCH_REQUEST_SECONDS = metrics.registry.histogram(
+    "pivottrack_opensearch_request_seconds",
+    "Latency of OpenSearch requests.",
+    ["operation"],
+)
+OPENSEARCH_ERRORS = metrics.registry.counter(
+    "pivottrack_opensearch_errors_total",
+    "Failed OpenSearch requests.",
+    ["operation"],
+)
+
 
 class OpenSearchConnector(OutputConnector):
     opensearch_client = None
@@ -18,16 +30,19 @@ class OpenSearchConnector(OutputConnector):
     def __init__(self, config):
         try:
             logger.info(
-                f"Initializing OpenSearchConnector for connection {config['host']}:{config['port']}"
+                "Initializing OpenSearchConnector for connection %s:%s",
+                config["host"],
+                config["port"],
             )
 
             self.config = config
             self.opensearch_client = OpenSearch(
                 hosts=[{"host": self.config["host"], "port": self.config["port"]}],
-                http_compress=False,
+                http_compress=self.config.get("http_compress", False),
                 use_ssl=True,
                 verify_certs=self.config["verify_certs"],
                 http_auth=(self.config["user"], self.config["pass"]),
+                pool_maxsize=self.config.get("pool_maxsize", 10),
             )
             self.opensearch_client.ping()
             # Make sure, that there is some kind of index prefix, at least an empty string
@@ -40,9 +55,17 @@ class OpenSearchConnector(OutputConnector):
             )
         except OpenSearchException as e:
             logger.error(
-                f"Failed connecting to OpenSearch instance running on {self.config['host']}:{self.config['port']}. User was {self.config['user']}. OpenSearchException message: {e}"
+                "Failed connecting to OpenSearch instance running on %s:%s. User was %s. OpenSearchException message: %s",
+                self.config["host"],
+                self.config["port"],
+                self.config["user"],
+                e,
             )
 
+    def close(self):
+        if self.opensearch_client is not None:
+            self.opensearch_client.close()
+
     def init_pivottrack_query_index(
         self, index_name: str, index_field_properties: dict
     ):
@@ -101,27 +124,32 @@ class OpenSearchConnector(OutputConnector):
         )
 
     def _init_pivottrack_index(self, index_name: str, index_settings: dict):
-        logger.info(f"Creating Opensearch index {index_name}")
+        logger.info("Creating Opensearch index %s", index_name)
         if not self.opensearch_client.indices.exists(index=index_name):
             response = self.opensearch_client.indices.create(
                 index=index_name, body=index_settings
             )
-            logger.debug(f"Creation of Opensearch index {index_name} successful.")
+            logger.debug("Creation of Opensearch index %s successful.", index_name)
             return response
         else:
-            logger.info(f"Opensearch index {index_name} does already exist.")
+            logger.info("Opensearch index %s does already exist.", index_name)
             return None
 
     def index_document(self, document: dict, index: str):
         try:
-            response = self.opensearch_client.index(
-                index=index, body=document, refresh=True
-            )
-            logger.debug(f"Indexing of document to index {index} successful.")
+            with (
+                OPENSEARCH_REQUEST_SECONDS.time(operation="index"),
+                profiling.span("index"),
+            ):
+                response = self.opensearch_client.index(
+                    index=index, body=document, refresh=True
+                )
+            logger.debug("Indexing of document to index %s successful.", index)
             return response
         except OpenSearchException as e:
-            logger.error(f"OpenSearchException while indexing document for {index}.")
-            logger.debug(f"OpenSearchException message: {e}")
+            OPENSEARCH_ERRORS.inc(operation="index")
+            logger.error("OpenSearchException while indexing document for %s.", index)
+            logger.debug("OpenSearchException message: %s", e)
             return None
 
     def query_output(self, query_result, raw=False):
@@ -154,7 +182,9 @@ class OpenSearchConnector(OutputConnector):
                 query_result_payload["pivottrack"] = pivottrack_metadata
 
                 logger.info(
-                    f"Write a query result for query {query_result_element.search_term} to index {index_name}."
+                    "Write a query result for query %s to index %s.",
+                    query_result_element.search_term,
+                    index_name,
                 )
 
                 self.index_document(document=query_result_payload, index=index_name)
@@ -162,8 +192,9 @@ class OpenSearchConnector(OutputConnector):
                 com_list = self.query_result_to_com_list(query_result_element)
                 for com_result_element in com_list:
                     # TODO this is a little hacky right now, but otherwise it's hard to get this data into opensearch...
-                    com_result_element.services = []
-                    query_result_payload = com_result_element.flattened_dict
+                    query_result_payload = com_result_element.model_copy(
+                        update={"services": []}
+                    ).flattened_dict
                     query_result_payload["pivottrack"] = pivottrack_metadata
                     index_name = f"{self.config['index_prefix']}com-{query_result_element.query_command}"
                     self.index_document(document=query_result_payload, index=index_name)
@@ -173,7 +204,9 @@ class OpenSearchConnector(OutputConnector):
         return super().query_result_to_com_list(query_result)
 
     # TODO: Add tracking output interface
-    def tracking_output(self, query_result, definition):
+    def tracking_output(self, query_result, definition, known: set = None):
+        """Indexes tracking results and returns the elements, that are new for the definition.
+        Elements in `known` (e.g. retained from the last cycle) are not looked up in OpenSearch."""
         new_elements = []
         pivottrack_metadata = {
             "tracking_timestamp": datetime.now(timezone.utc).isoformat(),
@@ -190,31 +223,39 @@ class OpenSearchConnector(OutputConnector):
 
         com_list = self.query_result_to_com_list(query_result)
         logger.info(
-            f'Preparing OpenSearch tracking output. Got {len(com_list)} COM objects for "{str(definition.uuid)}".'
+            'Preparing OpenSearch tracking output. Got %d COM objects for "%s".',
+            len(com_list),
+            definition.uuid,
         )
         for com_result_element in com_list:
             # TODO this is a little hacky right now, but otherwise it's hard to get this data into opensearch...
-            com_result_element.services = []
-            tracking_result_payload = com_result_element.flattened_dict
+            tracking_result_payload = com_result_element.model_copy(
+                update={"services": []}
+            ).flattened_dict
             tracking_result_payload["pt_meta"] = pivottrack_metadata
             tracking_result_payload["pt_tracking_definition"] = (
                 pivottrack_tracking_definition
             )
             index_name = f"{self.config['index_prefix']}tracking-hosts"
             # TODO decouple identification of new elements and storage (maybe return uuid?)
-            new_elements.extend(
-                self.tracking_get_new_elements(com_result_element, definition)
-            )
+            with profiling.span("new_element_check"):
+                new_elements.extend(
+                    self.tracking_get_new_elements(
+                        com_result_element, definition, known=known
+                    )
+                )
             self.index_document(document=tracking_result_payload, index=index_name)
         return new_elements
 
-    def tracking_get_new_elements(self, tracked_item, definition):
+    def tracking_get_new_elements(self, tracked_item, definition, known: set = None):
         # TODO Check for types (Host, etc.)
         new_elements = []
+        known = known or set()
         index_name = f"{self.config['index_prefix']}tracking-hosts"
         if isinstance(tracked_item, Host):
             logger.debug(
-                f"Tracked item is Host, searching for IP {tracked_item.ip} and definition UUID."
+                "Tracked item is Host, searching for IP %s and definition UUID.",
+                tracked_item.ip,
             )
             body = {
                 "query": {
@@ -227,10 +268,17 @@ class OpenSearchConnector(OutputConnector):
                 }
             }
             for domain in tracked_item.domains:
-                new_elements.extend(self.tracking_get_new_elements(domain, definition))
+                new_elements.extend(
+                    self.tracking_get_new_elements(domain, definition, known=known)
+                )
+            if tracked_item.ip in known:
+                return new_elements
         elif isinstance(tracked_item, Domain):
+            if tracked_item.domain.lower() in known:
+                return new_elements
             logger.debug(
-                f"Tracked item is Domain, searching for IP {tracked_item.domain} and definition UUID."
+                "Tracked item is Domain, searching for domain %s and definition UUID.",
+                tracked_item.domain,
             )
             body = {
                 "query": {
@@ -243,11 +291,14 @@ class OpenSearchConnector(OutputConnector):
                 }
             }
         try:
-            response = self.opensearch_client.search(
-                body=body, index=index_name, params={"size": 1}
-            )
-            logger.info(
-                f"Searching {index_name} successful finished successful with {response['hits']['total']} results."
+            with OPENSEARCH_REQUEST_SECONDS.time(operation="search"):
+                response = self.opensearch_client.search(
+                    body=body, index=index_name, params={"size": 1}
+                )
+            logger.debug(
+                "Searching %s finished successful with %s results.",
+                index_name,
+                response["hits"]["total"],
             )
             if response["hits"]["total"]["value"] > 0:
                 logger.debug("Tracked item exists in Opensearch Database.")
@@ -257,8 +308,10 @@ class OpenSearchConnector(OutputConnector):
                 new_elements.append(tracked_item)
                 return new_elements
         except OpenSearchException as e:
+            OPENSEARCH_ERRORS.inc(operation="search")
             logger.error(
-                f"OpenSearchException while searching tracked item document in {index_name}."
+                "OpenSearchException while searching tracked item document in %s.",
+                index_name,
             )
-            logger.debug(f"OpenSearchException message: {e}")
+            logger.debug("OpenSearchException message: %s", e)
             return new_elements
@@ -0,0 +1,209 @@
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from pivot_track.lib import metrics, profiling
+from pivot_track.lib.fingerprint import HostFingerprint
+from .interface import OutputConnector
+
+if TYPE_CHECKING:
+    from common_osint_model import Host
+
+logger = logging.getLogger(__name__)
+
+PARQUET_WRITE_SECONDS = metrics.registry.histogram(
+    "pivottrack_parquet_write_seconds",
+    "Latency of writing one Parquet file (one batch of results).",
+    ["operation"],
+)
+
+# Partition of query results, that do not belong to a tracking definition
+QUERY_PARTITION = "query"
+
+COLUMNS = (
+    "timestamp",
+    "context",
+    "query",
+    "command",
+    "ip",
+    "source",
+    "first_seen",
+    "last_seen",
+    "asn",
+    "as_name",
+    "as_country",
+    "ports",
+    "domains",
+    "certificates",
+    "jarm",
+)
+
+
+def _pyarrow():
+    """Returns the pyarrow and pyarrow.parquet modules. pyarrow is an optional dependency (extra "parquet")."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            'The Parquet output requires pyarrow. Install it with the "parquet" extra or "pip install pyarrow".'
+        ) from e
+    return pyarrow, pyarrow.parquet
+
+
+def schema(pa):
+    """Returns the Arrow schema of flattened host records. Date and definition are partition keys and
+    are not stored in the files."""
+    timestamp = pa.timestamp("us", tz="UTC")
+    return pa.schema(
+        [
+            ("timestamp", timestamp),
+            ("context", pa.string()),
+            ("query", pa.string()),
+            ("command", pa.string()),
+            ("ip", pa.string()),
+            ("source", pa.string()),
+            ("first_seen", timestamp),
+            ("last_seen", timestamp),
+            ("asn", pa.int64()),
+            ("as_name", pa.string()),
+            ("as_country", pa.string()),
+            ("ports", pa.list_(pa.int32())),
+            ("domains", pa.list_(pa.string())),
+            ("certificates", pa.list_(pa.string())),
+            ("jarm", pa.list_(pa.string())),
+        ]
+    )
+
+
+def host_columns(com_list: list, timestamp: datetime, **values) -> dict:
+    """Flattens hosts to columns (name to list of values) of the Parquet schema. `values` are set for
+    all rows (e.g. context, query and command)."""
+    columns = {column: list() for column in COLUMNS}
+    for host in com_list:
+        fingerprint = HostFingerprint.from_host(host)
+        autonomous_system = host.autonomous_system
+        row = {
+            "timestamp": timestamp,
+            "context": None,
+            "query": None,
+            "command": None,
+            **values,
+            "ip": host.ip,
+            "source": host.source,
+            "first_seen": host.first_seen,
+            "last_seen": host.last_seen,
+            "asn": autonomous_system.number if autonomous_system else None,
+            "as_name": autonomous_system.name if autonomous_system else None,
+            "as_country": autonomous_system.country if autonomous_system else None,
+            "ports": fingerprint.attributes["ports"],
+            "domains": sorted(
+                {
+                    domain.domain.lower()
+                    for domain in host.domains or []
+                    if domain.domain
+                }
+            ),
+            "certificates": fingerprint.attributes["certificates"],
+            "jarm": fingerprint.attributes["jarm"],
+        }
+        for column in COLUMNS:
+            columns[column].append(row[column])
+    return columns
+
+
+class ParquetConnector(OutputConnector):
+    """The `ParquetConnector` class writes query and tracking results as flattened, typed host records to
+    compressed Parquet files. Files are partitioned by date and tracking definition (Hive style, e.g.
+    `date=2024-10-01/definition=<uuid>/part-<id>.parquet`), every batch of results (one call) is one file. The
+    connector is an archive: it does not decide on new elements, so use it next to OpenSearch or SQLite
+    for tracking notifications."""
+
+    available = False
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.path = Path(config.get("path", "pivottrack-parquet"))
+        self.compression = config.get("compression", "zstd")
+        self.pa, self.pq = _pyarrow()
+        self.schema = schema(self.pa)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.available = True
+
+    def partition_path(self, timestamp: datetime, definition: str = None) -> Path:
+        return (
+            self.path
+            / f"date={timestamp.date().isoformat()}"
+            / f"definition={definition or QUERY_PARTITION}"
+        )
+
+    def write(self, columns: dict, timestamp: datetime, definition: str = None):
+        """Writes one batch of columns to a new file of its partition. Files are renamed into place, so
+        that readers never see partially written files."""
+        if not columns["ip"]:
+            return None
+        table = self.pa.Table.from_pydict(columns, schema=self.schema)
+        directory = self.partition_path(timestamp, definition)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"part-{uuid.uuid4().hex}.parquet"
+        # Files starting with "." are ignored by dataset readers
+        temporary = directory / f".{name}.tmp"
+        self.pq.write_table(table, temporary, compression=self.compression)
+        os.replace(temporary, directory / name)
+        logger.debug("Wrote %d host record(s) to %s.", table.num_rows, directory / name)
+        return directory / name
+
+    def query_output(self, query_result, raw=False):
+        if raw:
+            logger.error("Parquet output does only work with normalized data handling.")
+            raise NotImplementedError
+        if not isinstance(query_result, list):
+            query_result = [query_result]
+        timestamp = datetime.now(timezone.utc)
+        with (
+            PARQUET_WRITE_SECONDS.time(operation="query_output"),
+            profiling.span("index", output="parquet"),
+        ):
+            # All elements (e.g. the pages of an expanded query) are written as one file
+            columns = {column: list() for column in COLUMNS}
+            for query_result_element in query_result:
+                element_columns = host_columns(
+                    self.query_result_to_com_list(query_result_element),
+                    timestamp,
+                    context="query",
+                    query=query_result_element.search_term,
+                    command=query_result_element.query_command,
+                )
+                for column in COLUMNS:
+                    columns[column].extend(element_columns[column])
+            self.write(columns, timestamp)
+
+    def tracking_output(self, query_result, definition, known: set = None):
+        """Writes the results of a tracking definition as one file. Returns no new elements (see class documentation)."""
+        timestamp = datetime.now(timezone.utc)
+        with (
+            PARQUET_WRITE_SECONDS.time(operation="tracking_output"),
+            profiling.span("index", output="parquet"),
+        ):
+            self.write(
+                host_columns(
+                    self.query_result_to_com_list(query_result),
+                    timestamp,
+                    context="tracking",
+                ),
+                timestamp,
+                str(definition.uuid),
+            )
+        return list()
+
+    def query_result_to_com_list(self, query_result) -> list["Host"]:
+        return super().query_result_to_com_list(query_result)
+
+    def dataset(self):
+        """Returns a `pyarrow.dataset.Dataset` of all written results, with date and definition as partition columns."""
+        import pyarrow.dataset
+
+        return pyarrow.dataset.dataset(self.path, format="parquet", partitioning="hive")
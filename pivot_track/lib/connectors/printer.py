@@ -1,8 +1,9 @@
 import json
 import logging
+import sys
 
+from rich.console import Console
 from rich.table import Table
-from rich import print
 from common_osint_model import Host
 
 from .interface import OutputConnector
@@ -10,35 +11,153 @@ from .interface import OutputConnector
 logger = logging.getLogger(__name__)
 
 
+def _stdlib_json(value) -> bytes:
+    return json.dumps(
+        value, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode("utf-8")
+
+
+def _with_fallback(encode):
+    """Wraps a fast encoder, so that documents it rejects are encoded with the standard library. orjson and
+    msgspec only support 64-bit integers, but e.g. certificate serial numbers in Shodan banners are larger."""
+
+    def encode_with_fallback(value) -> bytes:
+        try:
+            return encode(value)
+        except (TypeError, OverflowError):
+            return _stdlib_json(value)
+
+    return encode_with_fallback
+
+
+def json_encoder():
+    """Returns a function, that encodes one object to a compact JSON document (bytes). orjson or msgspec
+    are used if available, the standard library otherwise."""
+    try:
+        import orjson
+
+        return _with_fallback(lambda value: orjson.dumps(value, default=str))
+    except ImportError:
+        pass
+    try:
+        import msgspec
+
+        return _with_fallback(msgspec.json.Encoder(enc_hook=str).encode)
+    except ImportError:
+        pass
+    return _stdlib_json
+
+
 class CLIPrinter(OutputConnector):
-    """This class is a CLI printer, and resposbile for printint query results to the command line interface."""
+    """This class is a CLI printer, and resposbile for printint query results to the command line interface.
+    Hosts are rendered progressively, in pages of `page_size` rows, as query results are converted. At most
+    `max_rows` rows are rendered. Large outputs (more than `compact_threshold` rows, over all `query_output`
+    calls until `flush`) are rendered in a compact layout without boxes and row lines, unless `compact` is set
+    explicitly."""
+
+    def __init__(
+        self,
+        page_size: int = 100,
+        max_rows: int = None,
+        compact: bool = None,
+        compact_threshold: int = 1000,
+        console: Console = None,
+    ):
+        self.page_size = max(int(page_size), 1)
+        self.max_rows = max_rows
+        self.compact = compact
+        self.compact_threshold = compact_threshold
+        self.console = console or Console()
+        self._rendered_rows = 0
+        self._hidden_rows = 0
+        self._compact_output = False
+
+    @classmethod
+    def from_config(cls, config: dict) -> "CLIPrinter":
+        """Returns a `CLIPrinter` with the settings of the `cli` section of the configuration."""
+        cli_config = (config or dict()).get("cli") or dict()
+        return cls(
+            page_size=cli_config.get("page_size", 100),
+            max_rows=cli_config.get("max_rows"),
+            compact=cli_config.get("compact"),
+            compact_threshold=cli_config.get("compact_threshold", 1000),
+        )
 
     def query_output(self, query_result, raw=False):
         """This method handles generic output requests for query results."""
         if not raw:
-            com_results = self.query_result_to_com_list(query_result)
-            self.com_host_table(com_results)
+            if not isinstance(query_result, list):
+                query_result = [query_result]
+            # The layout is chosen for all rows of the call, before the first one is rendered
+            self._compact_layout(
+                sum(element.element_count or 0 for element in query_result)
+            )
+            # Every query result is rendered as soon as it is converted
+            for query_result_element in query_result:
+                self.com_host_table(self.query_result_to_com_list(query_result_element))
         else:
             raise NotImplementedError
 
+    def flush(self):
+        """This method ends the output (of one or several `query_output` calls), with a note on hosts, that are not shown."""
+        if self._hidden_rows:
+            self.console.print(
+                f"{self._hidden_rows} more host(s) not shown (max_rows is {self.max_rows}).",
+                style="dim",
+                markup=False,
+            )
+        self._rendered_rows, self._hidden_rows = 0, 0
+        self._compact_output = False
+
+    def _compact_layout(self, rows: int) -> bool:
+        """Returns if rows are rendered in the compact layout: if set explicitly, or once the output (the rows so far
+        and the given ones, at most `max_rows`) is larger than `compact_threshold`. The output stays compact until `flush`."""
+        if self.compact is not None:
+            return self.compact
+        total_rows = self._rendered_rows + self._hidden_rows + rows
+        if self.max_rows is not None:
+            total_rows = min(total_rows, self.max_rows)
+        if total_rows > self.compact_threshold:
+            self._compact_output = True
+        return self._compact_output
+
+    def _table(self, compact: bool, show_header: bool) -> Table:
+        columns = ("IP", "First Seen", "Last Seen", "Source", "Domains")
+        if compact:
+            return Table(
+                *columns,
+                box=None,
+                show_header=show_header,
+                show_edge=False,
+                pad_edge=False,
+            )
+        return Table(*columns, show_lines=True, show_header=show_header)
+
     # TODO Include further COM types (certificates, domains, etc.)
     def com_host_table(self, hosts: list):
-        """This method translates a list of Common OSINT Model results to a rich framework table."""
-        table = Table(
-            "IP", "First Seen", "Last Seen", "Source", "Domains", show_lines=True
-        )
+        """This method translates a list of Common OSINT Model results to rich framework tables, one per page."""
         if isinstance(hosts, Host):
             hosts = [hosts]
-        logger.debug(f"Printing Host Table with {len(hosts)} elements.")
-        for host in hosts:
-            table.add_row(
-                host.ip,
-                str(host.first_seen),
-                str(host.last_seen),
-                host.source,
-                "\n".join([domain.domain for domain in host.domains]),
-            )
-        print(table)
+        logger.debug("Printing Host Table with %d elements.", len(hosts))
+        compact = self._compact_layout(len(hosts))
+        if self.max_rows is not None:
+            shown = max(self.max_rows - self._rendered_rows, 0)
+            self._hidden_rows += max(len(hosts) - shown, 0)
+            hosts = hosts[:shown]
+        for start in range(0, len(hosts), self.page_size):
+            # Only the first page of the output has a header
+            table = self._table(compact, show_header=self._rendered_rows == 0)
+            for host in hosts[start : start + self.page_size]:
+                domains = [domain.domain for domain in host.domains or []]
+                table.add_row(
+                    host.ip,
+                    str(host.first_seen),
+                    str(host.last_seen),
+                    host.source,
+                    ", ".join(domains) if compact else "\n".join(domains),
+                )
+            self._rendered_rows += table.row_count
+            self.console.print(table)
 
     def query_result_to_com_list(self, query_result) -> list:
         """This methdo translates a list of query results to a list of Common OSINT Model items."""
@@ -47,10 +166,18 @@ class CLIPrinter(OutputConnector):
 
 
 class JSONPrinter(OutputConnector):
-    """This class is responsbile for handling JSON output of query results."""
+    """This class is responsbile for handling JSON output of query results. With `lines`, results are
+    streamed as JSON Lines (one host or raw result per line) to a buffered stream, while they are
+    converted, instead of building one JSON document of all results."""
+
+    def __init__(self, lines: bool = False, stream=None):
+        self.lines = lines
+        self.stream = stream
 
     def query_output(self, query_result, raw=False):
-        if not raw:
+        if self.lines:
+            self.json_lines(query_result, raw=raw)
+        elif not raw:
             com_results = self.query_result_to_com_list(query_result)
             self.json(com_results)
         else:
@@ -59,6 +186,26 @@ class JSONPrinter(OutputConnector):
             for query_result_element in query_result:
                 self.json(query_result_element.raw_result, indent=None)
 
+    def json_lines(self, query_result, raw=False):
+        """This method writes query results as JSON Lines, one line per host (or per raw result)."""
+        encode = json_encoder()
+        stream = self.stream if self.stream is not None else sys.stdout.buffer
+        if not isinstance(query_result, list):
+            query_result = [query_result]
+        lines = 0
+        for query_result_element in query_result:
+            if raw:
+                items = [query_result_element.raw_result]
+            else:
+                items = self.query_result_to_com_list(query_result_element)
+            for item in items:
+                if isinstance(item, Host):
+                    item = item.flattened_dict
+                stream.write(encode(item) + b"\n")
+                lines += 1
+        stream.flush()
+        logger.debug("Wrote %d JSON line(s).", lines)
+
     def json(self, input, indent=2):
         """This method creates JSON-items, based on raw data and Common OSINT Model data"""
         logger.debug("Printing JSON Output")
@@ -80,7 +227,8 @@ class JSONPrinter(OutputConnector):
             except ValueError:
                 logger.error("Could not print input in JSON format.")
                 printable = ""
-        print(printable)
+        # Written without rich, which would parse markup (e.g. brackets) in the payload
+        sys.stdout.write(printable + "\n")
 
     def query_result_to_com_list(self, query_result) -> list:
         """This methdo translates a list of query results to a list of Common OSINT Model items."""
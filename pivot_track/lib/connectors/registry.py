@@ -0,0 +1,111 @@
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "pivot_track.connectors"
+
+# Connectors shipped with Pivot Track. References are resolved (and their modules imported) only
+# when a connector is requested by name.
+BUILTIN_CONNECTORS = {
+    "shodan": "pivot_track.lib.connectors.shodan:ShodanSourceConnector",
+    "censys": "pivot_track.lib.connectors.censys:CensysSourceConnector",
+    "opensearch": "pivot_track.lib.connectors.opensearch:OpenSearchConnector",
+    "cli": "pivot_track.lib.connectors.printer:CLIPrinter",
+    "json": "pivot_track.lib.connectors.printer:JSONPrinter",
+    "file": "pivot_track.lib.connectors.file:FileConnector",
+    "webhook": "pivot_track.lib.connectors.webhook:WebhookConnector",
+    "sqlite": "pivot_track.lib.connectors.sqlite:SQLiteConnector",
+    "parquet": "pivot_track.lib.connectors.parquet:ParquetConnector",
+}
+
+
+class ConnectorRegistry:
+    """The `ConnectorRegistry` class maps connector names (as used in the configuration) to connector
+    classes. Built-in connectors are registered by name, third-party connectors are discovered
+    through the "pivot_track.connectors" entry point group. Connector classes are loaded on first use."""
+
+    def __init__(self, group: str = ENTRY_POINT_GROUP):
+        self.group = group
+        self._references = dict(BUILTIN_CONNECTORS)
+        self._classes = dict()
+        self._entry_points_loaded = False
+
+    def register(self, name: str, reference):
+        """Registers a connector class (or a "module:Class" reference to it) under the given name."""
+        if isinstance(reference, str):
+            self._references[name] = reference
+            self._classes.pop(name, None)
+        else:
+            self._references[name] = f"{reference.__module__}:{reference.__qualname__}"
+            self._classes[name] = reference
+
+    def _load_entry_points(self):
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        from importlib.metadata import entry_points
+
+        for entry_point in entry_points(group=self.group):
+            if entry_point.name in self._references:
+                logger.warning(
+                    'Connector entry point "%s" (%s) is shadowed by an existing connector.',
+                    entry_point.name,
+                    entry_point.value,
+                )
+                continue
+            logger.debug(
+                'Found connector entry point "%s" (%s).',
+                entry_point.name,
+                entry_point.value,
+            )
+            self._references[entry_point.name] = entry_point.value
+
+    @property
+    def names(self) -> list:
+        """Returns the names of all known connectors, without loading them."""
+        self._load_entry_points()
+        return sorted(self._references.keys())
+
+    @staticmethod
+    def _resolve(reference: str):
+        module_name, _, class_name = reference.partition(":")
+        connector = importlib.import_module(module_name)
+        for attribute in class_name.split("."):
+            connector = getattr(connector, attribute)
+        return connector
+
+    def load(self, name: str, parent_class=None):
+        """Returns the connector class for a name or a "module:Class" reference. If parent_class is
+        given, None is returned for connectors of other types. Unknown connectors return None."""
+        if name not in self._classes:
+            if name not in self._references and ":" not in name:
+                self._load_entry_points()
+            reference = self._references.get(name, name if ":" in name else None)
+            if reference is None:
+                logger.debug('Connector "%s" is not registered.', name)
+                return None
+            try:
+                self._classes[name] = self._resolve(reference)
+            except (ImportError, AttributeError) as e:
+                logger.error(
+                    'Could not load connector "%s" (%s): %s', name, reference, e
+                )
+                return None
+
+        connector = self._classes[name]
+        if parent_class is not None and not issubclass(connector, parent_class):
+            return None
+        return connector
+
+    def classes(self, parent_class=None) -> list:
+        """Returns all connector classes (of the type parent_class), loading every registered connector."""
+        connectors = list()
+        for name in self.names:
+            connector = self.load(name, parent_class)
+            if connector is not None and connector not in connectors:
+                connectors.append(connector)
+        return connectors
+
+
+connector_registry = ConnectorRegistry()
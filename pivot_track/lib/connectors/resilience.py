@@ -0,0 +1,176 @@
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SourceError(Exception):
+    """Parent class for classified errors of source API calls. `retryable` errors are retried with
+    backoff, errors that `trip_breaker` count as failures of the whole source and errors that
+    `rotate_credential` take the used credential out of its pool."""
+
+    retryable = False
+    trips_breaker = False
+    rotates_credential = False
+
+    def __init__(self, message: str = "", retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TransientSourceError(SourceError):
+    """Temporary failures, like timeouts, connection errors and 5xx responses."""
+
+    retryable = True
+    trips_breaker = True
+
+
+class RateLimitError(TransientSourceError):
+    """The source rejected the call because of its rate limit (HTTP 429). The source is up, so rate limits
+    do not count as failures of the circuit breaker."""
+
+    trips_breaker = False
+    rotates_credential = True
+
+
+class AuthenticationError(SourceError):
+    """Invalid or unauthorized credentials. Retrying does not help, but the whole source is affected."""
+
+    trips_breaker = True
+    rotates_credential = True
+
+
+class CreditsExhaustedError(SourceError):
+    """The credential has no API credits left."""
+
+    trips_breaker = True
+    rotates_credential = True
+
+
+class QueryError(SourceError):
+    """The source rejected this specific call, e.g. because of an invalid query."""
+
+
+class NotFoundError(QueryError):
+    """The source has no data for the requested element."""
+
+
+class RetryPolicy:
+    """The `RetryPolicy` class calculates exponential backoff delays with full jitter. Retry-After
+    hints of the source take precedence, if they are longer than the calculated delay."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.max_attempts = max(int(max_attempts), 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RetryPolicy":
+        retry_config = (config or dict()).get("retry") or dict()
+        return cls(
+            max_attempts=retry_config.get("max_attempts", 3),
+            backoff_base=retry_config.get("backoff_base", 1.0),
+            backoff_max=retry_config.get("backoff_max", 60.0),
+        )
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """Returns the seconds to wait before the retry after the given (zero-based) attempt."""
+        delay = random.uniform(
+            0, min(self.backoff_max, self.backoff_base * (2**attempt))
+        )
+        if retry_after is not None:
+            delay = max(delay, min(float(retry_after), self.backoff_max))
+        return delay
+
+
+class CircuitBreaker:
+    """The `CircuitBreaker` class tracks consecutive failures of a source. After `failure_threshold`
+    failures, the circuit opens and calls are skipped for `reset_timeout` seconds. Afterwards, one
+    trial call is allowed (half open), that either closes the circuit again or re-opens it."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 300.0,
+        on_state_change=None,
+    ):
+        self.name = name
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self.failures = 0
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, name: str, config: dict, on_state_change=None):
+        breaker_config = (config or dict()).get("circuit_breaker") or dict()
+        return cls(
+            name,
+            failure_threshold=breaker_config.get("failure_threshold", 5),
+            reset_timeout=breaker_config.get("reset_timeout", 300.0),
+            on_state_change=on_state_change,
+        )
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            self._state = state
+            if state == self.OPEN:
+                logger.warning(
+                    'Circuit breaker for source "%s" is open after %d failure(s). Skipping calls for %s seconds.',
+                    self.name,
+                    self.failures,
+                    self.reset_timeout,
+                )
+            else:
+                logger.info('Circuit breaker for source "%s" is %s.', self.name, state)
+            if self.on_state_change is not None:
+                self.on_state_change(state)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if (
+                self._state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self._set_state(self.HALF_OPEN)
+            return self._state
+
+    def allow(self) -> bool:
+        """Returns if a call may be executed now. While half open, only one trial call is allowed."""
+        state = self.state
+        with self._lock:
+            if state == self.HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
@@ -1,7 +1,14 @@
-import shodan
 import logging
 
 from .interface import SourceConnector, HostQuery
+from .resilience import (
+    TransientSourceError,
+    RateLimitError,
+    AuthenticationError,
+    CreditsExhaustedError,
+    QueryError,
+    NotFoundError,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -17,48 +24,112 @@ class ShodanSourceConnector(SourceConnector, HostQuery):
         },
         "shodan-generic-raw": {"matches.ip_str": {"type": "ip"}},
     }
+    # Host lookups are free, searches cost (at most) one query credit per page
+    CREDIT_COSTS = {"generic": 1, "host": 0, "count": 0}
+    HOST_BULK_SIZE = 100
 
     def __init__(self, config):
         logger.debug("Created new instance of class ShodanSourceConnector")
         self.config = config  # Set Config data
-        self.shodan_client = shodan.Shodan(
-            self.config["api_key"]
-        )  # Start Shodan Client
-        # Set Last Call Timestamp for Throtteling
-        self._update_last_call()
+        # One Shodan client per API key of the pool
+        self._init_credential_pool(keys=("api_key",))
+        self.shodan_client = self.credential_pool.credentials[0].client
+        self.session = self.shodan_client._session
+
+    def _create_client(self, credential_config: dict):
+        import shodan
+
+        client = shodan.Shodan(credential_config["api_key"])  # Start Shodan Client
+        # Throttling is done per pooled credential, not by the client library
+        client.api_rate_limit = 0
+        self._configure_session(client._session)
+        return client
+
+    def _default_client(self):
+        return getattr(self, "shodan_client", None)
+
+    def _account_credits(self, client) -> int:
+        return client.info().get("query_credits")
+
+    def close(self):
+        for credential in self.credential_pool.credentials:
+            if credential.client is not None:
+                credential.client._session.close()
 
     def query_host_search(self, query: str):
-        logger.info(f'Query for hosts with query "{query}"')
-
-        self._api_throttle()
-        try:
-            query_result = self.shodan_client.search(query)  # Execute shodan search
-            self._update_last_call()
-            return query_result
-        except shodan.APIError as e:
-            logger.error(
-                f'Shodan APIError while searching for hosts with query "{query}". Message {e}'
-            )
-            return None
+        logger.info('Query for hosts with query "%s"', query)
+        return self._request(
+            "generic",
+            lambda client: client.search(query),  # Execute shodan search
+            f'Shodan search for hosts with query "{query}"',
+        )
 
     def query_host(self, host: str):
-        logger.info(f'Query host "{host}"')
-
-        self._api_throttle()
-        try:
-            query_result = self.shodan_client.host(host)  # Get shodan host info
-            self._update_last_call()
-            return query_result
-        except shodan.APIError as e:
-            logger.error(
-                f'Shodan APIError while querying for host "{host}". Message {e}'
-            )
+        logger.info('Query host "%s"', host)
+        return self._request(
+            "host",
+            lambda client: client.host(host),  # Get shodan host info
+            f'Shodan query for host "{host}"',
+        )
+
+    def query_hosts(self, hosts: list) -> dict:
+        logger.info("Query %d hosts", len(hosts))
+        result = self._request(
+            "host",
+            # The client joins the IPs to one comma-separated host lookup
+            lambda client: client.host(list(hosts)),
+            f"Shodan query for {len(hosts)} hosts",
+            # Shodan answers "No information available", if it knows none of the hosts
+            not_found=[],
+        )
+        if result is None:
             return None
+        if isinstance(result, dict):
+            result = [result]
+        return {host["ip_str"]: host for host in result}
+
+    def query_host_count(self, query: str) -> int:
+        logger.info('Query host count with query "%s"', query)
+        result = self._request(
+            "count",
+            lambda client: client.count(query),  # Counting does not use query credits
+            f'Shodan count for hosts with query "{query}"',
+        )
+        return result.get("total") if result is not None else None
+
+    def _classify_error(self, exception: Exception):
+        from shodan import APIError
+
+        if not isinstance(exception, APIError):
+            return super()._classify_error(exception)
+        # Shodan only provides messages, so the classification relies on them
+        message = str(exception).lower()
+        if "insufficient query credits" in message or "no query credits" in message:
+            return CreditsExhaustedError(str(exception))
+        if "rate limit" in message:
+            return RateLimitError(str(exception))
+        if any(
+            hint in message
+            for hint in (
+                "unable to connect",
+                "bad gateway",
+                "unable to parse json",
+                "retry limit",
+                "timed out",
+                "temporarily",
+            )
+        ):
+            return TransientSourceError(str(exception))
+        if "invalid api key" in message or "access denied" in message:
+            return AuthenticationError(str(exception))
+        if "no information available" in message:
+            return NotFoundError(str(exception))
+        return QueryError(str(exception))
 
     def _api_throttle(self):
         logger.debug('Call "_api_throttle()" in parent class')
-        super()._api_throttle()
+        return super()._api_throttle()
 
-    def _update_last_call(self):
+    def _update_last_call(self, credential=None, credits_used: int = 0):
         logger.debug('Call "_update_last_call()" in parent class')
-        super()._update_last_call()
+        super()._update_last_call(credential, credits_used)
@@ -0,0 +1,298 @@
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pivot_track.lib import metrics, profiling
+from .interface import OutputConnector
+
+logger = logging.getLogger(__name__)
+
+SQLITE_WRITE_SECONDS = metrics.registry.histogram(
+    "pivottrack_sqlite_write_seconds",
+    "Latency of batched writes to the SQLite output.",
+    ["operation"],
+)
+
+# Names of new-element state entries (kind column)
+IP = "ip"
+DOMAIN = "domain"
+
+
+class SQLiteConnector(OutputConnector):
+    """The `SQLiteConnector` class is an embedded alternative to the `OpenSearchConnector`. Query results,
+    tracking history and the state of known elements per tracking definition are stored in one SQLite
+    database, with indexes on IP, domain, definition UUID and timestamp. Every batch is written in one
+    transaction, new elements are looked up with one query per batch."""
+
+    available = False
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.path = Path(config.get("path", "pivottrack.sqlite"))
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(self.path), timeout=30, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS raw_results (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                source TEXT,
+                command TEXT,
+                query TEXT,
+                document TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS raw_results_timestamp ON raw_results (timestamp);
+            CREATE TABLE IF NOT EXISTS hosts (
+                id INTEGER PRIMARY KEY,
+                context TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                query TEXT,
+                command TEXT,
+                definition TEXT,
+                tracking_reference TEXT,
+                document TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS hosts_ip ON hosts (ip);
+            CREATE INDEX IF NOT EXISTS hosts_definition ON hosts (definition, timestamp);
+            CREATE INDEX IF NOT EXISTS hosts_timestamp ON hosts (timestamp);
+            CREATE TABLE IF NOT EXISTS host_domains (
+                host_id INTEGER NOT NULL REFERENCES hosts (id),
+                domain TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS host_domains_domain ON host_domains (domain);
+            CREATE INDEX IF NOT EXISTS host_domains_host ON host_domains (host_id);
+            CREATE TABLE IF NOT EXISTS tracking_elements (
+                definition TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                PRIMARY KEY (definition, kind, value)
+            );
+            """
+        )
+        self._connection.commit()
+        self.available = True
+        logger.info('Opened SQLite output "%s".', self.path)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+        self.available = False
+
+    def _host_rows(self, com_list: list) -> list:
+        rows = list()
+        for host in com_list:
+            # Services are not stored, like in the OpenSearch output
+            document = host.model_copy(update={"services": []}).flattened_dict
+            domains = sorted(
+                {
+                    domain.domain.lower()
+                    for domain in host.domains or []
+                    if domain.domain
+                }
+            )
+            rows.append((host.ip, json.dumps(document, default=str), domains))
+        return rows
+
+    def _insert_hosts(self, rows: list, **columns):
+        for ip, document, domains in rows:
+            cursor = self._connection.execute(
+                """
+                INSERT INTO hosts (context, timestamp, ip, query, command, definition, tracking_reference, document)
+                VALUES (:context, :timestamp, :ip, :query, :command, :definition, :tracking_reference, :document)
+                """,
+                {
+                    "query": None,
+                    "command": None,
+                    "definition": None,
+                    "tracking_reference": None,
+                    **columns,
+                    "ip": ip,
+                    "document": document,
+                },
+            )
+            self._connection.executemany(
+                "INSERT INTO host_domains (host_id, domain) VALUES (?, ?)",
+                [(cursor.lastrowid, domain) for domain in domains],
+            )
+
+    def query_output(self, query_result, raw=False):
+        if not isinstance(query_result, list):
+            query_result = [query_result]
+        timestamp = datetime.now(timezone.utc).isoformat()
+        with (
+            SQLITE_WRITE_SECONDS.time(operation="query_output"),
+            profiling.span("index", output="sqlite"),
+            self._lock,
+            self._connection,
+        ):
+            for query_result_element in query_result:
+                if raw:
+                    source = query_result_element.source
+                    self._connection.execute(
+                        "INSERT INTO raw_results (timestamp, source, command, query, document) VALUES (?, ?, ?, ?, ?)",
+                        (
+                            timestamp,
+                            source.__name__.lower().removesuffix("sourceconnector")
+                            if source is not None
+                            else None,
+                            query_result_element.query_command,
+                            query_result_element.search_term,
+                            json.dumps(query_result_element.raw_result, default=str),
+                        ),
+                    )
+                else:
+                    self._insert_hosts(
+                        self._host_rows(
+                            self.query_result_to_com_list(query_result_element)
+                        ),
+                        context="query",
+                        timestamp=timestamp,
+                        query=query_result_element.search_term,
+                        command=query_result_element.query_command,
+                    )
+
+    def query_result_to_com_list(self, query_result) -> list:
+        return super().query_result_to_com_list(query_result)
+
+    def _known_values(self, definition: str, kind: str, values: list) -> set:
+        known = set()
+        # SQLite limits the number of parameters per statement
+        for start in range(0, len(values), 500):
+            chunk = values[start : start + 500]
+            known.update(
+                row[0]
+                for row in self._connection.execute(
+                    f"SELECT value FROM tracking_elements WHERE definition = ? AND kind = ? AND value IN ({','.join('?' * len(chunk))})",
+                    (definition, kind, *chunk),
+                )
+            )
+        return known
+
+    def tracking_output(self, query_result, definition, known: set = None):
+        """Stores tracking results and returns the elements, that are new for the definition. Elements in
+        `known` (e.g. retained from the last cycle) are treated as known without a lookup."""
+        known = known or set()
+        definition_uuid = str(definition.uuid)
+        timestamp = datetime.now(timezone.utc).isoformat()
+        com_list = self.query_result_to_com_list(query_result)
+        logger.info(
+            'Preparing SQLite tracking output. Got %d COM objects for "%s".',
+            len(com_list),
+            definition_uuid,
+        )
+        rows = self._host_rows(com_list)
+        new_elements = list()
+        with (
+            SQLITE_WRITE_SECONDS.time(operation="tracking_output"),
+            profiling.span("index", output="sqlite"),
+            self._lock,
+            self._connection,
+        ):
+            with profiling.span("new_element_check"):
+                ips = sorted({ip for ip, _, _ in rows} - known)
+                domains = sorted(
+                    {domain for _, _, host_domains in rows for domain in host_domains}
+                    - known
+                )
+                seen = {
+                    IP: self._known_values(definition_uuid, IP, ips) | known,
+                    DOMAIN: self._known_values(definition_uuid, DOMAIN, domains)
+                    | known,
+                }
+                for host in com_list:
+                    for domain in host.domains or []:
+                        if domain.domain and domain.domain.lower() not in seen[DOMAIN]:
+                            seen[DOMAIN].add(domain.domain.lower())
+                            new_elements.append(domain)
+                    if host.ip not in seen[IP]:
+                        seen[IP].add(host.ip)
+                        new_elements.append(host)
+
+            self._insert_hosts(
+                rows,
+                context="tracking",
+                timestamp=timestamp,
+                definition=definition_uuid,
+                tracking_reference=str(uuid.uuid4()),
+            )
+            self._connection.executemany(
+                """
+                INSERT INTO tracking_elements (definition, kind, value, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (definition, kind, value) DO UPDATE SET last_seen = excluded.last_seen
+                """,
+                [(definition_uuid, IP, ip, timestamp, timestamp) for ip, _, _ in rows]
+                + [
+                    (definition_uuid, DOMAIN, domain, timestamp, timestamp)
+                    for _, _, host_domains in rows
+                    for domain in host_domains
+                ],
+            )
+        return new_elements
+
+    def lookup_ip(self, ip: str, definition: str = None) -> list:
+        """Returns the stored host documents of an IP (of all definitions and queries, or of one definition), newest first."""
+        return self._lookup(
+            "SELECT context, timestamp, definition, document FROM hosts WHERE ip = ?",
+            (ip,),
+            definition,
+        )
+
+    def lookup_domain(self, domain: str, definition: str = None) -> list:
+        """Returns the stored host documents, that have a domain, newest first."""
+        return self._lookup(
+            "SELECT context, timestamp, definition, document FROM hosts WHERE id IN "
+            "(SELECT host_id FROM host_domains WHERE domain = ?)",
+            (domain.lower(),),
+            definition,
+        )
+
+    def tracking_history(self, definition: str, since: str = None) -> list:
+        """Returns the tracking results of a definition (optionally since an ISO timestamp), newest first."""
+        return self._lookup(
+            "SELECT context, timestamp, definition, document FROM hosts WHERE context = 'tracking' AND timestamp >= ?",
+            (since or "",),
+            definition,
+        )
+
+    def _lookup(
+        self, statement: str, parameters: tuple, definition: str = None
+    ) -> list:
+        if definition is not None:
+            statement += " AND definition = ?"
+            parameters = (*parameters, str(definition))
+        statement += " ORDER BY timestamp DESC"
+        with self._lock:
+            rows = self._connection.execute(statement, parameters).fetchall()
+        return [
+            {
+                "context": context,
+                "timestamp": timestamp,
+                "definition": definition,
+                "document": json.loads(document),
+            }
+            for context, timestamp, definition, document in rows
+        ]
+
+    def element_state(self, definition: str) -> list:
+        """Returns the known elements of a definition with their first and last tracking timestamps."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT kind, value, first_seen, last_seen FROM tracking_elements WHERE definition = ? ORDER BY first_seen",
+                (str(definition),),
+            ).fetchall()
+        return [
+            {"kind": kind, "value": value, "first_seen": first, "last_seen": last}
+            for kind, value, first, last in rows
+        ]
@@ -0,0 +1,115 @@
+import logging
+import time
+from collections import Counter
+from typing import List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pivot_track.lib.connectors.notification import (
+    BufferedNotificationConnector,
+    Notification,
+)
+from pivot_track.lib.connectors.resilience import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookConnector(BufferedNotificationConnector):
+    """The `WebhookConnector` class posts notifications as JSON to a webhook. Every batch (or the digest
+    of a tracking cycle) is sent with one request, over a keep-alive session, that is reused for all
+    requests. Failed requests are retried with backoff (see `retry` in the configuration)."""
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict = None,
+        timeout: float = 30,
+        batch_size: int = 500,
+        digest: bool = False,
+        dedup_window: float = 0,
+        retry_policy: RetryPolicy = None,
+    ):
+        super().__init__(
+            batch_size=batch_size, digest=digest, dedup_window=dedup_window
+        )
+        self.url = url
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.session = requests.Session()
+        # Deliveries are sequential, so one pooled connection is enough
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(headers or dict())
+
+    @classmethod
+    def from_config(cls, config: dict) -> "WebhookConnector":
+        """Returns a `WebhookConnector` for the `webhook` subsection of the `notifications` section of the
+        configuration, or None if there is no webhook URL."""
+        notification_config = (config or dict()).get("notifications") or dict()
+        webhook_config = notification_config.get("webhook") or dict()
+        if not webhook_config.get("url"):
+            return None
+        return cls(
+            webhook_config["url"],
+            headers=webhook_config.get("headers"),
+            timeout=webhook_config.get("timeout", 30),
+            batch_size=webhook_config.get(
+                "batch_size", notification_config.get("batch_size", 500)
+            ),
+            digest=notification_config.get("digest", False),
+            dedup_window=notification_config.get("dedup_window", 0),
+            retry_policy=RetryPolicy.from_config(webhook_config),
+        )
+
+    def payload(self, notifications: List[Notification]) -> dict:
+        return {
+            "digest": self.digest,
+            "summary": dict(
+                Counter(notification.kind for notification in notifications)
+            ),
+            "notifications": [notification.to_dict() for notification in notifications],
+        }
+
+    def deliver(self, notifications: List[Notification]):
+        payload = self.payload(notifications)
+        for attempt in range(self.retry_policy.max_attempts):
+            retry_after = None
+            try:
+                response = self.session.post(
+                    self.url, json=payload, timeout=self.timeout
+                )
+                if response.status_code < 400:
+                    logger.debug(
+                        "Delivered %d notification(s) to webhook.", len(notifications)
+                    )
+                    return
+                if response.status_code != 429 and response.status_code < 500:
+                    # Client errors do not get better with retries
+                    response.raise_for_status()
+                error = requests.HTTPError(
+                    f"Webhook responded with status {response.status_code}",
+                    response=response,
+                )
+                retry_after = response.headers.get("Retry-After")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt + 1 < self.retry_policy.max_attempts:
+                delay = self.retry_policy.delay(
+                    attempt,
+                    float(retry_after)
+                    if retry_after and retry_after.isdigit()
+                    else None,
+                )
+                logger.warning(
+                    "Webhook delivery failed (%s). Retrying in %.1f seconds.",
+                    error,
+                    delay,
+                )
+                time.sleep(delay)
+        raise error
+
+    def close(self):
+        super().close()
+        self.session.close()
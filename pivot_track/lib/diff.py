@@ -0,0 +1,219 @@
+import ipaddress
+import logging
+from typing import Iterable, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from common_osint_model import Host, Domain
+
+logger = logging.getLogger(__name__)
+
+_NUMPY = None
+
+
+def _numpy():
+    """Returns the numpy module, or None if it is not installed. numpy is imported on first use only,
+    to keep the startup of the CLI fast."""
+    global _NUMPY
+    if _NUMPY is None:
+        try:
+            import numpy
+
+            _NUMPY = numpy
+        except ImportError:
+            logger.debug("numpy is not available, using Python sets for result diffs.")
+            _NUMPY = False
+    return _NUMPY or None
+
+
+# Sorted set operations on numpy arrays (or sorted lists without numpy)
+def _unique(values, dtype: str):
+    np = _numpy()
+    if np is not None:
+        return np.unique(np.asarray(list(values), dtype=dtype))
+    return sorted(set(values))
+
+
+def _difference(values, other):
+    np = _numpy()
+    if np is not None:
+        return np.setdiff1d(values, other, assume_unique=True)
+    other = set(other)
+    return [value for value in values if value not in other]
+
+
+def _intersection(values, other):
+    np = _numpy()
+    if np is not None:
+        return np.intersect1d(values, other, assume_unique=True)
+    other = set(other)
+    return [value for value in values if value in other]
+
+
+def _union(values, other):
+    np = _numpy()
+    if np is not None:
+        return np.union1d(values, other)
+    return sorted(set(values) | set(other))
+
+
+class EntitySnapshot:
+    """The `EntitySnapshot` class holds the entities (IPs and domains) of a query result in compact form:
+    IPv4 addresses as sorted array of 32-bit integers, IPv6 addresses as sorted array of 128-bit integers
+    (16 bytes, big endian, so that byte order is numeric order) and domains as sorted array of strings.
+    With numpy, all set operations are vectorized."""
+
+    IPV4_DTYPE = "uint32"
+    IPV6_DTYPE = "S16"
+    DOMAIN_DTYPE = "str"
+
+    def __init__(self, ipv4=(), ipv6=(), domains=()):
+        self.ipv4 = _unique(ipv4, self.IPV4_DTYPE)
+        self.ipv6 = _unique(ipv6, self.IPV6_DTYPE)
+        self.domains = _unique(domains, self.DOMAIN_DTYPE)
+
+    @classmethod
+    def _from_sorted(cls, ipv4, ipv6, domains) -> "EntitySnapshot":
+        snapshot = cls.__new__(cls)
+        snapshot.ipv4, snapshot.ipv6, snapshot.domains = ipv4, ipv6, domains
+        return snapshot
+
+    @classmethod
+    def from_entities(
+        cls, ips: Iterable[str] = (), domains: Iterable[str] = ()
+    ) -> "EntitySnapshot":
+        ipv4, ipv6 = list(), list()
+        for ip in ips:
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                logger.warning('Ignoring invalid IP "%s" in result snapshot.', ip)
+                continue
+            if address.version == 4:
+                ipv4.append(int(address))
+            else:
+                ipv6.append(address.packed)
+        return cls(ipv4, ipv6, (domain.lower() for domain in domains if domain))
+
+    @classmethod
+    def from_com_list(cls, com_list: List["Host"]) -> "EntitySnapshot":
+        """Creates a snapshot of the IPs and domains of a list of Common OSINT Model hosts."""
+        ips, domains = list(), list()
+        for host in com_list:
+            ips.append(host.ip)
+            domains.extend(domain.domain for domain in host.domains or [])
+        return cls.from_entities(ips, domains)
+
+    @classmethod
+    def from_record(
+        cls, ipv4: bytes = None, ipv6: bytes = None, domains: str = None
+    ) -> "EntitySnapshot":
+        """Loads a snapshot from its stored form (see `to_record`)."""
+        ipv4, ipv6, domains = ipv4 or b"", ipv6 or b"", domains or ""
+        domain_list = domains.split("\n") if domains else []
+        np = _numpy()
+        if np is not None:
+            return cls._from_sorted(
+                np.frombuffer(ipv4, dtype=">u4").astype(cls.IPV4_DTYPE),
+                np.frombuffer(ipv6, dtype=cls.IPV6_DTYPE),
+                np.asarray(domain_list, dtype=cls.DOMAIN_DTYPE),
+            )
+        return cls._from_sorted(
+            [
+                int.from_bytes(ipv4[index : index + 4], "big")
+                for index in range(0, len(ipv4), 4)
+            ],
+            [ipv6[index : index + 16] for index in range(0, len(ipv6), 16)],
+            domain_list,
+        )
+
+    def to_record(self) -> tuple[bytes, bytes, str]:
+        """Returns the snapshot as (IPv4 bytes, IPv6 bytes, domains), independent of numpy being installed."""
+        np = _numpy()
+        if np is not None:
+            ipv4 = self.ipv4.astype(">u4").tobytes()
+            ipv6 = self.ipv6.astype(self.IPV6_DTYPE).tobytes()
+        else:
+            ipv4 = b"".join(value.to_bytes(4, "big") for value in self.ipv4)
+            ipv6 = b"".join(self.ipv6)
+        return ipv4, ipv6, "\n".join(str(domain) for domain in self.domains)
+
+    @property
+    def ips(self) -> List[str]:
+        # numpy strips trailing null bytes of fixed-width byte strings
+        return [str(ipaddress.IPv4Address(int(value))) for value in self.ipv4] + [
+            str(ipaddress.IPv6Address(bytes(value).ljust(16, b"\0")))
+            for value in self.ipv6
+        ]
+
+    @property
+    def domain_names(self) -> List[str]:
+        return [str(domain) for domain in self.domains]
+
+    def to_set(self) -> set:
+        """Returns IPs and domains as set of strings, for fast membership checks of single entities."""
+        return set(self.ips) | set(self.domain_names)
+
+    def to_com_list(self) -> List["Host | Domain"]:
+        """Returns the entities as (minimal) Common OSINT Model hosts and domains, e.g. for notifications."""
+        from common_osint_model import Host, Domain
+
+        return [Host(ip=ip) for ip in self.ips] + [
+            Domain(domain=domain) for domain in self.domain_names
+        ]
+
+    def union(self, other: "EntitySnapshot") -> "EntitySnapshot":
+        return EntitySnapshot._from_sorted(
+            _union(self.ipv4, other.ipv4),
+            _union(self.ipv6, other.ipv6),
+            _union(self.domains, other.domains),
+        )
+
+    def difference(self, other: "EntitySnapshot") -> "EntitySnapshot":
+        return EntitySnapshot._from_sorted(
+            _difference(self.ipv4, other.ipv4),
+            _difference(self.ipv6, other.ipv6),
+            _difference(self.domains, other.domains),
+        )
+
+    def intersection(self, other: "EntitySnapshot") -> "EntitySnapshot":
+        return EntitySnapshot._from_sorted(
+            _intersection(self.ipv4, other.ipv4),
+            _intersection(self.ipv6, other.ipv6),
+            _intersection(self.domains, other.domains),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ipv4) + len(self.ipv6) + len(self.domains)
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, EntitySnapshot)
+            and len(self) == len(other)
+            and len(self.intersection(other)) == len(self)
+        )
+
+
+class SnapshotDiff:
+    """The `SnapshotDiff` class holds the difference between the snapshots of two cycles: `added` entities
+    are new in the current cycle, `removed` entities are gone and `retained` entities are in both."""
+
+    def __init__(self, previous: EntitySnapshot, current: EntitySnapshot):
+        self.previous = previous
+        self.current = current
+        self.added = current.difference(previous)
+        self.removed = previous.difference(current)
+        self.retained = current.intersection(previous)
+
+    @classmethod
+    def merge(cls, diffs: List["SnapshotDiff"]) -> "SnapshotDiff":
+        """Merges the diffs of several queries. Entities, that are gone from one query, but still
+        in the result of another one, count as retained."""
+        previous, current = EntitySnapshot(), EntitySnapshot()
+        for diff in diffs:
+            previous = previous.union(diff.previous)
+            current = current.union(diff.current)
+        return cls(previous, current)
+
+    @property
+    def changed(self) -> bool:
+        return len(self.added) > 0 or len(self.removed) > 0
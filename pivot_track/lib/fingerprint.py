@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import re
+from typing import List, TYPE_CHECKING
+
+from pivot_track.lib.state import result_hash
+
+if TYPE_CHECKING:
+    from common_osint_model import Host
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_ATTRIBUTES = ("ports", "certificates", "jarm", "http_title", "asn")
+
+_TITLE_PATTERN = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+
+def http_title_hash(content: str) -> str:
+    """Returns the sha256 hash of the (whitespace normalized) HTML title of an HTTP response, or None if there is no title."""
+    if not content:
+        return None
+    match = _TITLE_PATTERN.search(content)
+    if match is None:
+        return None
+    title = " ".join(match.group(1).split())
+    return hashlib.sha256(title.encode("utf-8")).hexdigest()
+
+
+class HostFingerprint:
+    """The `HostFingerprint` class holds the attributes of a host, that matter for tracking: open ports,
+    certificate fingerprints (sha256), JARM fingerprints, hashes of HTTP titles and the ASN. Fingerprints
+    are compared by their digest, so that unchanged hosts cost one comparison per cycle."""
+
+    def __init__(
+        self,
+        ip: str,
+        ports=(),
+        certificates=(),
+        jarm=(),
+        http_title=(),
+        asn: int = None,
+    ):
+        self.ip = ip
+        self.attributes = {
+            "ports": sorted({int(port) for port in ports}),
+            "certificates": sorted({value for value in certificates if value}),
+            "jarm": sorted({value for value in jarm if value}),
+            "http_title": sorted({value for value in http_title if value}),
+            "asn": asn,
+        }
+        self.digest = result_hash(self.attributes)
+
+    @classmethod
+    def from_host(cls, host: "Host") -> "HostFingerprint":
+        ports = set(host.ports or [])
+        certificates, jarm, http_title = list(), list(), list()
+        for service in host.services or []:
+            ports.add(service.port)
+            if service.tls is not None:
+                jarm.append(service.tls.jarm)
+                if service.tls.certificate is not None:
+                    certificates.append(service.tls.certificate.sha256)
+            if service.http is not None and service.http.content is not None:
+                http_title.append(http_title_hash(service.http.content.raw))
+        asn = host.autonomous_system.number if host.autonomous_system else None
+        return cls(
+            host.ip,
+            ports=ports,
+            certificates=certificates,
+            jarm=jarm,
+            http_title=http_title,
+            asn=asn,
+        )
+
+    @classmethod
+    def from_dict(cls, ip: str, attributes: dict) -> "HostFingerprint":
+        return cls(
+            ip,
+            ports=attributes.get("ports") or (),
+            certificates=attributes.get("certificates") or (),
+            jarm=attributes.get("jarm") or (),
+            http_title=attributes.get("http_title") or (),
+            asn=attributes.get("asn"),
+        )
+
+    def changes(self, other: "HostFingerprint") -> List[str]:
+        """Returns the names of the attributes, that differ from another fingerprint of the host."""
+        if other is None or other.digest == self.digest:
+            return list()
+        return [
+            attribute
+            for attribute in FINGERPRINT_ATTRIBUTES
+            if self.attributes[attribute] != other.attributes[attribute]
+        ]
+
+
+class HostChange:
+    """A `HostChange` holds a tracked host, whose fingerprint changed since the last cycle."""
+
+    def __init__(
+        self,
+        host: "Host",
+        previous: HostFingerprint,
+        current: HostFingerprint,
+        attributes: List[str],
+    ):
+        self.host = host
+        self.previous = previous
+        self.current = current
+        self.attributes = attributes
+
+    def __str__(self) -> str:
+        return f"{self.host.ip} ({', '.join(self.attributes)})"
@@ -0,0 +1,116 @@
+import contextvars
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+TEXT_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+_correlation_ids = contextvars.ContextVar("pivottrack_correlation_ids", default=None)
+
+
+@contextmanager
+def correlation(**ids):
+    """Context manager, that attaches correlation IDs (e.g. `cycle_id`, `definition_id`) to all log records of its block."""
+    current = _correlation_ids.get() or dict()
+    token = _correlation_ids.set(
+        {**current, **{key: str(value) for key, value in ids.items()}}
+    )
+    try:
+        yield
+    finally:
+        _correlation_ids.reset(token)
+
+
+def correlation_ids() -> dict:
+    return dict(_correlation_ids.get() or dict())
+
+
+class CorrelationFilter(logging.Filter):
+    """Adds the current correlation IDs to log records (as `correlation` attribute)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation = _correlation_ids.get() or dict()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets only every n-th record of a call site pass, for loggers with high-frequency events.
+    Rates are configured per logger name (prefix), warnings and errors are never sampled."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = {name: int(rate) for name, rate in (rates or dict()).items()}
+        self._logger_rates = dict()
+        self._counts = dict()
+        self._lock = threading.Lock()
+
+    def _rate(self, logger_name: str) -> int:
+        rate = self._logger_rates.get(logger_name)
+        if rate is None:
+            # The longest configured prefix wins, like the logger hierarchy
+            matches = [
+                name
+                for name in self.rates
+                if logger_name == name or logger_name.startswith(f"{name}.")
+            ]
+            rate = self.rates[max(matches, key=len)] if matches else 1
+            self._logger_rates[logger_name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate <= 1:
+            return True
+        # Counting per call site keeps the state bounded, even for messages with variable content
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % rate == 0:
+            record.sample_rate = rate
+            return True
+        return False
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        correlation = getattr(record, "correlation", None)
+        if correlation:
+            entry.update(correlation)
+        sample_rate = getattr(record, "sample_rate", None)
+        if sample_rate is not None:
+            entry["sample_rate"] = sample_rate
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_handlers(handlers: list, logging_config: dict) -> list:
+    """Sets formatter and filters for the given handlers, based on the `logging` section of the configuration."""
+    logging_config = logging_config or dict()
+    if logging_config.get("format", "text") == "json":
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    sampling = logging_config.get("sampling")
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(CorrelationFilter())
+        if sampling:
+            # Every handler sees every record, so each one needs its own call site counters
+            handler.addFilter(SamplingFilter(sampling))
+    return handlers
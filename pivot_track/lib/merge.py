@@ -0,0 +1,52 @@
+import logging
+from typing import Iterable, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from common_osint_model import Host
+
+logger = logging.getLogger(__name__)
+
+
+def merge_hosts(hosts: Iterable["Host"]) -> List["Host"]:
+    """Merges hosts (e.g. of several sources) by IP. Hosts keep the order of their first appearance."""
+    groups = dict()
+    for host in hosts:
+        groups.setdefault(host.ip, list()).append(host)
+    return [merge_host(group) for group in groups.values()]
+
+
+def merge_host(hosts: List["Host"]) -> "Host":
+    """Merges hosts with the same IP to one host. Ports and domains are united, services are merged by port (the
+    first host wins on conflicts), first and last seen span all hosts and the sources are joined with commas."""
+    if len(hosts) == 1:
+        return hosts[0]
+    first = hosts[0]
+    services, domains, ports, sources = dict(), dict(), set(), dict()
+    first_seen, last_seen = list(), list()
+    autonomous_system = None
+    for host in hosts:
+        for service in host.services or []:
+            services.setdefault(service.port, service)
+        for domain in host.domains or []:
+            domains.setdefault(domain.domain, domain)
+        ports.update(host.ports or [])
+        ports.update(services)
+        if host.source:
+            sources.update(dict.fromkeys(host.source.split(",")))
+        if host.first_seen is not None:
+            first_seen.append(host.first_seen)
+        if host.last_seen is not None:
+            last_seen.append(host.last_seen)
+        if autonomous_system is None:
+            autonomous_system = host.autonomous_system
+    return first.model_copy(
+        update={
+            "services": list(services.values()),
+            "domains": list(domains.values()),
+            "ports": sorted(ports),
+            "source": ",".join(sources) or None,
+            "first_seen": min(first_seen) if first_seen else None,
+            "last_seen": max(last_seen) if last_seen else None,
+            "autonomous_system": autonomous_system,
+        }
+    )
@@ -0,0 +1,284 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Parent class for metrics. Values are kept per combination of label values."""
+
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels.keys()) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} requires labels {self.labelnames}, got {tuple(labels.keys())}."
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+    def clear(self):
+        with self._lock:
+            self._values = dict()
+
+    def samples(self) -> list:
+        """Returns (name, labels, value) tuples for the text exposition format."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only be increased.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list:
+        with self._lock:
+            return [
+                (self.name, self._labels(key), value)
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list:
+        with self._lock:
+            return [
+                (self.name, self._labels(key), value)
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            bucket_counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[index] += 1
+            self._values[key] = (bucket_counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager, that observes the duration of its block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        value = self.value(**labels)
+        return value[2] if value is not None else 0
+
+    def sum(self, **labels) -> float:
+        value = self.value(**labels)
+        return value[1] if value is not None else 0.0
+
+    def samples(self) -> list:
+        samples = list()
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._values.items()):
+                labels = self._labels(key)
+                for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                    samples.append(
+                        (
+                            f"{self.name}_bucket",
+                            {**labels, "le": _format_value(upper_bound)},
+                            bucket_count,
+                        )
+                    )
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """The `MetricsRegistry` class holds all metrics of a Pivot Track process and renders them in the
+    Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = dict()
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise ValueError(
+                    f"Metric {name} is already registered as {metric.TYPE}."
+                )
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, documentation, labelnames, buckets=buckets
+        )
+
+    def get(self, name: str) -> Metric:
+        return self._metrics.get(name)
+
+    def clear(self):
+        """Resets the values of all metrics (the metrics stay registered)."""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def write_textfile(self, path: Path):
+        """Writes all metrics to a file for the textfile collector of a local Prometheus node exporter."""
+        path = Path(path)
+        temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temporary_path.write_text(self.render())
+        # The rename is atomic, so the collector never reads a partially written file
+        os.replace(temporary_path, path)
+        logger.debug('Wrote metrics to textfile "%s".', path)
+
+
+registry = MetricsRegistry()
+
+
+class MetricsServer:
+    """The `MetricsServer` class serves the metrics of a registry as Prometheus text endpoint (/metrics) in a background thread."""
+
+    def __init__(
+        self,
+        port: int,
+        address: str = "127.0.0.1",
+        metrics_registry: MetricsRegistry = registry,
+    ):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics_registry_ = metrics_registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                payload = metrics_registry_.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug("Metrics endpoint: " + format, *args)
+
+        self.server = ThreadingHTTPServer((address, port), MetricsHandler)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="pivottrack-metrics", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def start(self):
+        logger.info("Serving metrics on port %s.", self.port)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def init_metrics(config: dict) -> MetricsServer:
+    """Starts the metrics endpoint, if the `metrics` section of the configuration contains a port."""
+    metrics_config = (config or dict()).get("metrics") or dict()
+    if metrics_config.get("port") is None:
+        return None
+    return MetricsServer(
+        port=metrics_config["port"],
+        address=metrics_config.get("address", "127.0.0.1"),
+    ).start()
@@ -0,0 +1,415 @@
+import ipaddress
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, TYPE_CHECKING
+
+from pivot_track.lib import metrics, profiling
+from pivot_track.lib.cache import QueryCache
+from pivot_track.lib.connectors import HostQuery
+from pivot_track.lib.fingerprint import HostFingerprint
+from pivot_track.lib.merge import merge_hosts
+from pivot_track.lib.query import Querying
+
+if TYPE_CHECKING:
+    from common_osint_model import Host
+
+logger = logging.getLogger(__name__)
+
+PIVOT_QUERIES = metrics.registry.counter(
+    "pivottrack_pivot_queries_total",
+    "Queries executed by the pivot engine, by status (ok, error, skipped).",
+    ["source", "command", "status"],
+)
+PIVOT_NODES = metrics.registry.counter(
+    "pivottrack_pivot_nodes_total",
+    "Nodes found by the pivot engine.",
+    ["kind"],
+)
+
+# Kinds of nodes of the pivot graph
+IP = "ip"
+DOMAIN = "domain"
+CERTIFICATE = "certificate"
+JARM = "jarm"
+ASN = "asn"
+KINDS = (IP, DOMAIN, CERTIFICATE, JARM, ASN)
+
+_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_JARM_PATTERN = re.compile(r"^[0-9a-f]{62}$")
+
+# Searches for the attributes of found hosts, if the configuration has no pivot rules
+DEFAULT_RULES = [
+    {"kind": CERTIFICATE, "source": "shodan", "query": "ssl.cert.fingerprint:{value}"},
+    {
+        "kind": CERTIFICATE,
+        "source": "censys",
+        "query": "services.tls.certificates.leaf_data.fingerprint: {value}",
+    },
+    {"kind": JARM, "source": "shodan", "query": "ssl.jarm:{value}"},
+    {"kind": JARM, "source": "censys", "query": "services.jarm.fingerprint: {value}"},
+    {"kind": DOMAIN, "source": "shodan", "query": "hostname:{value}"},
+    {"kind": DOMAIN, "source": "censys", "query": "dns.names: {value}"},
+]
+
+
+def node_id(kind: str, value) -> str:
+    return f"{kind}:{value}"
+
+
+def parse_seed(seed: str) -> tuple[str, str]:
+    """Returns the kind and value of a seed. Seeds are IPs, certificate fingerprints (sha256), JARM fingerprints
+    or domains, other kinds are given with a prefix (e.g. "asn:15169")."""
+    seed = seed.strip()
+    try:
+        return IP, str(ipaddress.ip_address(seed))
+    except ValueError:
+        pass
+    kind, separator, value = seed.partition(":")
+    if separator and kind.lower() in KINDS:
+        return parse_seed(value) if kind.lower() == IP else (kind.lower(), value)
+    if _SHA256_PATTERN.match(seed.lower()):
+        return CERTIFICATE, seed.lower()
+    if _JARM_PATTERN.match(seed.lower()):
+        return JARM, seed.lower()
+    return DOMAIN, seed.lower()
+
+
+def host_attributes(host: "Host") -> dict:
+    """Returns the values of a host, that can be pivoted on, by kind of node."""
+    fingerprint = HostFingerprint.from_host(host)
+    asn = fingerprint.attributes["asn"]
+    return {
+        DOMAIN: sorted(
+            {domain.domain.lower() for domain in host.domains or [] if domain.domain}
+        ),
+        CERTIFICATE: fingerprint.attributes["certificates"],
+        JARM: fingerprint.attributes["jarm"],
+        ASN: [asn] if asn is not None else [],
+    }
+
+
+class PivotRule:
+    """A `PivotRule` searches a source for the hosts, that share an attribute (the kind of node) with a found
+    host. The query is a template, "{value}" is replaced by the value of the node."""
+
+    def __init__(self, kind: str, source: str, query: str, name: str = None):
+        if kind not in KINDS or kind == IP:
+            raise ValueError(f'Pivot rules can not search for nodes of kind "{kind}".')
+        self.kind = kind
+        self.source = source
+        self.query = query
+        self.name = name or f"{source}_{kind}"
+
+    @classmethod
+    def from_dict(cls, rule: dict) -> "PivotRule":
+        return cls(
+            kind=rule["kind"],
+            source=rule["source"],
+            query=rule["query"],
+            name=rule.get("name"),
+        )
+
+    def search(self, value) -> str:
+        return self.query.format(value=value)
+
+
+class PivotNode:
+    """A `PivotNode` is an entity of the pivot graph: a host (IP) or one of its attributes."""
+
+    def __init__(self, kind: str, value, depth: int, source: str = None):
+        self.kind = kind
+        self.value = value
+        self.depth = depth
+        self.source = source
+
+    @property
+    def id(self) -> str:
+        return node_id(self.kind, self.value)
+
+    def to_dict(self) -> dict:
+        return {
+            "type": "node",
+            "id": self.id,
+            "kind": self.kind,
+            "value": self.value,
+            "depth": self.depth,
+            "source": self.source,
+        }
+
+
+class PivotEdge:
+    """A `PivotEdge` connects a host with one of its attributes. The relation is "has_<kind>" for attributes
+    of a host, or the name of the pivot rule, that found the host."""
+
+    def __init__(self, source_id: str, target_id: str, relation: str, source: str):
+        self.source_id = source_id
+        self.target_id = target_id
+        self.relation = relation
+        self.source = source
+
+    def to_dict(self) -> dict:
+        return {
+            "type": "edge",
+            "from": self.source_id,
+            "to": self.target_id,
+            "relation": self.relation,
+            "source": self.source,
+        }
+
+
+class PivotEngine:
+    """The `PivotEngine` class expands seeds breadth-first: IPs are looked up on every source, other nodes are
+    searched with the pivot rules of their kind, and the attributes of the found hosts are the next level. Every
+    node is expanded, and every query is executed, once (a global visited set). The queries of a level run
+    concurrently (`workers`), under the rate limits of the sources. The expansion stops at `max_depth` levels,
+    after `max_credits` estimated API credits, after `max_seconds` or at `max_nodes` nodes, whatever comes first."""
+
+    def __init__(
+        self,
+        source_connections: List[HostQuery],
+        rules: List[PivotRule] = None,
+        cache: QueryCache = None,
+        max_depth: int = 2,
+        max_credits: int = None,
+        max_seconds: float = None,
+        max_nodes: int = 1000,
+        workers: int = 4,
+    ):
+        self.source_connections = {
+            connection.short_name: connection for connection in source_connections
+        }
+        self.rules = (
+            rules
+            if rules is not None
+            else [PivotRule.from_dict(rule) for rule in DEFAULT_RULES]
+        )
+        self.cache = cache
+        self.max_depth = max_depth
+        self.max_credits = max_credits
+        self.max_seconds = max_seconds
+        self.max_nodes = max_nodes
+        self.workers = workers
+        self.nodes = dict()
+        self.edges = set()
+        self.queries = set()
+        self.credits = 0
+        self.skipped = 0
+        self.stop_reason = None
+
+    @classmethod
+    def from_config(
+        cls, config: dict, source_connections: List[HostQuery], cache=None, **options
+    ) -> "PivotEngine":
+        """Returns a `PivotEngine` with the settings of the `pivot` section of the configuration. Options,
+        that are not None (e.g. of the command line), override the configuration."""
+        pivot_config = (config or dict()).get("pivot") or dict()
+        settings = {
+            key: pivot_config[key]
+            for key in (
+                "max_depth",
+                "max_credits",
+                "max_seconds",
+                "max_nodes",
+                "workers",
+            )
+            if key in pivot_config
+        }
+        settings.update(
+            {key: value for key, value in options.items() if value is not None}
+        )
+        rules = pivot_config.get("rules")
+        return cls(
+            source_connections,
+            rules=[PivotRule.from_dict(rule) for rule in rules]
+            if rules is not None
+            else None,
+            cache=cache,
+            **settings,
+        )
+
+    def run(self, seeds: List[str]) -> Iterator[PivotNode | PivotEdge]:
+        """Expands the seeds and yields nodes and edges of the graph, as they are found."""
+        deadline = (
+            time.monotonic() + self.max_seconds
+            if self.max_seconds is not None
+            else None
+        )
+        frontier = list()
+        for seed in seeds:
+            kind, value = parse_seed(seed)
+            node = self._add_node(kind, value, 0)
+            if node is not None:
+                frontier.append(node)
+                yield node
+        depth = 0
+        while frontier and depth < self.max_depth:
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = "time"
+                break
+            logger.info(
+                "Pivot level %d: expanding %d node(s).", depth + 1, len(frontier)
+            )
+            next_frontier = list()
+            with profiling.span("pivot_level", depth=depth + 1):
+                for element in self._expand(frontier, depth + 1, deadline):
+                    if isinstance(element, PivotNode) and element.kind != IP:
+                        next_frontier.append(element)
+                    yield element
+            frontier = next_frontier
+            depth += 1
+        if frontier and self.stop_reason is None:
+            self.stop_reason = "depth"
+        logger.info(
+            "Pivoting done: %d node(s), %d edge(s), %d query(s), %d credit(s).",
+            len(self.nodes),
+            len(self.edges),
+            len(self.queries),
+            self.credits,
+        )
+
+    def _tasks(self, frontier: List[PivotNode]) -> list:
+        """Returns the queries (node, rule, connection, command, query) for the nodes of a level. Queries, that
+        were executed before or exceed the credit budget, are skipped."""
+        tasks = list()
+        for node in frontier:
+            if node.kind == IP:
+                candidates = [
+                    (None, connection, "host", node.value)
+                    for connection in self.source_connections.values()
+                ]
+            else:
+                candidates = [
+                    (
+                        rule,
+                        self.source_connections[rule.source],
+                        "generic",
+                        rule.search(node.value),
+                    )
+                    for rule in self.rules
+                    if rule.kind == node.kind and rule.source in self.source_connections
+                ]
+            for rule, connection, command, query in candidates:
+                key = (connection.short_name, command, query)
+                if key in self.queries:
+                    continue
+                cost = connection._credit_cost(command)
+                if (
+                    self.max_credits is not None
+                    and self.credits + cost > self.max_credits
+                ):
+                    self.skipped += 1
+                    self.stop_reason = "credits"
+                    PIVOT_QUERIES.inc(
+                        source=connection.short_name, command=command, status="skipped"
+                    )
+                    continue
+                self.queries.add(key)
+                self.credits += cost
+                tasks.append((node, rule, connection, command, query))
+        return tasks
+
+    def _query(self, connection: HostQuery, command: str, query: str) -> list:
+        if command == "host":
+            query_result = Querying.host(query, connection, cache=self.cache)
+        else:
+            query_result, _ = Querying.host_query(query, connection, cache=self.cache)
+        if query_result is None or query_result.raw_result is None:
+            return list()
+        com_result = query_result.com_result
+        return com_result if isinstance(com_result, list) else [com_result]
+
+    def _expand(
+        self, frontier: List[PivotNode], depth: int, deadline: float = None
+    ) -> Iterator[PivotNode | PivotEdge]:
+        tasks = self._tasks(frontier)
+        with ThreadPoolExecutor(
+            max_workers=max(self.workers, 1), thread_name_prefix="pivottrack-pivot"
+        ) as executor:
+            query_source = profiling.propagate(self._query)
+            futures = {
+                executor.submit(query_source, connection, command, query): (
+                    node,
+                    rule,
+                    connection,
+                    command,
+                )
+                for node, rule, connection, command, query in tasks
+            }
+            # The graph is only changed in this thread
+            for future in as_completed(futures):
+                node, rule, connection, command = futures[future]
+                source = connection.short_name
+                if future.cancelled():
+                    PIVOT_QUERIES.inc(source=source, command=command, status="skipped")
+                    self.skipped += 1
+                    continue
+                try:
+                    hosts = future.result()
+                except Exception as e:
+                    logger.error('Pivot query on source "%s" failed: %s', source, e)
+                    logger.debug("Source exception:", exc_info=True)
+                    PIVOT_QUERIES.inc(source=source, command=command, status="error")
+                    continue
+                PIVOT_QUERIES.inc(source=source, command=command, status="ok")
+                for host in merge_hosts(hosts):
+                    yield from self._add_host(host, node, rule, depth, source)
+                if (
+                    deadline is not None
+                    and time.monotonic() >= deadline
+                    and self.stop_reason != "time"
+                ):
+                    # Queries, that did not start yet, are not executed anymore
+                    self.stop_reason = "time"
+                    for pending in futures:
+                        pending.cancel()
+
+    def _add_host(
+        self, host: "Host", node: PivotNode, rule: PivotRule, depth: int, source: str
+    ) -> Iterator[PivotNode | PivotEdge]:
+        host_id = node_id(IP, host.ip)
+        if node.kind != IP:
+            # The host was found by a search for the attribute
+            host_node = self._add_node(IP, host.ip, depth, source)
+            if host_node is not None:
+                yield host_node
+            edge = self._add_edge(node.id, host_id, rule.name, source)
+            if edge is not None:
+                yield edge
+        elif host_id not in self.nodes:
+            return
+        for kind, values in host_attributes(host).items():
+            for value in values:
+                attribute_node = self._add_node(kind, value, depth, source)
+                if attribute_node is not None:
+                    yield attribute_node
+                edge = self._add_edge(
+                    host_id, node_id(kind, value), f"has_{kind}", source
+                )
+                if edge is not None:
+                    yield edge
+
+    def _add_node(self, kind: str, value, depth: int, source: str = None) -> PivotNode:
+        """Adds a node to the graph. Returns None, if it is known already (or the graph is full)."""
+        if node_id(kind, value) in self.nodes:
+            return None
+        if self.max_nodes is not None and len(self.nodes) >= self.max_nodes:
+            self.stop_reason = "nodes"
+            return None
+        node = PivotNode(kind, value, depth, source)
+        self.nodes[node.id] = node
+        PIVOT_NODES.inc(kind=kind)
+        profiling.count("pivot_nodes")
+        return node
+
+    def _add_edge(
+        self, source_id: str, target_id: str, relation: str, source: str
+    ) -> PivotEdge:
+        if source_id not in self.nodes or target_id not in self.nodes:
+            return None
+        key = (source_id, target_id, relation)
+        if key in self.edges:
+            return None
+        self.edges.add(key)
+        return PivotEdge(source_id, target_id, relation, source)
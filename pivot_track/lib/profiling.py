@@ -0,0 +1,254 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_active_profiler = contextvars.ContextVar("pivottrack_profiler", default=None)
+# The current span and its running memory frame [traced bytes at start, peak traced bytes]
+_current_span = contextvars.ContextVar("pivottrack_span", default=(None, None))
+
+
+class Span:
+    """A `Span` holds the timings of one stage. Repeated calls of the same stage (same name and labels)
+    below the same parent are merged into one span, so that per-element stages (e.g. the new-element
+    check of thousands of hosts) keep the report small."""
+
+    def __init__(self, name: str, labels: dict = None):
+        self.name = name
+        self.labels = labels or dict()
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.peak_memory_bytes = None
+        self.children = dict()
+
+    def child(self, name: str, labels: dict) -> "Span":
+        labels = {label: str(value) for label, value in labels.items()}
+        key = (name, tuple(sorted(labels.items())))
+        span = self.children.get(key)
+        if span is None:
+            span = self.children.setdefault(key, Span(name, labels))
+        return span
+
+    def to_dict(self) -> dict:
+        span_dict = {
+            "name": self.name,
+            "labels": self.labels,
+            "count": self.count,
+            "seconds": self.seconds,
+            "max_seconds": self.max_seconds,
+        }
+        if self.peak_memory_bytes is not None:
+            span_dict["peak_memory_bytes"] = self.peak_memory_bytes
+        if self.children:
+            span_dict["children"] = [
+                child.to_dict() for child in self.children.values()
+            ]
+        return span_dict
+
+    def walk(self):
+        for child in self.children.values():
+            yield child
+            yield from child.walk()
+
+
+class Profiler:
+    """The `Profiler` class records span timings (and optionally tracemalloc peaks and a cProfile)
+    for one run of a command, i.e. one tracking cycle or one query. It is activated as context
+    manager; library code reports its stages with `profiling.span`, which does nothing while no
+    profiler is active."""
+
+    def __init__(self, command: str, trace_memory: bool = True, cprofile: bool = False):
+        self.command = command
+        self.trace_memory = trace_memory
+        self.cprofile = cprofile
+        self.root = Span(command)
+        self.counters = dict()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._started_tracemalloc = False
+        self._tokens = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.started = datetime.now(timezone.utc)
+        self._start_counter = time.perf_counter()
+        memory_frame = None
+        if self.trace_memory:
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            memory_frame = [current, current]
+        if self.cprofile:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._tokens = (
+            _active_profiler.set(self),
+            _current_span.set((self.root, memory_frame)),
+        )
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        seconds = time.perf_counter() - self._start_counter
+        self.root.count, self.root.seconds, self.root.max_seconds = 1, seconds, seconds
+        if self.trace_memory:
+            import tracemalloc
+
+            _, memory_frame = _current_span.get()
+            if memory_frame is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                self.root.peak_memory_bytes = (
+                    max(memory_frame[1], peak) - memory_frame[0]
+                )
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        _active_profiler.reset(self._tokens[0])
+        _current_span.reset(self._tokens[1])
+        self.finished = datetime.now(timezone.utc)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        parent, parent_memory_frame = _current_span.get()
+        with self._lock:
+            node = (parent or self.root).child(name, labels)
+
+        memory_frame = None
+        if self.trace_memory and parent_memory_frame is not None:
+            import tracemalloc
+
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak is global, so the peak seen so far is saved for the parent before resetting it
+            parent_memory_frame[1] = max(parent_memory_frame[1], peak)
+            tracemalloc.reset_peak()
+            memory_frame = [current, current]
+
+        token = _current_span.set((node, memory_frame))
+        start = time.perf_counter()
+        try:
+            yield node
+        finally:
+            seconds = time.perf_counter() - start
+            _current_span.reset(token)
+            peak_memory = None
+            if memory_frame is not None:
+                import tracemalloc
+
+                _, peak = tracemalloc.get_traced_memory()
+                peak = max(memory_frame[1], peak)
+                parent_memory_frame[1] = max(parent_memory_frame[1], peak)
+                peak_memory = peak - memory_frame[0]
+            with self._lock:
+                node.count += 1
+                node.seconds += seconds
+                node.max_seconds = max(node.max_seconds, seconds)
+                if peak_memory is not None:
+                    node.peak_memory_bytes = max(
+                        node.peak_memory_bytes or 0, peak_memory
+                    )
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def stages(self) -> dict:
+        """Returns the spans aggregated by stage name."""
+        stages = dict()
+        for node in self.root.walk():
+            stage = stages.setdefault(
+                node.name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            stage["count"] += node.count
+            stage["seconds"] += node.seconds
+            stage["max_seconds"] = max(stage["max_seconds"], node.max_seconds)
+            if node.peak_memory_bytes is not None:
+                stage["peak_memory_bytes"] = max(
+                    stage.get("peak_memory_bytes", 0), node.peak_memory_bytes
+                )
+        return stages
+
+    def report(self) -> dict:
+        report = {
+            "command": self.command,
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "seconds": self.root.seconds,
+            "counters": self.counters,
+            "stages": self.stages(),
+            "spans": [child.to_dict() for child in self.root.children.values()],
+        }
+        if self.root.peak_memory_bytes is not None:
+            report["peak_memory_bytes"] = self.root.peak_memory_bytes
+        return report
+
+    def write_report(self, directory: Path) -> Path:
+        """Writes the JSON run report (and the cProfile stats, if enabled) to the given directory and returns the report path."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        timestamp = (self.started or datetime.now(timezone.utc)).strftime(
+            "%Y%m%dT%H%M%S%fZ"
+        )
+        report_path = directory / f"{self.command}-{timestamp}.json"
+        report_path.write_text(json.dumps(self.report(), indent=2))
+        if self._cprofile is not None:
+            stats_path = report_path.with_suffix(".pstats")
+            self._cprofile.dump_stats(stats_path)
+            logger.info('Wrote cProfile stats to "%s".', stats_path)
+        logger.info('Wrote run report to "%s".', report_path)
+        return report_path
+
+
+def active_profiler() -> Profiler:
+    return _active_profiler.get()
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Context manager, that records its block as span of the active profiler (if any)."""
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield None
+        return
+    with profiler.span(name, **labels) as node:
+        yield node
+
+
+def propagate(function):
+    """Returns a callable, that runs `function` in a copy of the current context. Context variables (and with
+    them the active profiler and span) are not passed to worker threads, so calls handed to a thread pool are
+    wrapped with this function to record their spans below the span of the caller."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # Every call gets its own copy, as one context can not be entered by several threads at once
+        return context.copy().run(function, *args, **kwargs)
+
+    return run
+
+
+def count(name: str, amount: int = 1):
+    """Adds to a counter of the run report of the active profiler (if any)."""
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.count(name, amount)
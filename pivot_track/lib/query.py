@@ -1,18 +1,36 @@
+import ipaddress
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from typing import Callable, Iterable, Iterator, List, TYPE_CHECKING
 
 from .connectors import (
     HostQuery,
+    OutputConnector,
     ShodanSourceConnector,
     CensysSourceConnector,
     SourceConnector,
-    OpenSearchConnector,
-    CLIPrinter,
-    JSONPrinter,
 )
-from common_osint_model import Host
+from .cache import QueryCache
+from .connections import ConnectionManager
+from . import metrics, profiling
+
+if TYPE_CHECKING:
+    from common_osint_model import Host
 
 logger = logging.getLogger(__name__)
 
+CONVERSION_SECONDS = metrics.registry.histogram(
+    "pivottrack_conversion_seconds",
+    "Time spent converting raw source results to the Common OSINT Model.",
+    ["source"],
+)
+QUERIES = metrics.registry.counter(
+    "pivottrack_queries_total",
+    "Queries executed through Querying, by query cache result.",
+    ["source", "command", "cache"],
+)
+
 
 class QueryResult:
     def __init__(
@@ -21,29 +39,48 @@ class QueryResult:
         self.raw_result = raw_query_result
         self.query_command = query_command
         self.search_term = search_term
+        self._com_result = None
 
     @property
-    def com_result(self) -> Host | list[Host]:
-        logger.info("Convert raw data to Common OSINT Model.")
+    def com_result(self) -> "Host | list[Host]":
+        # The conversion is done once, outputs and the result diff of tracking share its result
+        if self._com_result is None:
+            self._com_result = self._convert()
+        return self._com_result
+
+    def _convert(self) -> "Host | list[Host]":
+        from common_osint_model import Host
+
+        logger.debug("Convert raw data to Common OSINT Model.")
         if self.source is ShodanSourceConnector:
             logger.debug("Trying to convert raw Shodan result to Common OSINT Model.")
-            return (
-                Host.from_shodan(self.raw_result)
-                if not self.is_collection
-                else [
-                    Host.from_shodan(element) for element in self.raw_result["matches"]
-                ]
-            )
+            with (
+                CONVERSION_SECONDS.time(source="shodan"),
+                profiling.span("conversion", source="shodan"),
+            ):
+                return (
+                    Host.from_shodan(self.raw_result)
+                    if not self.is_collection
+                    else [
+                        Host.from_shodan(element)
+                        for element in self.raw_result["matches"]
+                    ]
+                )
         elif self.source is CensysSourceConnector:
             logger.debug("Trying to convert raw Censys result to Common OSINT Model")
-            return (
-                Host.from_censys(self.raw_result)
-                if not self.is_collection
-                else [Host.from_censys(element) for element in self.raw_result]
-            )
+            with (
+                CONVERSION_SECONDS.time(source="censys"),
+                profiling.span("conversion", source="censys"),
+            ):
+                return (
+                    Host.from_censys(self.raw_result)
+                    if not self.is_collection
+                    else [Host.from_censys(element) for element in self.raw_result]
+                )
         else:
-            logger.warn(
-                f"No Common OSINT Model translation available for {self.source.__name__}. Raising NotImplementedError Exception."
+            logger.warning(
+                "No Common OSINT Model translation available for %s. Raising NotImplementedError Exception.",
+                self.source.__name__ if self.source is not None else None,
             )
             raise NotImplementedError
 
@@ -69,8 +106,10 @@ class QueryResult:
             ):
                 return ShodanSourceConnector
             else:
-                logger.warn("Could not determine SourceConnector type.")
-                print(self.raw_result)
+                logger.warning(
+                    "Could not determine SourceConnector type for result with keys %s.",
+                    list(self.raw_result.keys())[:20],
+                )
                 return None
         elif isinstance(self.raw_result, list):
             return CensysSourceConnector
@@ -96,27 +135,263 @@ class QueryResult:
             return 1  # Case for only one element (no collection)
 
 
+class MergedQueryResult(QueryResult):
+    """A `MergedQueryResult` holds the hosts of several query results (e.g. of the same query on several sources),
+    merged by IP. It has no raw result."""
+
+    def __init__(
+        self,
+        query_results: List[QueryResult],
+        query_command: str = "",
+        search_term: str = "",
+    ):
+        super().__init__(None, query_command=query_command, search_term=search_term)
+        self.query_results = query_results
+
+    def _convert(self) -> "list[Host]":
+        from .merge import merge_hosts
+
+        com_list = list()
+        for query_result in self.query_results:
+            if query_result is None or query_result.raw_result is None:
+                continue
+            if query_result.is_collection:
+                com_list.extend(query_result.com_result)
+            else:
+                com_list.append(query_result.com_result)
+        return merge_hosts(com_list)
+
+    @property
+    def source(self) -> SourceConnector:
+        return None
+
+    @property
+    def is_collection(self) -> bool:
+        return True
+
+    @property
+    def element_count(self) -> int:
+        return len(self.com_result)
+
+
 class Querying:
-    def host(host: str, connection: HostQuery) -> QueryResult:
+    def _source_call(
+        connection: HostQuery,
+        command: str,
+        query: str,
+        cache: QueryCache = None,
+        refresh: bool = False,
+    ):
+        """This function executes a source call, served from (and stored to) the query cache if one is provided."""
+        source = connection.short_name
+        if cache is not None and not refresh:
+            cached_result = cache.get(source, command, query)
+            if cached_result is not None:
+                logger.info(
+                    'Serving %s query "%s" for %s from cache.', command, query, source
+                )
+                QUERIES.inc(source=source, command=command, cache="hit")
+                return cached_result
+        QUERIES.inc(
+            source=source,
+            command=command,
+            cache="disabled" if cache is None else "miss",
+        )
+
+        with profiling.span("source_request", source=source, command=command):
+            if command == "host":
+                conn_result = connection.query_host(query)
+            else:
+                conn_result = connection.query_host_search(query)
+
+        if cache is not None:
+            cache.set(source, command, query, conn_result)
+        return conn_result
+
+    def host(
+        host: str,
+        connection: HostQuery,
+        cache: QueryCache = None,
+        refresh: bool = False,
+    ) -> QueryResult:
         if (
             connection is not None
             and isinstance(connection, HostQuery)
             and isinstance(host, str)
         ):
             logger.info(
-                f'Query for "{host}" with service {connection.__class__.__name__}.'
+                'Query for "%s" with service %s.', host, connection.__class__.__name__
             )
             return QueryResult(
-                connection.query_host(host), query_command="host", search_term=host
+                Querying._source_call(
+                    connection, "host", host, cache=cache, refresh=refresh
+                ),
+                query_command="host",
+                search_term=host,
             )
         else:
-            logger.warn(
+            logger.warning(
+                "Did not find connector. Raising NotImplementedError Exception."
+            )
+            raise NotImplementedError("Did not find HostQuery connector.")
+
+    def fan_out(
+        connections: List[HostQuery], call: Callable
+    ) -> Iterator[tuple[HostQuery, object]]:
+        """This function runs `call(connection)` for all connections concurrently (e.g. the same query on several
+        sources) and yields (connection, result) pairs as they arrive. Failed calls are logged and skipped."""
+        with ThreadPoolExecutor(
+            max_workers=max(len(connections), 1),
+            thread_name_prefix="pivottrack-sources",
+        ) as executor:
+            futures = {
+                executor.submit(profiling.propagate(call), connection): connection
+                for connection in connections
+            }
+            for future in as_completed(futures):
+                connection = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(
+                        'Query on source "%s" failed: %s', connection.short_name, e
+                    )
+                    logger.debug("Source exception:", exc_info=True)
+                    continue
+                logger.info('Got result of source "%s".', connection.short_name)
+                yield connection, result
+
+    def read_hosts(lines: Iterable[str]) -> List[str]:
+        """This function reads hosts (IPs) from lines, e.g. of a file or stdin. Hosts may be separated by
+        whitespace or commas, "#" starts a comment. Invalid IPs are skipped, duplicates are removed (in order)."""
+        hosts = dict()
+        for line in lines:
+            for token in line.split("#", 1)[0].replace(",", " ").split():
+                try:
+                    hosts[str(ipaddress.ip_address(token))] = None
+                except ValueError:
+                    logger.warning(
+                        'Skipping "%s", because it is not an IP address.', token
+                    )
+        return list(hosts)
+
+    def hosts(
+        hosts: List[str],
+        connection: HostQuery,
+        cache: QueryCache = None,
+        refresh: bool = False,
+        workers: int = 4,
+        bulk_size: int = None,
+    ) -> Iterator[List[QueryResult]]:
+        """This function queries many hosts and yields the results in batches, as soon as they arrive. Cached hosts are
+        served first, the others are requested in chunks of `bulk_size` through the bulk endpoint of the source (or one
+        by one, if the source has none), with `workers` concurrent requests under the rate limit of the source."""
+        if connection is None or not isinstance(connection, HostQuery):
+            logger.warning(
                 "Did not find connector. Raising NotImplementedError Exception."
             )
             raise NotImplementedError("Did not find HostQuery connector.")
+        source = connection.short_name
+        missing = list()
+        cached = list()
+        for host in dict.fromkeys(hosts):
+            raw_result = (
+                cache.get(source, "host", host)
+                if cache is not None and not refresh
+                else None
+            )
+            if raw_result is None:
+                missing.append(host)
+                continue
+            QUERIES.inc(source=source, command="host", cache="hit")
+            cached.append(
+                QueryResult(raw_result, query_command="host", search_term=host)
+            )
+        if cached:
+            logger.info("Serving %d host(s) from cache.", len(cached))
+            yield cached
+        if not missing:
+            return
+
+        bulk_size = max(bulk_size or connection.HOST_BULK_SIZE, 1)
+        chunks = [
+            missing[start : start + bulk_size]
+            for start in range(0, len(missing), bulk_size)
+        ]
+        logger.info(
+            "Query %d host(s) in %d request(s) with service %s.",
+            len(missing),
+            len(chunks),
+            connection.__class__.__name__,
+        )
+        with ThreadPoolExecutor(
+            max_workers=max(workers, 1), thread_name_prefix="pivottrack-hosts"
+        ) as executor:
+            host_chunk = profiling.propagate(Querying._host_chunk)
+            futures = {
+                executor.submit(host_chunk, chunk, connection): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                QUERIES.inc(
+                    len(futures[future]),
+                    source=source,
+                    command="host",
+                    cache="disabled" if cache is None else "miss",
+                )
+                try:
+                    raw_results = future.result()
+                except Exception as e:
+                    # One failed chunk does not end the batch
+                    logger.error(
+                        'Query of %d host(s) on source "%s" failed: %s',
+                        len(futures[future]),
+                        source,
+                        e,
+                    )
+                    logger.debug("Source exception:", exc_info=True)
+                    continue
+                results = list()
+                for host in futures[future]:
+                    raw_result = raw_results.get(host)
+                    if raw_result is None or (
+                        isinstance(raw_result, dict) and "error" in raw_result
+                    ):
+                        # Errors of bulk endpoints (e.g. unknown hosts) are not cached
+                        logger.info('Did not get information for host "%s".', host)
+                        continue
+                    # The cache is written from this thread only
+                    if cache is not None:
+                        cache.set(source, "host", host, raw_result)
+                    results.append(
+                        QueryResult(raw_result, query_command="host", search_term=host)
+                    )
+                if results:
+                    yield results
+
+    def _host_chunk(chunk: List[str], connection: HostQuery) -> dict:
+        """This function requests one chunk of hosts. Returns a dictionary of host to raw result."""
+        source = connection.short_name
+        raw_results = None
+        with profiling.span("source_request", source=source, command="host"):
+            if len(chunk) > 1:
+                raw_results = connection.query_hosts(chunk)
+            if raw_results is None:
+                # Sources without bulk endpoint, single hosts and failed bulk calls. Hosts, that a bulk call did
+                # not return, are unknown to the source and are not looked up again.
+                raw_results = dict()
+                for host in chunk:
+                    raw_result = connection.query_host(host)
+                    if raw_result is not None:
+                        raw_results[host] = raw_result
+        return raw_results
 
     def host_query(
-        search: str, connection: HostQuery, expand=False
+        search: str,
+        connection: HostQuery,
+        expand=False,
+        cache: QueryCache = None,
+        refresh: bool = False,
     ) -> QueryResult | tuple[QueryResult, QueryResult]:
         if (
             connection is not None
@@ -124,9 +399,13 @@ class Querying:
             and isinstance(search, str)
         ):
             logger.info(
-                f'Search for "{search}" with service {connection.__class__.__name__}.'
+                'Search for "%s" with service %s.',
+                search,
+                connection.__class__.__name__,
+            )
+            conn_result = Querying._source_call(
+                connection, "generic", search, cache=cache, refresh=refresh
             )
-            conn_result = connection.query_host_search(search)
             if conn_result is not None:
                 query_result = QueryResult(
                     conn_result, query_command="generic", search_term=search
@@ -134,36 +413,107 @@ class Querying:
                 if not expand:
                     return (query_result, None)
                 else:
-                    com_elements = (
-                        query_result.com_result
-                        if query_result.is_collection
-                        else [query_result.com_result]
-                    )
                     return (
                         query_result,
-                        [
-                            Querying.host(host=com_element.ip, connection=connection)
-                            for com_element in com_elements
-                        ],
+                        Querying.expand(
+                            query_result, connection, cache=cache, refresh=refresh
+                        ),
                     )
             else:
                 return (None, None)
         else:
-            logger.warn(
+            logger.warning(
                 "Did not find connector. Raising NotImplementedError Exception."
             )
             raise NotImplementedError("Did not find HostQuery connector.")
 
+    def expand(
+        query_result: QueryResult,
+        connection: HostQuery,
+        cache: QueryCache = None,
+        refresh: bool = False,
+    ) -> list[QueryResult]:
+        """This function queries every host of a search result on its own, for the full host information."""
+        com_elements = (
+            query_result.com_result
+            if query_result.is_collection
+            else [query_result.com_result]
+        )
+        return [
+            Querying.host(
+                host=com_element.ip,
+                connection=connection,
+                cache=cache,
+                refresh=refresh,
+            )
+            for com_element in com_elements
+        ]
+
     def output(
-        config: dict, query_result: QueryResult, output_format: str = "cli", raw=False
+        config: dict,
+        query_result: QueryResult,
+        output_format: str = "cli",
+        raw=False,
+        connections: ConnectionManager = None,
+    ):
+        """This function writes a query result to one output, or to several outputs concurrently (comma-separated
+        formats, e.g. "cli,opensearch")."""
+        Querying.output_stream(
+            config,
+            [query_result],
+            output_format=output_format,
+            raw=raw,
+            connections=connections,
+        )
+
+    def output_stream(
+        config: dict,
+        query_results: Iterable,
+        output_format: str = "cli",
+        raw=False,
+        connections: ConnectionManager = None,
     ):
-        if output_format == "cli":
-            CLIPrinter().query_output(query_result)
+        """This function writes query results (or batches of them), as they are produced, to the same outputs."""
+        output_connections = dict()
+        for name in output_format.split(","):
+            name = name.strip()
+            output_connection = Querying._output_connection(config, name, connections)
+            if output_connection is None:
+                logger.error('Output "%s" is not available.', name)
+                continue
+            output_connections[name] = output_connection
+        if not output_connections:
+            return
 
-        if output_format == "json":
-            JSONPrinter().query_output(query_result, raw=raw)
+        if len(output_connections) == 1:
+            output_connection = next(iter(output_connections.values()))
+        else:
+            from .connectors import FanoutOutputConnector
 
-        if output_format == "opensearch":
-            OpenSearchConnector(config["connectors"]["opensearch"]).query_output(
-                query_result=query_result, raw=raw
+            output_connection = FanoutOutputConnector.from_config(
+                config, output_connections
             )
+        for query_result in query_results:
+            with profiling.span("output", format=output_format):
+                output_connection.query_output(query_result=query_result, raw=raw)
+        flush = getattr(output_connection, "flush", None)
+        if callable(flush):
+            flush()
+        if len(output_connections) > 1:
+            output_connection.close()
+
+    def _output_connection(
+        config: dict, name: str, connections: ConnectionManager = None
+    ) -> OutputConnector:
+        # Output connectors are imported here, so that only the selected output format is loaded
+        if name == "cli":
+            from .connectors import CLIPrinter
+
+            return CLIPrinter.from_config(config)
+        if name in ("json", "jsonl"):
+            from .connectors import JSONPrinter
+
+            return JSONPrinter(lines=name == "jsonl")
+        if connections is None:
+            connections = ConnectionManager(config)
+        return connections.output_connection(name)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from pivot_track.lib.diff import EntitySnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def result_hash(raw_result) -> str:
+    """Returns a stable hash of a raw source result (independent of the order of keys)."""
+    payload = json.dumps(raw_result, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TrackingState:
+    """The `TrackingState` class keeps state of tracking queries between cycles: the last total and
+    result hash of a query for the pre-check, the entity snapshot of its last result and the fingerprints
+    of tracked hosts. Without a path, the state is kept in memory and lives as long as the tracking process."""
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path) if path is not None else None
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(self.path) if self.path is not None else ":memory:",
+            timeout=30,
+            check_same_thread=False,
+        )
+        if self.path is not None:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS query_state (
+                definition TEXT NOT NULL,
+                source TEXT NOT NULL,
+                query TEXT NOT NULL,
+                total INTEGER,
+                hash TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (definition, source, query)
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                definition TEXT NOT NULL,
+                source TEXT NOT NULL,
+                query TEXT NOT NULL,
+                ipv4 BLOB,
+                ipv6 BLOB,
+                domains TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (definition, source, query)
+            );
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                definition TEXT NOT NULL,
+                source TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                attributes TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (definition, source, ip)
+            );
+            """
+        )
+        self._connection.commit()
+        logger.debug('Opened tracking state "%s".', self.path or ":memory:")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "TrackingState":
+        """Returns a `TrackingState` for the `tracking_state` section of the configuration (in memory, if there is no path)."""
+        state_config = (config or dict()).get("tracking_state") or dict()
+        return cls(state_config.get("path"))
+
+    def query_state(self, definition: str, source: str, query: str) -> dict:
+        """Returns the stored total and hash of a query (both None, if the query is unknown)."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT total, hash FROM query_state WHERE definition = ? AND source = ? AND query = ?",
+                (str(definition), source, query),
+            ).fetchone()
+        if row is None:
+            return {"total": None, "hash": None}
+        return {"total": row[0], "hash": row[1]}
+
+    def update_query_state(
+        self,
+        definition: str,
+        source: str,
+        query: str,
+        total: int = None,
+        hash: str = None,
+    ):
+        """Stores total and hash of a query. Values, that are None, keep their stored value."""
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT INTO query_state (definition, source, query, total, hash, updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (definition, source, query) DO UPDATE SET
+                    total = COALESCE(excluded.total, total),
+                    hash = COALESCE(excluded.hash, hash),
+                    updated = excluded.updated
+                """,
+                (str(definition), source, query, total, hash, time.time()),
+            )
+            self._connection.commit()
+
+    def snapshot(self, definition: str, source: str, query: str) -> EntitySnapshot:
+        """Returns the entity snapshot of the last result of a query (empty, if the query is unknown)."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT ipv4, ipv6, domains FROM snapshots WHERE definition = ? AND source = ? AND query = ?",
+                (str(definition), source, query),
+            ).fetchone()
+        if row is None:
+            return EntitySnapshot()
+        return EntitySnapshot.from_record(*row)
+
+    def update_snapshot(
+        self, definition: str, source: str, query: str, snapshot: EntitySnapshot
+    ):
+        ipv4, ipv6, domains = snapshot.to_record()
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO snapshots (definition, source, query, ipv4, ipv6, domains, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (str(definition), source, query, ipv4, ipv6, domains, time.time()),
+            )
+            self._connection.commit()
+
+    def fingerprints(self, definition: str, source: str) -> dict:
+        """Returns the stored host fingerprints of a definition and source, as dict of IP to (digest, attributes)."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT ip, digest, attributes FROM fingerprints WHERE definition = ? AND source = ?",
+                (str(definition), source),
+            ).fetchall()
+        return {ip: (digest, json.loads(attributes)) for ip, digest, attributes in rows}
+
+    def update_fingerprints(self, definition: str, source: str, fingerprints: list):
+        """Stores host fingerprints (objects with `ip`, `digest` and `attributes`) of a definition and source."""
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                """
+                INSERT OR REPLACE INTO fingerprints (definition, source, ip, digest, attributes, updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        str(definition),
+                        source,
+                        fingerprint.ip,
+                        fingerprint.digest,
+                        json.dumps(fingerprint.attributes),
+                        now,
+                    )
+                    for fingerprint in fingerprints
+                ],
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
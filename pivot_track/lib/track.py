@@ -1,27 +1,113 @@
+import ipaddress
 import logging
+import time
 import yaml
 from datetime import datetime, date
+from functools import cached_property, partial
 from pathlib import Path
 from pydantic import BaseModel, ValidationError
-from typing import Optional, List, Literal
-from uuid import UUID
+from typing import Callable, Optional, List, Literal, TYPE_CHECKING
+from uuid import UUID, uuid4
 
-from pivot_track.lib.query import Querying, QueryResult
+from pivot_track.lib.query import Querying, QueryResult, MergedQueryResult
+from pivot_track.lib.cache import QueryCache
+from pivot_track.lib.state import TrackingState, result_hash
+from pivot_track.lib.diff import EntitySnapshot, SnapshotDiff
+from pivot_track.lib.fingerprint import HostChange, HostFingerprint
+from pivot_track.lib.merge import merge_hosts
+from pivot_track.lib import metrics, profiling, log
 from pivot_track.lib.connectors import (
     SourceConnector,
-    OpenSearchConnector,
     OutputConnector,
     NotificationConnector,
+    CircuitBreaker,
+    tracking_output_arguments,
 )
 
+if TYPE_CHECKING:
+    from pivot_track.lib.connectors import OpenSearchConnector
+    from pivot_track.lib.budget import BudgetPlanner, Plan
+
 logger = logging.getLogger(__name__)
 
+TRACKING_CYCLE_SECONDS = metrics.registry.histogram(
+    "pivottrack_tracking_cycle_seconds",
+    "Duration of tracking cycles.",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600),
+)
+TRACKING_LAST_CYCLE = metrics.registry.gauge(
+    "pivottrack_tracking_last_cycle_timestamp_seconds",
+    "Unix timestamp of the end of the last tracking cycle.",
+)
+TRACKING_DEFINITION_SECONDS = metrics.registry.histogram(
+    "pivottrack_tracking_definition_seconds",
+    "Duration of tracking a definition on one source.",
+    ["source"],
+)
+TRACKING_RESULTS = metrics.registry.counter(
+    "pivottrack_tracking_query_results_total",
+    "Query results collected for tracking definitions.",
+    ["definition", "source"],
+)
+TRACKING_SHORT_CIRCUITED = metrics.registry.counter(
+    "pivottrack_tracking_short_circuited_queries_total",
+    "Tracking queries skipped by the pre-check, because their result did not change.",
+    ["source", "stage"],
+)
+TRACKING_NEW_ELEMENTS = metrics.registry.counter(
+    "pivottrack_tracking_new_elements_total",
+    "New elements (hosts and domains) found for tracking definitions.",
+    ["definition", "source"],
+)
+TRACKING_CHANGED_HOSTS = metrics.registry.counter(
+    "pivottrack_tracking_changed_hosts_total",
+    "Tracked hosts, whose fingerprint (ports, certificates, JARM, HTTP title, ASN) changed since the last cycle.",
+    ["definition", "source"],
+)
+TRACKING_REMOVED_ELEMENTS = metrics.registry.counter(
+    "pivottrack_tracking_removed_elements_total",
+    "Elements (hosts and domains), that are gone from the results of tracking definitions since the last cycle.",
+    ["definition", "source"],
+)
+
+
+# Largest network (in addresses), that a host query may watch
+MAX_WATCHED_NETWORK_SIZE = 65536
+
 
 class TrackingQuery(BaseModel):
     source: Literal["censys", "shodan"]
     command: Literal["host_generic", "host"]
     query: str
     expand: Optional[bool] = False
+    precheck: Optional[bool] = False
+    # Count stage of the pre-check: None runs it only, if the count endpoint of the source is free
+    precheck_count: Optional[bool] = None
+
+    @cached_property
+    def hosts(self) -> List[str]:
+        """The IPs watched by a host query. The query holds IPs and CIDR networks, separated by commas or whitespace
+        (or a list in the definition). Networks are expanded to their hosts."""
+        hosts = dict()
+        for token in self.query.replace(",", " ").split():
+            try:
+                network = ipaddress.ip_network(token, strict=False)
+            except ValueError:
+                logger.warning(
+                    'Skipping "%s" of host query, because it is no IP or network.',
+                    token,
+                )
+                continue
+            if network.num_addresses > MAX_WATCHED_NETWORK_SIZE:
+                logger.warning(
+                    'Skipping network "%s" of host query, because it has more than %d addresses.',
+                    token,
+                    MAX_WATCHED_NETWORK_SIZE,
+                )
+                continue
+            for address in network.hosts() if network.num_addresses > 1 else network:
+                hosts[str(address)] = None
+        return list(hosts)
 
     @classmethod
     def from_dict(cls, query_dict: dict):
@@ -29,8 +115,20 @@ class TrackingQuery(BaseModel):
         command = query_dict.get("command")
         expand = query_dict.get("expand", False)
         query = query_dict.get("query")
+        if isinstance(query, list):
+            # Watchlists of host queries may be given as list
+            query = ", ".join(str(element) for element in query)
+        precheck = query_dict.get("precheck", False)
+        precheck_count = query_dict.get("precheck_count")
 
-        return TrackingQuery(source=source, command=command, query=query, expand=expand)
+        return TrackingQuery(
+            source=source,
+            command=command,
+            query=query,
+            expand=expand,
+            precheck=precheck,
+            precheck_count=precheck_count,
+        )
 
 
 class TrackingDefinition(BaseModel):
@@ -44,6 +142,21 @@ class TrackingDefinition(BaseModel):
     modified: Optional[date] = None
     tags: Optional[List[str]] = list()
     output: Optional[str] = None
+    priority: Optional[int] = 0
+    # True for notifications on all fingerprint changes of tracked hosts, or a list of attributes
+    notify_changes: Optional[
+        bool | List[Literal["ports", "certificates", "jarm", "http_title", "asn"]]
+    ] = False
+
+    def notified_changes(self, attributes: List[str]) -> List[str]:
+        """Returns the changed attributes of a host, that the definition wants to be notified about."""
+        if self.notify_changes is True:
+            return list(attributes)
+        if not self.notify_changes:
+            return list()
+        return [
+            attribute for attribute in attributes if attribute in self.notify_changes
+        ]
 
     @property
     def sources(self):
@@ -75,11 +188,11 @@ class TrackingDefinition(BaseModel):
 
     def queries_by_filter(self, command: str = None, source: str = None):
         if command is None and source is None:
-            return self.queries()
+            return list(self.queries)
         elif command is None and isinstance(source, str):
             return self.queries_by_source(source)
         elif isinstance(command, str) and source is None:
-            return self.queries_by_command
+            return self.queries_by_command(command)
         else:
             queries = list()
             for query_item in self.queries:
@@ -130,6 +243,8 @@ class TrackingDefinition(BaseModel):
 
         tags = [tag for tag in definition.get("tags", list())]
         output = definition.get("output")
+        priority = definition.get("priority", 0)
+        notify_changes = definition.get("notify_changes", False)
         return TrackingDefinition(
             uuid=uuid,
             queries=queries,
@@ -141,9 +256,59 @@ class TrackingDefinition(BaseModel):
             modified=modified,
             tags=tags,
             output=output,
+            priority=priority,
+            notify_changes=notify_changes,
         )
 
 
+class DefinitionResults:
+    """The `DefinitionResults` class collects the results of one tracking definition in a tracking cycle, source
+    by source. Hosts, that several sources found, are merged to one entity (with the sources as provenance),
+    so that they are written, checked for newness and notified once."""
+
+    def __init__(self, definition: TrackingDefinition):
+        self.definition = definition
+        self.sources = list()
+        self.results = list()
+        self.diffs = list()
+        # Updates of the tracking state (pre-check hashes, snapshots, fingerprints), that are saved once the
+        # results are written, so that a failed output is not taken as done in the next cycle
+        self.state_updates = list()
+        self._changed_hosts = dict()
+
+    def add(
+        self,
+        source: str,
+        results: List[QueryResult],
+        diffs: List[SnapshotDiff] = None,
+        changed_hosts: List[HostChange] = None,
+        state_updates: List[Callable] = None,
+    ):
+        self.sources.append(source)
+        self.results.extend(results)
+        self.diffs.extend(diffs or [])
+        self.state_updates.extend(state_updates or [])
+        for change in changed_hosts or []:
+            known_change = self._changed_hosts.get(change.host.ip)
+            if known_change is None:
+                self._changed_hosts[change.host.ip] = change
+            else:
+                known_change.attributes = list(
+                    dict.fromkeys(known_change.attributes + change.attributes)
+                )
+
+    @property
+    def changed_hosts(self) -> List[HostChange]:
+        return list(self._changed_hosts.values())
+
+    @property
+    def query_result(self) -> QueryResult | List[QueryResult]:
+        """The results of a single source as they are, the results of several sources merged by IP."""
+        if len(self.sources) > 1:
+            return MergedQueryResult(self.results, query_command="tracking")
+        return self.results
+
+
 class Tracking:
     """The `Tracking` class is responsbile for the tracking feature within Pivot Track. Tracking means,
     the automatic execution and storing of queries against several sources, storing the results
@@ -154,88 +319,595 @@ class Tracking:
         source_connections: List[SourceConnector],
         output_connection: OutputConnector,
         notification_connection: NotificationConnector = None,
-    ):
-        """The function executes all definitions via the provided connections to sources. The results will be  stored via the provided output connector."""
-        for source_connection in source_connections:
-            definitions_for_source = Tracking.definitions_by_source(
-                definitions, source_connection.short_name
+        cache: QueryCache = None,
+        budget: "BudgetPlanner" = None,
+        state: TrackingState = None,
+    ) -> "Plan":
+        """The function executes all definitions via the provided connections to sources. The results will be  stored via the provided output connector.
+        With a budget, only the definitions, that fit into the budget, are executed (highest priority first). Returns the plan in this case."""
+        with TRACKING_CYCLE_SECONDS.time(), log.correlation(cycle_id=uuid4().hex):
+            plan = Tracking._track_definitions(
+                definitions=definitions,
+                source_connections=source_connections,
+                output_connection=output_connection,
+                notification_connection=notification_connection,
+                cache=cache,
+                budget=budget,
+                state=state,
             )
+            # Buffered connectors deliver the rest (or the digest) of the cycle
+            for connection, span_name in (
+                (output_connection, "output_flush"),
+                (notification_connection, "notify_flush"),
+            ):
+                flush = getattr(connection, "flush", None)
+                if callable(flush):
+                    with profiling.span(span_name):
+                        flush()
+        TRACKING_LAST_CYCLE.set(time.time())
+        return plan
+
+    def _track_definitions(
+        definitions: List[TrackingDefinition],
+        source_connections: List[SourceConnector],
+        output_connection: OutputConnector,
+        notification_connection: NotificationConnector = None,
+        cache: QueryCache = None,
+        budget: "BudgetPlanner" = None,
+        state: TrackingState = None,
+    ) -> "Plan":
+        plan = None
+        collected = dict()
+        if budget is not None:
+            # The account endpoints do not cost any credits
+            quotas = {
+                source_connection.short_name: source_connection.refresh_credits()
+                for source_connection in source_connections
+            }
+            plan = budget.plan(definitions, quotas)
+            profiling.count("skipped_definitions", len(plan.skipped))
+
+        for source_connection in source_connections:
+            source = source_connection.short_name
+            if plan is not None:
+                definitions_for_source = plan.definitions_for(source)
+            else:
+                definitions_for_source = Tracking.definitions_by_source(
+                    definitions, source
+                )
             logger.info(
-                f'{len(definitions_for_source)} tracking definition(s) available for source "{source_connection.short_name}".'
+                '%d tracking definition(s) available for source "%s".',
+                len(definitions_for_source),
+                source,
             )
+            credits_used = source_connection.credential_pool.credits_used
             Tracking.track_definitions_for_source(
                 source_connection=source_connection,
                 definitions=definitions_for_source,
                 output_connection=output_connection,
                 notification_connection=notification_connection,
+                cache=cache,
+                state=state,
+                collected=collected,
             )
+            if budget is not None:
+                budget.record(
+                    source,
+                    source_connection.credential_pool.credits_used - credits_used,
+                )
+
+        # Results of all sources are written per definition, with hosts of several sources merged
+        for definition_results in collected.values():
+            definition = definition_results.definition
+            with (
+                profiling.span("definition_output", definition=definition.uuid),
+                log.correlation(definition_id=definition.uuid),
+            ):
+                Tracking.emit_definition_results(
+                    definition_results, output_connection, notification_connection
+                )
+        return plan
 
     def track_definitions_for_source(
         definitions: List[TrackingDefinition],
         source_connection: SourceConnector,
         output_connection: OutputConnector,
         notification_connection: NotificationConnector = None,
+        cache: QueryCache = None,
+        state: TrackingState = None,
+        collected: dict = None,
     ):
-        """The function executes all queries for one specific source (i.E. Shodan or Censys)."""
+        """The function executes all queries for one specific source (i.E. Shodan or Censys). With `collected` (UUID
+        of definition to `DefinitionResults`), the results are only collected, to be written together with the ones
+        of other sources (see `emit_definition_results`)."""
         opensearch_connection = output_connection
-        if opensearch_connection.available:
+        if source_connection.circuit_state == CircuitBreaker.OPEN:
+            logger.warning(
+                'Skipping %d definition(s) for source "%s", because its circuit breaker is open.',
+                len(definitions),
+                source_connection.short_name,
+            )
+        elif opensearch_connection.available:
             source_string = source_connection.short_name
             logger.info(
-                f'Start tracking {len(definitions)} definition(s) in source "{source_string}"'
+                'Start tracking %d definition(s) in source "%s".',
+                len(definitions),
+                source_string,
+            )
+            # Host queries of all definitions are looked up together, with bulk requests
+            host_results = Tracking.lookup_watched_hosts(
+                definitions, source_connection, cache=cache
             )
             for definition in definitions:
-                logger.info(
-                    f'Start tracking with source "{source_string}" for definition "{str(definition.uuid)}".'
-                )
-                # TODO Fix manual definition of command to be executed
-                host_searches = definition.queries_by_filter(
-                    command="host_generic", source=source_string
-                )
-                collected_results = Tracking.execute_tracking_queries(
-                    host_searches, source_connection, opensearch_connection
+                with (
+                    TRACKING_DEFINITION_SECONDS.time(source=source_string),
+                    profiling.span(
+                        "definition", definition=definition.uuid, source=source_string
+                    ),
+                    log.correlation(definition_id=definition.uuid),
+                ):
+                    if collected is None:
+                        Tracking.track_definition_for_source(
+                            definition=definition,
+                            source_connection=source_connection,
+                            output_connection=opensearch_connection,
+                            notification_connection=notification_connection,
+                            cache=cache,
+                            state=state,
+                            host_results=host_results,
+                        )
+                    else:
+                        collected[definition.uuid] = (
+                            Tracking.collect_definition_for_source(
+                                definition=definition,
+                                source_connection=source_connection,
+                                output_connection=opensearch_connection,
+                                cache=cache,
+                                state=state,
+                                host_results=host_results,
+                                collected=collected.get(definition.uuid),
+                            )
+                        )
+        else:
+            logger.error(
+                "Output connection is not available. An output (OpenSearch or SQLite) is required for this feature."
+            )
+
+    def track_definition_for_source(
+        definition: TrackingDefinition,
+        source_connection: SourceConnector,
+        output_connection: OutputConnector,
+        notification_connection: NotificationConnector = None,
+        cache: QueryCache = None,
+        state: TrackingState = None,
+        host_results: dict = None,
+    ):
+        """The function executes the queries of one definition for one specific source. Results of host queries are
+        taken from `host_results` (see `lookup_watched_hosts`), if given."""
+        collected = Tracking.collect_definition_for_source(
+            definition=definition,
+            source_connection=source_connection,
+            output_connection=output_connection,
+            cache=cache,
+            state=state,
+            host_results=host_results,
+        )
+        Tracking.emit_definition_results(
+            collected, output_connection, notification_connection
+        )
+
+    def collect_definition_for_source(
+        definition: TrackingDefinition,
+        source_connection: SourceConnector,
+        output_connection: OutputConnector,
+        cache: QueryCache = None,
+        state: TrackingState = None,
+        host_results: dict = None,
+        collected: "DefinitionResults" = None,
+    ) -> "DefinitionResults":
+        """The function executes the queries of one definition for one specific source and adds the results, result
+        diffs and changed hosts to `collected` (the results of the definition on other sources)."""
+        source_string = source_connection.short_name
+        logger.info(
+            'Start tracking with source "%s" for definition "%s".',
+            source_string,
+            definition.uuid,
+        )
+        if collected is None:
+            collected = DefinitionResults(definition)
+        diffs = list() if state is not None else None
+        state_updates = list()
+        collected_results = Tracking.execute_tracking_queries(
+            definition.queries_by_source(source_string),
+            source_connection,
+            output_connection,
+            cache=cache,
+            state=state,
+            definition=definition,
+            diffs=diffs,
+            host_results=host_results,
+            state_updates=state_updates,
+        )
+        changed_hosts = list()
+        if state is not None:
+            with profiling.span("fingerprint", source=source_string):
+                changed_hosts = Tracking.detect_host_changes(
+                    state,
+                    definition,
+                    source_string,
+                    collected_results,
+                    state_updates=state_updates,
                 )
-                logger.info(
-                    f'Got {len(collected_results)} for definition "{str(definition.uuid)}".'
+        logger.info(
+            'Got %d result(s) for definition "%s".',
+            len(collected_results),
+            definition.uuid,
+        )
+        TRACKING_RESULTS.inc(
+            len(collected_results), definition=definition.uuid, source=source_string
+        )
+        profiling.count("query_results", len(collected_results))
+        collected.add(
+            source_string, collected_results, diffs, changed_hosts, state_updates
+        )
+        return collected
+
+    def emit_definition_results(
+        collected: "DefinitionResults",
+        output_connection: OutputConnector,
+        notification_connection: NotificationConnector = None,
+    ):
+        """The function writes the results of one definition (of one or several sources) to the output and notifies
+        about new, gone and changed elements. Hosts, that several sources found, are merged into one entity first.
+        The tracking state of the definition is only updated afterwards, so that a failed output is retried."""
+        definition = collected.definition
+        source_string = ",".join(collected.sources)
+        # Entities of queries, that did not run, are retained (see diff_query_result)
+        cycle_diff = SnapshotDiff.merge(collected.diffs) if collected.diffs else None
+        with profiling.span("tracking_output"):
+            # Entities, that were in the results of the last cycle already, are not new
+            new_items = output_connection.tracking_output(
+                **tracking_output_arguments(
+                    output_connection,
+                    collected.query_result,
+                    definition,
+                    known=cycle_diff.retained.to_set()
+                    if cycle_diff is not None
+                    else None,
                 )
-                new_items = opensearch_connection.tracking_output(
-                    query_result=collected_results, definition=definition
+            )
+        TRACKING_NEW_ELEMENTS.inc(
+            len(new_items), definition=definition.uuid, source=source_string
+        )
+        profiling.count("new_elements", len(new_items))
+        removed_items = (
+            cycle_diff.removed.to_com_list() if cycle_diff is not None else list()
+        )
+        if removed_items:
+            logger.info(
+                '%d element(s) are gone from the results of definition "%s".',
+                len(removed_items),
+                definition.uuid,
+            )
+            TRACKING_REMOVED_ELEMENTS.inc(
+                len(removed_items), definition=definition.uuid, source=source_string
+            )
+            profiling.count("removed_elements", len(removed_items))
+        if notification_connection is not None:
+            with profiling.span("notify"):
+                notification_connection.notify(
+                    definition=definition, notify_items=new_items
                 )
-                if notification_connection is not None:
-                    notification_connection.notify(
-                        definition=definition, notify_items=new_items
+                if removed_items:
+                    notification_connection.notify_removed(
+                        definition=definition, removed_items=removed_items
                     )
-        else:
-            logger.error(
-                "OpenSearchConnector is not available. OpenSearch is required for this feature."
-            )
+                notified_changes = [
+                    change
+                    for change in collected.changed_hosts
+                    if definition.notified_changes(change.attributes)
+                ]
+                if notified_changes:
+                    notification_connection.notify_changed(
+                        definition=definition, changed_items=notified_changes
+                    )
+        for state_update in collected.state_updates:
+            state_update()
 
     def execute_tracking_queries(
         queries: List[TrackingQuery],
         source_connection: SourceConnector,
-        output_connection: OpenSearchConnector = None,
+        output_connection: "OpenSearchConnector" = None,
+        cache: QueryCache = None,
+        state: TrackingState = None,
+        definition: TrackingDefinition = None,
+        diffs: List[SnapshotDiff] = None,
+        host_results: dict = None,
+        state_updates: List[Callable] = None,
     ) -> List[QueryResult]:
-        """The function is responible for executing a given TrackingQuery on a given source_connection."""
+        """The function is responible for executing a given TrackingQuery on a given source_connection.
+        Queries with pre-check are skipped, if their result did not change since the last cycle (requires state and definition).
+        With a `diffs` list, the result diff of every query to the last cycle is appended to it. Host queries take their
+        results from `host_results`, if given. With a `state_updates` list, updates of the tracking state are appended to
+        it (to be called once the results are written), instead of being saved right away."""
         collected_results = list()
         for query_element in queries:
-            query_result, expanded_query_result = Querying.host_query(
-                search=query_element.query,
-                connection=source_connection,
-                expand=query_element.expand,
-            )
-            if query_result is not None:
-                if not query_element.expand:
-                    collected_results.append(query_result)
-                    output_result = query_result
+            with profiling.span(
+                "query",
+                source=source_connection.short_name,
+                command=query_element.command,
+                query=query_element.query,
+            ):
+                if query_element.command == "host":
+                    # Without any result, the lookup is treated like a failed query
+                    output_result = (
+                        Tracking.execute_host_query(
+                            query_element,
+                            source_connection,
+                            cache=cache,
+                            host_results=host_results,
+                        )
+                        or None
+                    )
                 else:
+                    query_result, expanded_query_result = (
+                        Tracking.execute_tracking_query(
+                            query_element,
+                            source_connection,
+                            cache=cache,
+                            state=state,
+                            definition=definition,
+                            state_updates=state_updates,
+                        )
+                    )
+                    output_result = (
+                        None
+                        if query_result is None
+                        else (
+                            expanded_query_result
+                            if query_element.expand
+                            else query_result
+                        )
+                    )
+            profiling.count("queries")
+            if diffs is not None and state is not None and definition is not None:
+                with profiling.span("diff", source=source_connection.short_name):
+                    diffs.append(
+                        Tracking.diff_query_result(
+                            state,
+                            definition,
+                            source_connection.short_name,
+                            query_element,
+                            output_result=output_result,
+                            state_updates=state_updates,
+                        )
+                    )
+            if output_result is not None:
+                if isinstance(output_result, list):
                     logger.debug(
-                        f"Length of expanded query result is {len(expanded_query_result)}."
+                        "Length of expanded query result is %d.", len(output_result)
                     )
-                    collected_results.extend(expanded_query_result)
-                    output_result = expanded_query_result
+                    collected_results.extend(output_result)
+                else:
+                    collected_results.append(output_result)
                 if output_connection is not None:
-                    output_connection.query_output(query_result=output_result)
+                    with profiling.span("query_output"):
+                        output_connection.query_output(query_result=output_result)
         return collected_results
 
+    def execute_tracking_query(
+        query_element: TrackingQuery,
+        source_connection: SourceConnector,
+        cache: QueryCache = None,
+        state: TrackingState = None,
+        definition: TrackingDefinition = None,
+        state_updates: List[Callable] = None,
+    ) -> tuple[QueryResult, List[QueryResult]]:
+        """The function executes one TrackingQuery. With pre-check, the count endpoint of the source is compared with
+        the stored total first (only if it is free, or if the query opts in with `precheck_count`), then the hash of
+        the raw result with the stored hash. An equal count is a heuristic: a host may have been replaced by another
+        one. Returns (None, None), if the query was short-circuited, because its result did not change. With a
+        `state_updates` list, the new total and hash are saved by the caller (see `execute_tracking_queries`)."""
+        if not query_element.precheck or state is None or definition is None:
+            return Querying.host_query(
+                search=query_element.query,
+                connection=source_connection,
+                expand=query_element.expand,
+                cache=cache,
+            )
+
+        source = source_connection.short_name
+        stored = state.query_state(definition.uuid, source, query_element.query)
+        count_stage = query_element.precheck_count
+        if count_stage is None:
+            count_stage = source_connection._credit_cost("count") == 0
+        total = None
+        if count_stage:
+            with profiling.span("precheck", source=source):
+                total = source_connection.query_host_count(query_element.query)
+        if (
+            total is not None
+            and stored["hash"] is not None
+            and total == stored["total"]
+        ):
+            Tracking._short_circuit(source, "count", query_element)
+            return None, None
+
+        query_result, _ = Querying.host_query(
+            search=query_element.query,
+            connection=source_connection,
+            expand=False,
+            cache=cache,
+        )
+        if query_result is None:
+            return None, None
+        with profiling.span("result_hash", source=source):
+            raw_result_hash = result_hash(query_result.raw_result)
+        Tracking._update_state(
+            state_updates,
+            partial(
+                state.update_query_state,
+                definition.uuid,
+                source,
+                query_element.query,
+                total,
+                raw_result_hash,
+            ),
+        )
+        if raw_result_hash == stored["hash"]:
+            Tracking._short_circuit(source, "hash", query_element)
+            return None, None
+
+        if not query_element.expand:
+            return query_result, None
+        return query_result, Querying.expand(
+            query_result, source_connection, cache=cache
+        )
+
+    def execute_host_query(
+        query_element: TrackingQuery,
+        source_connection: SourceConnector,
+        cache: QueryCache = None,
+        host_results: dict = None,
+    ) -> List[QueryResult]:
+        """The function returns the results of the hosts watched by a host query. Without `host_results`, the hosts are
+        looked up with bulk requests."""
+        if host_results is None:
+            host_results = {
+                query_result.search_term: query_result
+                for batch in Querying.hosts(
+                    query_element.hosts, source_connection, cache=cache
+                )
+                for query_result in batch
+            }
+        return [
+            host_results[host] for host in query_element.hosts if host in host_results
+        ]
+
+    def lookup_watched_hosts(
+        definitions: List[TrackingDefinition],
+        source_connection: SourceConnector,
+        cache: QueryCache = None,
+    ) -> dict:
+        """The function looks up the hosts of all host queries of the definitions on one source, merged into bulk
+        requests. Returns a dictionary of IP to host result."""
+        source = source_connection.short_name
+        hosts = dict()
+        for definition in definitions:
+            for query_element in definition.queries_by_filter(
+                command="host", source=source
+            ):
+                hosts.update(dict.fromkeys(query_element.hosts))
+        if not hosts:
+            return dict()
+        logger.info('Looking up %d watched host(s) on source "%s".', len(hosts), source)
+        host_results = dict()
+        with profiling.span("host_lookup", source=source):
+            for batch in Querying.hosts(list(hosts), source_connection, cache=cache):
+                for query_result in batch:
+                    host_results[query_result.search_term] = query_result
+        profiling.count("watched_hosts", len(hosts))
+        return host_results
+
+    def diff_query_result(
+        state: TrackingState,
+        definition: TrackingDefinition,
+        source: str,
+        query_element: TrackingQuery,
+        output_result: QueryResult | List[QueryResult] = None,
+        state_updates: List[Callable] = None,
+    ) -> SnapshotDiff:
+        """The function compares the entities of a query result with the snapshot of the last cycle and stores
+        the new snapshot. Without result (the query failed or was short-circuited), the snapshot is retained."""
+        previous = state.snapshot(definition.uuid, source, query_element.query)
+        if output_result is None:
+            return SnapshotDiff(previous, previous)
+        current = EntitySnapshot.from_com_list(Tracking._com_list(output_result))
+        Tracking._update_state(
+            state_updates,
+            partial(
+                state.update_snapshot,
+                definition.uuid,
+                source,
+                query_element.query,
+                current,
+            ),
+        )
+        return SnapshotDiff(previous, current)
+
+    def detect_host_changes(
+        state: TrackingState,
+        definition: TrackingDefinition,
+        source: str,
+        results: List[QueryResult],
+        state_updates: List[Callable] = None,
+    ) -> List[HostChange]:
+        """The function compares the fingerprints of the tracked hosts with the ones of the last cycle (one digest
+        comparison per host) and stores the new fingerprints. Hosts are merged by IP first. Hosts, that are new, are
+        not reported as changed."""
+        stored = state.fingerprints(definition.uuid, source)
+        fingerprints, changes = dict(), dict()
+        # Searches return one banner per port, and queries may overlap: one fingerprint per IP, independent of order
+        for host in merge_hosts(Tracking._com_list(results)):
+            fingerprint = HostFingerprint.from_host(host)
+            fingerprints[host.ip] = fingerprint
+            previous = stored.get(host.ip)
+            if previous is None or previous[0] == fingerprint.digest:
+                continue
+            previous_fingerprint = HostFingerprint.from_dict(host.ip, previous[1])
+            changes[host.ip] = HostChange(
+                host,
+                previous_fingerprint,
+                fingerprint,
+                fingerprint.changes(previous_fingerprint),
+            )
+        Tracking._update_state(
+            state_updates,
+            partial(
+                state.update_fingerprints,
+                definition.uuid,
+                source,
+                list(fingerprints.values()),
+            ),
+        )
+        if changes:
+            logger.info(
+                '%d host(s) of definition "%s" changed their fingerprint.',
+                len(changes),
+                definition.uuid,
+            )
+            TRACKING_CHANGED_HOSTS.inc(
+                len(changes), definition=definition.uuid, source=source
+            )
+            profiling.count("changed_hosts", len(changes))
+        return list(changes.values())
+
+    def _update_state(state_updates: List[Callable], state_update: Callable):
+        """Saves an update of the tracking state right away, or appends it to `state_updates` (if given)."""
+        if state_updates is None:
+            state_update()
+        else:
+            state_updates.append(state_update)
+
+    def _com_list(results: QueryResult | List[QueryResult]) -> list:
+        com_list = list()
+        for result in results if isinstance(results, list) else [results]:
+            if result.is_collection:
+                com_list.extend(result.com_result)
+            else:
+                com_list.append(result.com_result)
+        return com_list
+
+    def _short_circuit(source: str, stage: str, query_element: TrackingQuery):
+        logger.info(
+            'Result of query "%s" on source "%s" did not change (%s pre-check). Skipping it.',
+            query_element.query,
+            source,
+            stage,
+        )
+        TRACKING_SHORT_CIRCUITED.inc(source=source, stage=stage)
+        profiling.count("short_circuited_queries")
+
     def load_yaml_definition_files(
         definition_yaml_path: Path,
     ) -> List[TrackingDefinition]:
@@ -248,7 +920,9 @@ class Tracking:
             definition_path for definition_path in definition_yaml_path.glob("**/*.yml")
         ]
         logger.info(
-            f'Found {len(definition_files_path)} definition file(s) in "{str(definition_yaml_path)}".'
+            'Found %d definition file(s) in "%s".',
+            len(definition_files_path),
+            definition_yaml_path,
         )
 
         loaded_definitions = list()
@@ -257,9 +931,11 @@ class Tracking:
                 definition = TrackingDefinition.from_yaml(file)
                 loaded_definitions.append(definition)
                 logger.debug(
-                    f'Loaded definition file "{str(definition_file_path)}" with UUID "{definition.uuid}".'
+                    'Loaded definition file "%s" with UUID "%s".',
+                    definition_file_path,
+                    definition.uuid,
                 )
-        logger.info(f"Loaded {len(loaded_definitions)} tracking definition(s).")
+        logger.info("Loaded %d tracking definition(s).", len(loaded_definitions))
         return loaded_definitions
 
     def load_definitions(tracking_definition_path: Path = None) -> tuple[list, dict]:
@@ -290,8 +966,10 @@ class Tracking:
         for definition in definitions:
             if source in definition.sources:
                 result_definitions.append(definition)
-                logger.debug(f'Added rule "{definition.uuid}" for source {source}.')
+                logger.debug('Added rule "%s" for source %s.', definition.uuid, source)
         logger.info(
-            f'{len(result_definitions)} tracking definition(s) available for source "{source}".'
+            '%d tracking definition(s) available for source "%s".',
+            len(result_definitions),
+            source,
         )
         return result_definitions
@@ -1,6 +1,7 @@
 import yaml
 from pathlib import Path
 from typing import List, Dict
+from pivot_track.lib import connectors
 from pivot_track.lib.connectors import SourceConnector, OutputConnector
 
 
@@ -35,27 +36,27 @@ def init_output_connections(config: dict, filter: str = "") -> List[OutputConnec
 def _init_typed_connections(config: dict, parent_class, filter: str = "") -> List:
     available_connections = list()
     connector_config_keys = config.get("connectors", dict()).keys()
-    if not filter == "" and filter in connector_config_keys:
-        connector_config_keys = [filter]
+    if not filter == "":
+        connector_config_keys = [filter] if filter in connector_config_keys else []
     for connector_config_key in connector_config_keys:
         connector_config = config.get("connectors").get(connector_config_key)
         if connector_config.get("enabled", True):
-            connector = subclass_by_parent_find(parent_class, connector_config_key)
+            connector = connector_by_config(
+                parent_class, connector_config_key, connector_config
+            )
             if connector is not None:
                 connection = connector(connector_config)
                 available_connections.append(connection)
     return available_connections
 
 
-def subclass_by_parent_find(parent_class, search_string: str):
-    """This function returns a sub class of a parent class."""
-    for connector in parent_class.__subclasses__():
-        connector_name = connector.__name__.lower()
-        if search_string in connector_name and "mock" not in connector_name:
-            return connector
-    return None
+def connector_by_config(parent_class, connector_config_key: str, connector_config):
+    """This function returns the connector class for a connector configuration. The class is looked up
+    in the connector registry by the optional "connector" setting, or by the configuration key."""
+    connector_name = (connector_config or dict()).get("connector", connector_config_key)
+    return connectors.connector_registry.load(connector_name, parent_class)
 
 
-def subclasses_by_parent(parent_class):
-    """This function returns all sub classes of a given parent class."""
-    return parent_class.__subclasses__()
+def connectors_by_parent(parent_class):
+    """This function returns all registered connector classes of a given parent class."""
+    return connectors.connector_registry.classes(parent_class)
@@ -0,0 +1,29 @@
+from . import mocks
+from benchmarks import run
+from pivot_track.lib.query import QueryResult
+
+
+class TestBenchmarks:
+    def test_synthetic_payloads(self):
+        shodan_result = QueryResult(mocks.shodan_search(5), "generic", "benchmark")
+        censys_result = QueryResult(mocks.censys_search(5), "generic", "benchmark")
+        assert shodan_result.element_count == 5
+        assert censys_result.element_count == 5
+        assert len({host.ip for host in shodan_result.com_result}) == 5
+        assert [host.ip for host in censys_result.com_result] == [
+            mocks.synthetic_ip(index) for index in range(5)
+        ]
+
+    def test_fake_opensearch_new_elements(self):
+        definition = run._definition()
+        connector = mocks.fake_opensearch_connector()
+        query_result = QueryResult(mocks.censys_search(3), "generic", "benchmark")
+        assert len(connector.tracking_output(query_result, definition)) == 3
+        assert len(connector.tracking_output(query_result, definition)) == 0
+
+    def test_run_report(self):
+        report = run.run(sizes=[10], repeat=1)
+        assert {result["name"] for result in report["results"]} == set(
+            run.BENCHMARKS.keys()
+        )
+        assert all(result["seconds"]["min"] > 0 for result in report["results"])
@@ -0,0 +1,144 @@
+import json
+from uuid import uuid4
+
+from typer.testing import CliRunner
+
+from .mocks import (
+    MockOpenSearchConnector,
+    MockShodanSourceConnector,
+    tracking_definition,
+)
+from pivot_track.cli import app
+from pivot_track.lib.budget import BudgetPlanner
+from pivot_track.lib.track import Tracking
+
+
+class TestBudgetPlanner:
+    def test_estimate(self):
+        planner = BudgetPlanner(expand_estimate=10)
+        definition = tracking_definition("shodan", "censys", expand=True)
+        # Shodan host lookups are free, Censys host views count against the quota
+        assert planner.estimate_definition(definition, "shodan") == 1
+        assert planner.estimate_definition(definition, "censys") == 11
+        assert (
+            planner.estimate_definition(
+                tracking_definition("shodan", "censys"), "censys"
+            )
+            == 1
+        )
+
+    def test_priority_and_skipping(self):
+        planner = BudgetPlanner(budgets={"censys": {"daily": 12}}, expand_estimate=10)
+        low = tracking_definition("shodan", "censys", priority=1)
+        high = tracking_definition("shodan", "censys", priority=10, expand=True)
+        medium = tracking_definition("shodan", "censys", priority=5)
+
+        plan = planner.plan([low, high, medium])
+        assert plan.definitions_for("censys") == [high, medium]
+        assert plan.definitions_for("shodan") == [high, medium, low]
+        assert [entry.definition for entry in plan.skipped] == [low]
+        assert plan.available == {"censys": 12, "shodan": None}
+
+    def test_quota(self):
+        planner = BudgetPlanner(budgets={"shodan": {"monthly": 100}})
+        plan = planner.plan(
+            [
+                tracking_definition("shodan", "censys"),
+                tracking_definition("shodan", "censys"),
+            ],
+            quotas={"shodan": 1},
+        )
+        assert len(plan.definitions_for("shodan")) == 1
+
+    def test_state_file(self, tmp_path):
+        state_file = tmp_path / "budget.json"
+        planner = BudgetPlanner(
+            budgets={"shodan": {"daily": 10, "monthly": 15}}, state_file=state_file
+        )
+        planner.record("shodan", 8)
+        planner = BudgetPlanner(
+            budgets={"shodan": {"daily": 10, "monthly": 15}}, state_file=state_file
+        )
+        assert planner.remaining("shodan") == 2
+
+        # A new day resets the daily, but not the monthly spendings
+        state = json.loads(state_file.read_text())
+        state["shodan"]["day"] = "2000-01-01"
+        state_file.write_text(json.dumps(state))
+        planner = BudgetPlanner(
+            budgets={"shodan": {"daily": 10, "monthly": 15}}, state_file=state_file
+        )
+        assert planner.remaining("shodan") == 7
+
+    def test_from_config(self):
+        assert BudgetPlanner.from_config(dict()) is None
+        planner = BudgetPlanner.from_config(
+            {"budget": {"expand_estimate": 5, "shodan": {"daily": 3}}}
+        )
+        assert planner.expand_estimate == 5
+        assert planner.budgets == {"shodan": {"daily": 3}}
+
+
+class TestTrackingBudget:
+    def test_skipped_definitions_are_not_tracked(self):
+        planner = BudgetPlanner(budgets={"shodan": {"daily": 1}})
+        first, second = (
+            tracking_definition("shodan", "censys", priority=2),
+            tracking_definition("shodan", "censys", priority=1),
+        )
+        new_items = list()
+
+        class Notification:
+            def notify(self, definition, notify_items):
+                new_items.append(definition)
+
+        plan = Tracking.track_definitions(
+            definitions=[second, first],
+            source_connections=[MockShodanSourceConnector()],
+            output_connection=MockOpenSearchConnector(),
+            notification_connection=Notification(),
+            budget=planner,
+        )
+        assert [entry.definition for entry in plan.skipped] == [second]
+        assert new_items == [first]
+
+
+class TestPlanCommand:
+    def test_plan(self, tmp_path):
+        definition_path = tmp_path / "definitions"
+        definition_path.mkdir()
+        (definition_path / "a.yml").write_text(
+            f"uuid: {uuid4()}\n"
+            "title: Important\n"
+            "priority: 10\n"
+            "query:\n"
+            "  - source: shodan\n"
+            "    command: host_generic\n"
+            "    query: x\n"
+        )
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(
+            "logging:\n"
+            "  level: WARNING\n"
+            f"  logfile: {tmp_path / 'missing.log'}\n"
+            "connectors:\n"
+            "  shodan:\n"
+            "    api_key: CHANGEME\n"
+            "budget:\n"
+            "  shodan:\n"
+            "    daily: 5\n"
+        )
+        result = CliRunner().invoke(
+            app,
+            [
+                "track",
+                "--plan",
+                "--config-path",
+                str(config_path),
+                "--definition-path",
+                str(definition_path),
+            ],
+        )
+        assert result.exit_code == 0
+        assert "Important" in result.output
+        assert "shodan: 1 credit(s) planned, 5 available." in result.output
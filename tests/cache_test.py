@@ -0,0 +1,108 @@
+from .mocks import (
+    SHODAN_HOST_JSON,
+    SHODAN_SEARCH_JSON,
+    SHODAN_TEST_HOST,
+    SHODAN_TEST_SEARCH_QUERY,
+    MockShodanSourceConnector,
+)
+from pivot_track.lib.cache import QueryCache
+from pivot_track.lib.query import Querying
+
+import time
+
+
+class TestQueryCache:
+    def test_from_config_disabled(self, tmp_path):
+        assert QueryCache.from_config(dict()) is None
+        assert (
+            QueryCache.from_config(
+                {"cache": {"path": str(tmp_path / "cache.sqlite"), "enabled": False}}
+            )
+            is None
+        )
+
+    def test_set_get(self, tmp_path):
+        cache = QueryCache({"path": str(tmp_path / "cache.sqlite")})
+        cache.set("shodan", "host", SHODAN_TEST_HOST, SHODAN_HOST_JSON)
+        assert cache.get("shodan", "host", SHODAN_TEST_HOST) == SHODAN_HOST_JSON
+        assert cache.get("censys", "host", SHODAN_TEST_HOST) is None
+
+    def test_normalized_query(self, tmp_path):
+        cache = QueryCache({"path": str(tmp_path / "cache.sqlite")})
+        cache.set("shodan", "generic", "product:nginx  port:443", SHODAN_SEARCH_JSON)
+        assert (
+            cache.get("shodan", "generic", " product:nginx port:443 ")
+            == SHODAN_SEARCH_JSON
+        )
+
+    def test_normalized_quoted_query(self, tmp_path):
+        assert (
+            QueryCache.normalize_query(' http.title:"Index  of /"   port:80 ')
+            == 'http.title:"Index  of /" port:80'
+        )
+        cache = QueryCache({"path": str(tmp_path / "cache.sqlite")})
+        cache.set("shodan", "generic", 'http.title:"Index  of /"', SHODAN_SEARCH_JSON)
+        assert cache.get("shodan", "generic", 'http.title:"Index of /"') is None
+
+    def test_ttl(self, tmp_path, mocker):
+        cache = QueryCache(
+            {"path": str(tmp_path / "cache.sqlite"), "ttl": {"generic": 60}}
+        )
+        cache.set("shodan", "generic", SHODAN_TEST_SEARCH_QUERY, SHODAN_SEARCH_JSON)
+        assert cache.get("shodan", "generic", SHODAN_TEST_SEARCH_QUERY) is not None
+        mocker.patch("time.time", return_value=time.time() + 120)
+        assert cache.get("shodan", "generic", SHODAN_TEST_SEARCH_QUERY) is None
+
+    def test_lru_eviction(self, tmp_path):
+        cache = QueryCache(
+            {"path": str(tmp_path / "cache.sqlite"), "max_size_mb": 0.0001}
+        )
+        payload = {"data": "x" * 40}
+        cache.set("shodan", "host", "1.1.1.1", payload)
+        cache.set("shodan", "host", "2.2.2.2", payload)
+        cache.get("shodan", "host", "1.1.1.1")
+        cache.set("shodan", "host", "3.3.3.3", payload)
+        assert cache.get("shodan", "host", "1.1.1.1") == payload
+        assert cache.get("shodan", "host", "2.2.2.2") is None
+        assert cache.get("shodan", "host", "3.3.3.3") == payload
+
+    def test_stats(self, tmp_path):
+        cache = QueryCache({"path": str(tmp_path / "cache.sqlite")})
+        cache.get("shodan", "host", SHODAN_TEST_HOST)
+        cache.set("shodan", "host", SHODAN_TEST_HOST, SHODAN_HOST_JSON)
+        cache.get("shodan", "host", SHODAN_TEST_HOST)
+        stats = cache.stats()
+        assert stats["entries"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_batched_statistics(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        cache = QueryCache({"path": path})
+        cache.set("shodan", "host", SHODAN_TEST_HOST, SHODAN_HOST_JSON)
+        for _ in range(3):
+            cache.get("shodan", "host", SHODAN_TEST_HOST)
+        # Lookups are buffered in memory until the next write, flush or close
+        assert cache._connection.in_transaction is False
+        cache.close()
+        assert QueryCache({"path": path}).stats()["hits"] == 3
+
+    def test_querying_with_cache(self, tmp_path, mocker):
+        cache = QueryCache({"path": str(tmp_path / "cache.sqlite")})
+        mock_shodan = MockShodanSourceConnector()
+        spy = mocker.spy(mock_shodan, "query_host_search")
+        for _ in range(3):
+            query_result, _ = Querying.host_query(
+                search=SHODAN_TEST_SEARCH_QUERY, connection=mock_shodan, cache=cache
+            )
+            assert query_result.element_count == 2
+        assert spy.call_count == 1
+
+        Querying.host_query(
+            search=SHODAN_TEST_SEARCH_QUERY,
+            connection=mock_shodan,
+            cache=cache,
+            refresh=True,
+        )
+        assert spy.call_count == 2
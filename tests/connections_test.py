@@ -0,0 +1,59 @@
+from pivot_track.lib.connections import ConnectionManager
+from pivot_track.lib.connectors import ShodanSourceConnector, CensysSourceConnector
+
+
+CONNECTIONS_CONFIG = {
+    "connectors": {
+        "shodan": {
+            "api_key": "CHANGEME",
+            "rate_limit": 1,
+            "pool_maxsize": 4,
+            "http_compress": False,
+        },
+        "censys": {
+            "api_id": "CHANGEME",
+            "api_secret": "CHANGEME",
+            "rate_limit": 1,
+            "enabled": False,
+        },
+    }
+}
+
+
+class TestConnectionManager:
+    def test_lazy_creation(self, mocker):
+        spy = mocker.spy(ShodanSourceConnector, "__init__")
+        connections = ConnectionManager(CONNECTIONS_CONFIG)
+        assert spy.call_count == 0
+        shodan_connection = connections.source_connection("shodan")
+        assert isinstance(shodan_connection, ShodanSourceConnector)
+        assert connections.source_connection("shodan") is shodan_connection
+        assert spy.call_count == 1
+
+    def test_disabled_and_unknown_connections(self, mocker):
+        spy = mocker.spy(CensysSourceConnector, "__init__")
+        connections = ConnectionManager(CONNECTIONS_CONFIG)
+        assert connections.source_connection("censys") is None
+        assert connections.source_connection("totalvirus") is None
+        assert connections.output_connection("shodan") is None
+        assert len(connections.source_connections()) == 1
+        assert spy.call_count == 0
+
+    def test_cached_connection_of_other_class(self):
+        connections = ConnectionManager(CONNECTIONS_CONFIG)
+        assert isinstance(
+            connections.source_connection("shodan"), ShodanSourceConnector
+        )
+        assert connections.output_connection("shodan") is None
+        assert isinstance(
+            connections.source_connection("shodan"), ShodanSourceConnector
+        )
+
+    def test_session_configuration(self):
+        connections = ConnectionManager(CONNECTIONS_CONFIG)
+        shodan_connection = connections.source_connection("shodan")
+        adapter = shodan_connection.session.get_adapter("https://api.shodan.io")
+        assert adapter._pool_maxsize == 4
+        assert shodan_connection.session.headers["Accept-Encoding"] == "identity"
+        connections.close()
+        assert connections.source_connection("shodan") is not shodan_connection
@@ -0,0 +1,121 @@
+from shodan import APIError
+
+from .mocks import SHODAN_SEARCH_JSON
+from pivot_track.lib.connectors import (
+    ShodanSourceConnector,
+    CredentialPool,
+    PooledCredential,
+)
+from pivot_track.lib.connectors.credentials import credential_configs
+
+
+class FakeShodanClient:
+    def __init__(self, name, errors=(), query_credits=100):
+        self.name = name
+        self.errors = list(errors)
+        self.query_credits = query_credits
+        self.calls = 0
+
+    def search(self, query):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SHODAN_SEARCH_JSON
+
+    def info(self):
+        return {"query_credits": self.query_credits}
+
+
+class PooledShodanSourceConnector(ShodanSourceConnector):
+    def __init__(self, clients, **config):
+        self.config = {
+            "rate_limit": 1000,
+            "retry": {"max_attempts": 3, "backoff_base": 0},
+            **config,
+        }
+        self._credential_pool = CredentialPool(
+            "shodan",
+            [
+                PooledCredential(client.name, client=client, rate_limit=1000)
+                for client in clients
+            ],
+        )
+
+
+class TestCredentialPool:
+    def test_credential_configs(self):
+        assert credential_configs({"api_key": "a", "rate_limit": 2}, ("api_key",)) == [
+            {"name": "0", "rate_limit": 2, "api_key": "a"}
+        ]
+        configs = credential_configs(
+            {
+                "rate_limit": 1,
+                "credentials": [
+                    {"name": "team", "api_key": "a", "rate_limit": 5},
+                    {"api_key": "b"},
+                ],
+            },
+            ("api_key",),
+        )
+        assert [(config["name"], config["rate_limit"]) for config in configs] == [
+            ("team", 5),
+            ("1", 1),
+        ]
+
+    def test_connector_creates_client_per_key(self):
+        connector = ShodanSourceConnector(
+            {"rate_limit": 1, "credentials": [{"api_key": "a"}, {"api_key": "b"}]}
+        )
+        clients = [
+            credential.client for credential in connector.credential_pool.credentials
+        ]
+        assert [client.api_key for client in clients] == ["a", "b"]
+        assert connector.shodan_client is clients[0]
+
+    def test_requests_are_spread(self):
+        clients = [FakeShodanClient("a"), FakeShodanClient("b")]
+        connector = PooledShodanSourceConnector(clients)
+        for _ in range(4):
+            assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+        assert [client.calls for client in clients] == [2, 2]
+
+    def test_rate_limited_key_is_rotated(self):
+        clients = [
+            FakeShodanClient("a", errors=[APIError("Rate limit reached")]),
+            FakeShodanClient("b"),
+        ]
+        connector = PooledShodanSourceConnector(clients)
+        assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+        assert [client.calls for client in clients] == [1, 1]
+
+    def test_failing_key_is_taken_out(self):
+        clients = [
+            FakeShodanClient("a", errors=[APIError("Invalid API key")]),
+            FakeShodanClient("b"),
+        ]
+        connector = PooledShodanSourceConnector(clients)
+        for _ in range(3):
+            assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+        assert [client.calls for client in clients] == [1, 3]
+        assert [
+            credential.name for credential in connector.credential_pool.available()
+        ] == ["b"]
+
+    def test_credits(self):
+        clients = [
+            FakeShodanClient("a", query_credits=1),
+            FakeShodanClient("b", query_credits=0),
+        ]
+        connector = PooledShodanSourceConnector(clients)
+        assert connector.refresh_credits() == 1
+        assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+        # Both keys are out of credits now
+        assert connector.credential_pool.available() == []
+        assert connector.query_host_search("x") is None
+        assert [client.calls for client in clients] == [1, 0]
+
+        clients[0].query_credits = 0
+        clients[1].query_credits = 10
+        assert connector.refresh_credits() == 10
+        assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+        assert connector.credential_pool.credentials[1].remaining_credits == 9
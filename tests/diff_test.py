@@ -0,0 +1,73 @@
+from .mocks import (
+    FakeShodanSourceConnector,
+    fake_opensearch_connector,
+    synthetic_ip,
+    tracking_cycle,
+    tracking_definition,
+)
+from pivot_track.lib.diff import EntitySnapshot, SnapshotDiff
+from pivot_track.lib.state import TrackingState
+
+
+class TestEntitySnapshot:
+    def test_from_entities(self):
+        snapshot = EntitySnapshot.from_entities(
+            ["10.0.0.2", "10.0.0.1", "2001:db8::1", "10.0.0.1", "invalid"],
+            ["Example.com", "example.com", "a.example.com"],
+        )
+        assert len(snapshot) == 5
+        assert snapshot.ips == ["10.0.0.1", "10.0.0.2", "2001:db8::1"]
+        assert snapshot.domain_names == ["a.example.com", "example.com"]
+
+    def test_record(self):
+        snapshot = EntitySnapshot.from_entities(
+            ["255.255.255.255", "0.0.0.1", "2001:db8::", "::1"], ["example.com"]
+        )
+        ipv4, ipv6, domains = snapshot.to_record()
+        assert len(ipv4) == 8
+        assert len(ipv6) == 32
+        loaded = EntitySnapshot.from_record(ipv4, ipv6, domains)
+        assert loaded == snapshot
+        assert loaded.ips == ["0.0.0.1", "255.255.255.255", "::1", "2001:db8::"]
+        assert EntitySnapshot.from_record(None, None, None) == EntitySnapshot()
+
+    def test_diff(self):
+        previous = EntitySnapshot.from_entities(["10.0.0.1", "10.0.0.2"], ["a.com"])
+        current = EntitySnapshot.from_entities(["10.0.0.2", "::1"], ["a.com", "b.com"])
+        diff = SnapshotDiff(previous, current)
+        assert diff.added.ips == ["::1"]
+        assert diff.added.domain_names == ["b.com"]
+        assert diff.removed.ips == ["10.0.0.1"]
+        assert diff.retained.to_set() == {"10.0.0.2", "a.com"}
+        assert diff.changed
+        assert not SnapshotDiff(previous, previous).changed
+
+    def test_merge(self):
+        # The host moved from one query to another, so it is not gone
+        first = SnapshotDiff(
+            EntitySnapshot.from_entities(["10.0.0.1"]), EntitySnapshot()
+        )
+        second = SnapshotDiff(
+            EntitySnapshot(), EntitySnapshot.from_entities(["10.0.0.1", "10.0.0.2"])
+        )
+        merged = SnapshotDiff.merge([first, second])
+        assert len(merged.removed) == 0
+        assert merged.added.ips == ["10.0.0.2"]
+        assert merged.retained.ips == ["10.0.0.1"]
+
+
+class TestTrackingDiff:
+    def test_gone_elements(self):
+        definition, state = tracking_definition(), TrackingState()
+        connection = FakeShodanSourceConnector(3)
+        assert tracking_cycle(definition, connection, state).removed == []
+
+        connection.offset = 1
+        output_connection = fake_opensearch_connector()
+        notification = tracking_cycle(definition, connection, state, output_connection)
+        assert [host.ip for host in notification.removed] == [synthetic_ip(0)]
+        # Retained hosts are not looked up in OpenSearch anymore, only the added one
+        assert [
+            element.ip for element in notification.new if hasattr(element, "ip")
+        ] == [synthetic_ip(3)]
+        assert output_connection.opensearch_client.calls["search"] < 3
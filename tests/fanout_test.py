@@ -0,0 +1,101 @@
+import threading
+import time
+
+from pivot_track.lib.connectors import FanoutOutputConnector, OutputConnector
+
+
+class RecordingOutput(OutputConnector):
+    def __init__(self, delay: float = 0.0, fail: bool = False, block=None):
+        self.delay = delay
+        self.fail = fail
+        self.block = block
+        self.query_results = list()
+        self.tracking_results = list()
+
+    def query_output(self, query_result, raw=False):
+        if self.block is not None:
+            self.block.wait()
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("sink failed")
+        self.query_results.append(query_result)
+
+    def tracking_output(self, query_result, definition, known=None):
+        self.tracking_results.append(query_result)
+        return [f"new-{query_result}"]
+
+    def query_result_to_com_list(self, query_result) -> list:
+        return super().query_result_to_com_list(query_result)
+
+
+class TestFanoutOutputConnector:
+    def test_all_sinks_get_batches(self):
+        first, second = RecordingOutput(), RecordingOutput()
+        fanout = FanoutOutputConnector({"first": first, "second": second})
+        for batch in range(10):
+            fanout.query_output(batch)
+        fanout.flush()
+        assert first.query_results == second.query_results == list(range(10))
+        fanout.close()
+
+    def test_slow_sink_is_isolated(self):
+        block = threading.Event()
+        fast, slow = RecordingOutput(), RecordingOutput(block=block)
+        fanout = FanoutOutputConnector({"fast": fast, "slow": slow})
+        for batch in range(5):
+            fanout.query_output(batch)
+        fanout.primary.join()
+        assert fast.query_results == list(range(5))
+        assert slow.query_results == []
+        block.set()
+        fanout.close()
+        assert slow.query_results == list(range(5))
+
+    def test_full_queue_drops_only_for_slow_sink(self):
+        block = threading.Event()
+        fast, slow = RecordingOutput(), RecordingOutput(block=block)
+        fanout = FanoutOutputConnector(
+            {"fast": fast, "slow": slow}, queue_size=1, put_timeout=0.01
+        )
+        for batch in range(5):
+            fanout.query_output(batch)
+        block.set()
+        fanout.flush()
+        assert fast.query_results == list(range(5))
+        assert fanout.sinks[0].dropped > 0
+        assert len(slow.query_results) == 5 - fanout.sinks[0].dropped
+        fanout.close()
+
+    def test_failing_sink(self):
+        good, bad = RecordingOutput(), RecordingOutput(fail=True)
+        fanout = FanoutOutputConnector({"bad": bad, "good": good})
+        fanout.query_output(1)
+        fanout.close()
+        assert good.query_results == [1]
+
+    def test_tracking_output_of_primary(self):
+        primary, secondary = RecordingOutput(), RecordingOutput()
+        fanout = FanoutOutputConnector({"primary": primary, "secondary": secondary})
+        assert fanout.tracking_output("batch", definition=None) == ["new-batch"]
+        fanout.flush()
+        assert secondary.tracking_results == ["batch"]
+        assert fanout.available is True
+        fanout.close()
+
+    def test_tracking_output_without_known(self):
+        class LegacyOutput(RecordingOutput):
+            def tracking_output(self, query_result, definition):
+                self.tracking_results.append(query_result)
+                return ["legacy"]
+
+        primary, legacy = RecordingOutput(), LegacyOutput()
+        fanout = FanoutOutputConnector({"primary": primary, "legacy": legacy})
+        assert fanout.tracking_output("batch", None, known={"10.0.0.1"}) == [
+            "new-batch"
+        ]
+        fanout.close()
+        assert legacy.tracking_results == ["batch"]
+
+        fanout = FanoutOutputConnector({"legacy": LegacyOutput()})
+        assert fanout.tracking_output("batch", None, known={"10.0.0.1"}) == ["legacy"]
+        fanout.close()
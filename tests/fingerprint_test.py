@@ -0,0 +1,108 @@
+from common_osint_model import Host
+
+from .mocks import (
+    FakeShodanSourceConnector,
+    shodan_match,
+    synthetic_ip,
+    tracking_cycle,
+    tracking_definition,
+)
+from pivot_track.lib.fingerprint import HostFingerprint, http_title_hash
+from pivot_track.lib.state import TrackingState
+
+
+class PortChangingShodanSourceConnector(FakeShodanSourceConnector):
+    port = None
+
+    def query_host_search(self, query: str):
+        result = super().query_host_search(query)
+        if self.port is not None:
+            result["matches"][0]["port"] = self.port
+        return result
+
+
+class BannerShodanSourceConnector(FakeShodanSourceConnector):
+    """Returns two banners (ports 80 and 443) of the same host, in the order of `reverse`."""
+
+    reverse = False
+
+    def query_host_search(self, query: str):
+        result = super().query_host_search(query)
+        first, second = shodan_match(0), shodan_match(1)
+        for key in ("ip", "ip_str", "asn", "isp", "org", "location"):
+            if key in first:
+                second[key] = first[key]
+        second["http"]["host"] = first["http"]["host"]
+        first["port"], second["port"] = 80, 443
+        matches = [second, first] if self.reverse else [first, second]
+        result["matches"], result["total"] = matches, len(matches)
+        return result
+
+
+class TestHostFingerprint:
+    def test_http_title_hash(self):
+        assert http_title_hash("<html><TITLE> Login\n Page</title>") == http_title_hash(
+            "<title>Login Page</title>"
+        )
+        assert http_title_hash("<html></html>") is None
+        assert http_title_hash(None) is None
+
+    def test_from_host(self):
+        host = Host.from_shodan(shodan_match(0))
+        fingerprint = HostFingerprint.from_host(host)
+        assert fingerprint.ip == synthetic_ip(0)
+        assert fingerprint.attributes["ports"] == [shodan_match(0)["port"]]
+
+        loaded = HostFingerprint.from_dict(fingerprint.ip, fingerprint.attributes)
+        assert loaded.digest == fingerprint.digest
+        assert fingerprint.changes(loaded) == []
+
+    def test_changes(self):
+        previous = HostFingerprint("10.0.0.1", ports=[443], jarm=["a"], asn=1)
+        current = HostFingerprint("10.0.0.1", ports=[443, 8443], jarm=["a"], asn=2)
+        assert current.changes(previous) == ["ports", "asn"]
+
+
+class TestTrackingHostChanges:
+    def test_port_change(self):
+        definition, state = (
+            tracking_definition(notify_changes=["ports"]),
+            TrackingState(),
+        )
+        connection = PortChangingShodanSourceConnector(3)
+        assert tracking_cycle(definition, connection, state).changed == []
+        assert tracking_cycle(definition, connection, state).changed == []
+
+        connection.port = 65000
+        changed = tracking_cycle(definition, connection, state).changed
+        assert [change.host.ip for change in changed] == [synthetic_ip(0)]
+        assert changed[0].attributes == ["ports"]
+        assert changed[0].current.attributes["ports"] == [65000]
+
+    def test_banner_order(self):
+        definition, state = tracking_definition(notify_changes=True), TrackingState()
+        connection = BannerShodanSourceConnector(0)
+        assert tracking_cycle(definition, connection, state).changed == []
+        connection.reverse = True
+        assert tracking_cycle(definition, connection, state).changed == []
+        stored = state.fingerprints(definition.uuid, "shodan")
+        assert stored[synthetic_ip(0)][1]["ports"] == [80, 443]
+
+    def test_without_opt_in(self):
+        definition, state = tracking_definition(), TrackingState()
+        connection = PortChangingShodanSourceConnector(3)
+        tracking_cycle(definition, connection, state)
+        connection.port = 65000
+        assert tracking_cycle(definition, connection, state).changed == []
+        # The fingerprint is stored anyway, for definitions that opt in later
+        stored = state.fingerprints(definition.uuid, "shodan")
+        assert stored[synthetic_ip(0)][1]["ports"] == [65000]
+
+    def test_notified_changes(self):
+        assert tracking_definition(notify_changes=True).notified_changes(
+            ["ports", "asn"]
+        ) == ["ports", "asn"]
+        assert tracking_definition(notify_changes=["asn"]).notified_changes(
+            ["ports", "asn"]
+        ) == ["asn"]
+        assert tracking_definition().notified_changes(["ports"]) == []
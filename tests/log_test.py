@@ -0,0 +1,79 @@
+import json
+import logging
+
+from pivot_track.lib import log
+from pivot_track.lib.query import QueryResult
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = list()
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _logger(name: str, logging_config: dict) -> tuple[logging.Logger, ListHandler]:
+    handler = ListHandler()
+    log.configure_handlers([handler], logging_config)
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, handler
+
+
+class TestLogging:
+    def test_json_format_with_correlation(self):
+        logger, handler = _logger("pivot_track.test.json", {"format": "json"})
+        with log.correlation(cycle_id="c1"):
+            with log.correlation(definition_id="d1"):
+                logger.info("Found %d hosts.", 3)
+            logger.info("Cycle done.")
+        logger.info("Outside.")
+
+        entries = [json.loads(line) for line in handler.lines]
+        assert entries[0]["message"] == "Found 3 hosts."
+        assert entries[0]["cycle_id"] == "c1"
+        assert entries[0]["definition_id"] == "d1"
+        assert entries[0]["level"] == "INFO"
+        assert entries[0]["logger"] == "pivot_track.test.json"
+        assert "definition_id" not in entries[1]
+        assert "cycle_id" not in entries[2]
+
+    def test_text_format(self):
+        logger, handler = _logger("pivot_track.test.text", dict())
+        logger.info("Hello %s", "world")
+        assert handler.lines[0].endswith("pivot_track.test.text INFO Hello world")
+
+    def test_sampling(self):
+        logger, handler = _logger(
+            "pivot_track.test.sampling.child",
+            {"format": "json", "sampling": {"pivot_track.test.sampling": 10}},
+        )
+        for index in range(25):
+            logger.debug("Element %d", index)
+        logger.warning("Never sampled")
+
+        entries = [json.loads(line) for line in handler.lines]
+        assert [entry["message"] for entry in entries] == [
+            "Element 0",
+            "Element 10",
+            "Element 20",
+            "Never sampled",
+        ]
+        assert entries[0]["sample_rate"] == 10
+
+    def test_sampling_other_logger(self):
+        logger, handler = _logger(
+            "pivot_track.test.other",
+            {"sampling": {"pivot_track.test.sampling": 10}},
+        )
+        for index in range(5):
+            logger.debug("Element %d", index)
+        assert len(handler.lines) == 5
+
+    def test_unknown_source_does_not_print(self, capsys):
+        assert QueryResult({"unknown": "payload"}).source is None
+        assert capsys.readouterr().out == ""
@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+
+from common_osint_model import Domain, Host
+
+from .mocks import (
+    FakeCensysSourceConnector,
+    FakeShodanSourceConnector,
+    censys_host,
+    shodan_host,
+    synthetic_ip,
+)
+from pivot_track.lib.merge import merge_hosts
+from pivot_track.lib.query import MergedQueryResult, Querying, QueryResult
+
+
+def _host(ip: str, source: str, ports: list, domains: list, day: int) -> Host:
+    return Host(
+        ip=ip,
+        ports=ports,
+        domains=[Domain(domain=domain) for domain in domains],
+        source=source,
+        first_seen=datetime(2024, 10, day, tzinfo=timezone.utc),
+        last_seen=datetime(2024, 10, day, tzinfo=timezone.utc),
+    )
+
+
+class TestMergeHosts:
+    def test_merge_by_ip(self):
+        merged = merge_hosts(
+            [
+                _host("192.0.2.1", "shodan", [443], ["a.example"], 2),
+                _host("192.0.2.2", "shodan", [22], [], 1),
+                _host("192.0.2.1", "censys", [80, 443], ["a.example", "b.example"], 5),
+            ]
+        )
+        assert [host.ip for host in merged] == ["192.0.2.1", "192.0.2.2"]
+        host = merged[0]
+        assert host.ports == [80, 443]
+        assert [domain.domain for domain in host.domains] == ["a.example", "b.example"]
+        assert host.source == "shodan,censys"
+        assert host.first_seen.day == 2
+        assert host.last_seen.day == 5
+
+    def test_single_host_is_unchanged(self):
+        host = _host("192.0.2.1", "shodan", [443], [], 1)
+        assert merge_hosts([host]) == [host]
+
+    def test_services_are_merged_by_port(self):
+        ip = synthetic_ip(1)
+        shodan = QueryResult(shodan_host(ip), query_command="host").com_result
+        censys = QueryResult(censys_host(ip), query_command="host").com_result
+        merged = merge_hosts([shodan, censys])[0]
+        ports = [service.port for service in merged.services]
+        assert len(ports) == len(set(ports))
+        assert set(ports) == {
+            service.port for service in shodan.services + censys.services
+        }
+
+
+class TestMergedQueryResult:
+    def test_fan_out(self):
+        shodan = FakeShodanSourceConnector(3)
+        censys = FakeCensysSourceConnector(3)
+        results = dict(
+            (connection.short_name, result)
+            for connection, result in Querying.fan_out(
+                [shodan, censys],
+                lambda connection: Querying.host_query("query", connection)[0],
+            )
+        )
+        assert set(results) == {"shodan", "censys"}
+
+        merged = MergedQueryResult(list(results.values()), "generic", "query")
+        assert merged.is_collection
+        assert merged.element_count == 3
+        assert all(
+            set(host.source.split(",")) == {"shodan", "censys"}
+            for host in merged.com_result
+        )
+
+    def test_failed_source_is_skipped(self):
+        def call(connection):
+            if connection.short_name == "censys":
+                raise RuntimeError("source failed")
+            return connection.short_name
+
+        results = list(
+            Querying.fan_out(
+                [
+                    FakeShodanSourceConnector(1),
+                    FakeCensysSourceConnector(1),
+                ],
+                call,
+            )
+        )
+        assert [result for _, result in results] == ["shodan"]
+
+    def test_source_without_host(self, capsys):
+        from pivot_track.cli import _output_sources
+
+        class UnknownHostCensysSourceConnector(FakeCensysSourceConnector):
+            def query_host(self, host: str):
+                return None
+
+        ip = synthetic_ip(1)
+        connections = [
+            FakeShodanSourceConnector(0),
+            UnknownHostCensysSourceConnector(0),
+        ]
+        merged = MergedQueryResult(
+            [Querying.host(ip, connection) for connection in connections], "host", ip
+        )
+        assert [host.source for host in merged.com_result] == ["shodan"]
+
+        for merge in (True, False):
+            _output_sources(
+                dict(),
+                Querying.fan_out(
+                    connections, lambda connection: Querying.host(ip, connection)
+                ),
+                output="json",
+                raw=False,
+                merge=merge,
+                connections=None,
+                query_command="host",
+                search_term=ip,
+            )
+            output = capsys.readouterr().out
+            assert ip in output
+            assert "null" not in output
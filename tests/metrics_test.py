@@ -0,0 +1,86 @@
+import pytest
+import urllib.request
+
+from .mocks import (
+    MockOpenSearchConnector,
+    MockShodanSourceConnector,
+    SHODAN_SEARCH_JSON,
+    tracking_definition,
+)
+from pivot_track.lib import metrics
+from pivot_track.lib.query import QueryResult, CONVERSION_SECONDS
+from pivot_track.lib.track import Tracking, TRACKING_NEW_ELEMENTS
+
+
+class TestMetrics:
+    def test_counter(self):
+        registry = metrics.MetricsRegistry()
+        counter = registry.counter("test_total", "Test counter.", ["source"])
+        counter.inc(source="shodan")
+        counter.inc(2, source="shodan")
+        assert counter.value(source="shodan") == 3
+        assert 'test_total{source="shodan"} 3' in registry.render()
+        with pytest.raises(ValueError):
+            counter.inc(-1, source="shodan")
+        with pytest.raises(ValueError):
+            counter.inc(command="host")
+
+    def test_histogram(self):
+        registry = metrics.MetricsRegistry()
+        histogram = registry.histogram(
+            "test_seconds", "Test histogram.", buckets=(1, 5)
+        )
+        histogram.observe(0.5)
+        histogram.observe(3)
+        rendered = registry.render()
+        assert "# TYPE test_seconds histogram" in rendered
+        assert 'test_seconds_bucket{le="1"} 1' in rendered
+        assert 'test_seconds_bucket{le="5"} 2' in rendered
+        assert 'test_seconds_bucket{le="+Inf"} 2' in rendered
+        assert "test_seconds_sum 3.5" in rendered
+        assert "test_seconds_count 2" in rendered
+
+    def test_registry_type_conflict(self):
+        registry = metrics.MetricsRegistry()
+        registry.counter("test_metric", "Test metric.")
+        with pytest.raises(ValueError):
+            registry.gauge("test_metric", "Test metric.")
+
+    def test_textfile(self, tmp_path):
+        registry = metrics.MetricsRegistry()
+        registry.gauge("test_gauge", "Test gauge.").set(42)
+        registry.write_textfile(tmp_path / "pivottrack.prom")
+        assert "test_gauge 42" in (tmp_path / "pivottrack.prom").read_text()
+
+    def test_server(self):
+        registry = metrics.MetricsRegistry()
+        registry.counter("test_total", "Test counter.").inc()
+        server = metrics.MetricsServer(port=0, metrics_registry=registry).start()
+        try:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{server.port}/metrics"
+            ) as response:
+                assert "test_total 1" in response.read().decode("utf-8")
+        finally:
+            server.stop()
+
+    def test_init_metrics_without_port(self):
+        assert metrics.init_metrics(dict()) is None
+        assert metrics.init_metrics({"metrics": {"textfile": "x.prom"}}) is None
+
+
+class TestInstrumentation:
+    def test_conversion(self):
+        count = CONVERSION_SECONDS.count(source="shodan")
+        QueryResult(SHODAN_SEARCH_JSON, "generic", "product:nginx").com_result
+        assert CONVERSION_SECONDS.count(source="shodan") == count + 1
+
+    def test_tracking_new_elements(self):
+        definition = tracking_definition()
+        Tracking.track_definitions(
+            [definition], [MockShodanSourceConnector()], MockOpenSearchConnector()
+        )
+        assert (
+            TRACKING_NEW_ELEMENTS.value(definition=definition.uuid, source="shodan")
+            == 2
+        )
@@ -1,8 +1,15 @@
+import copy
+import ipaddress
+import time
+from collections import defaultdict
+from uuid import uuid4
+
 from pivot_track.lib.connectors import (
     CensysSourceConnector,
     ShodanSourceConnector,
     OpenSearchConnector,
 )
+from pivot_track.lib.track import Tracking, TrackingDefinition
 
 # Censys examples based on https://github.com/censys/censys-python/blob/main/tests/search/v2/test_hosts.py
 CENSYS_TEST_HOST = "8.8.8.8"
@@ -248,6 +255,70 @@ SHODAN_SEARCH_JSON = {
 }
 
 
+# Synthetic payloads derived from the examples above, with the same shape, for any number of hosts.
+# They are shared with the benchmarks (see `benchmarks.run`).
+BASE_IP = int(ipaddress.IPv4Address("10.0.0.0"))
+
+
+def synthetic_ip(index: int) -> str:
+    """Returns a unique IPv4 address for a host index."""
+    return str(ipaddress.IPv4Address(BASE_IP + index))
+
+
+def synthetic_domain(index: int) -> str:
+    return f"host-{index}.example.com"
+
+
+def shodan_match(index: int) -> dict:
+    """Returns one Shodan search match (banner) for the host with the given index."""
+    match = copy.deepcopy(SHODAN_SEARCH_JSON["matches"][index % 2])
+    ip = synthetic_ip(index)
+    match["ip"] = BASE_IP + index
+    match["ip_str"] = ip
+    match["hostnames"] = [synthetic_domain(index)]
+    match["domains"] = ["example.com"]
+    match["http"]["host"] = ip
+    return match
+
+
+def shodan_search(size: int, offset: int = 0) -> dict:
+    """Returns a Shodan search response with `size` matches."""
+    return {
+        "matches": [shodan_match(offset + index) for index in range(size)],
+        "facets": copy.deepcopy(SHODAN_SEARCH_JSON["facets"]),
+        "total": size,
+    }
+
+
+def shodan_host(ip: str) -> dict:
+    """Returns a Shodan host response for the given IP."""
+    host = copy.deepcopy(SHODAN_HOST_JSON)
+    host["ip"] = int(ipaddress.ip_address(ip))
+    host["ip_str"] = ip
+    for banner in host["data"]:
+        banner["ip_str"] = ip
+    return host
+
+
+def censys_hit(index: int) -> dict:
+    """Returns one Censys search hit for the host with the given index."""
+    hit = copy.deepcopy(CENSYS_SEARCH_JSON[index % 2])
+    hit["ip"] = synthetic_ip(index)
+    return hit
+
+
+def censys_search(size: int, offset: int = 0) -> list:
+    """Returns a Censys search response (one list of hits) with `size` hits."""
+    return [censys_hit(offset + index) for index in range(size)]
+
+
+def censys_host(ip: str) -> dict:
+    """Returns a Censys host response for the given IP."""
+    host = copy.deepcopy(CENSYS_HOST_JSON)
+    host["ip"] = ip
+    return host
+
+
 class MockShodanSourceConnector(ShodanSourceConnector):
     def __init__(self):
         pass
@@ -294,3 +365,208 @@ class MockOpenSearchConnector(OpenSearchConnector):
         for com_result_element in com_list:
             new_elements.append(com_result_element)
         return new_elements
+
+
+# In-process stand-ins for Shodan, Censys and OpenSearch, that return synthetic payloads. The fake
+# OpenSearch client keeps documents in memory, with an inverted index for the "match" filters that
+# Pivot Track uses. Both can simulate network latency, so that benchmark cycles behave like real ones.
+
+
+class FakeShodanSourceConnector(ShodanSourceConnector):
+    def __init__(self, size: int, offset: int = 0, latency: float = 0.0):
+        self.config = {"rate_limit": None}
+        self.size = size
+        self.offset = offset
+        self.latency = latency
+        self.calls = 0
+
+    @property
+    def short_name(self):
+        return "shodan"
+
+    def query_host_search(self, query: str):
+        self.calls += 1
+        time.sleep(self.latency)
+        return shodan_search(self.size, offset=self.offset)
+
+    def query_host(self, host: str):
+        self.calls += 1
+        time.sleep(self.latency)
+        return shodan_host(host)
+
+    def query_hosts(self, hosts: list) -> dict:
+        self.calls += 1
+        time.sleep(self.latency)
+        return {host: shodan_host(host) for host in hosts}
+
+
+class FakeCensysSourceConnector(CensysSourceConnector):
+    def __init__(self, size: int, offset: int = 0, latency: float = 0.0):
+        self.config = {"rate_limit": None}
+        self.size = size
+        self.offset = offset
+        self.latency = latency
+        self.calls = 0
+
+    @property
+    def short_name(self):
+        return "censys"
+
+    def query_host_search(self, query: str):
+        self.calls += 1
+        time.sleep(self.latency)
+        return censys_search(self.size, offset=self.offset)
+
+    def query_host(self, host: str):
+        self.calls += 1
+        time.sleep(self.latency)
+        return censys_host(host)
+
+
+def _flatten(document, prefix: str = ""):
+    """Yields (dotted field name, value) pairs of a (nested) document. Lists are flattened, like OpenSearch does."""
+    if isinstance(document, dict):
+        for key, value in document.items():
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(document, (list, tuple)):
+        for value in document:
+            yield from _flatten(value, prefix)
+    else:
+        yield prefix, str(document)
+
+
+class FakeIndices:
+    def __init__(self, client):
+        self.client = client
+
+    def exists(self, index: str):
+        return index in self.client.documents
+
+    def create(self, index: str, body: dict = None):
+        self.client.documents.setdefault(index, list())
+        return {"acknowledged": True, "index": index}
+
+
+class FakeOpenSearch:
+    """In-memory replacement for `opensearchpy.OpenSearch`, supporting the calls of `OpenSearchConnector`."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.documents = defaultdict(list)
+        # index -> field -> value -> document ids
+        self.inverted = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
+        self.indices = FakeIndices(self)
+        self.calls = defaultdict(int)
+
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+    def index(self, index: str, body: dict, refresh: bool = False):
+        self.calls["index"] += 1
+        time.sleep(self.latency)
+        document_id = len(self.documents[index])
+        self.documents[index].append(body)
+        for field, value in _flatten(body):
+            self.inverted[index][field][value].add(document_id)
+        return {"_index": index, "_id": str(document_id), "result": "created"}
+
+    def search(self, body: dict, index: str, params: dict = None):
+        self.calls["search"] += 1
+        time.sleep(self.latency)
+        matching = None
+        for query_filter in body["query"]["bool"]["filter"]:
+            for field, value in query_filter["match"].items():
+                document_ids = self.inverted[index][field].get(str(value), set())
+                matching = (
+                    set(document_ids) if matching is None else matching & document_ids
+                )
+        matching = matching or set()
+        size = (params or dict()).get("size", 10)
+        return {
+            "hits": {
+                "total": {"value": len(matching), "relation": "eq"},
+                "hits": [
+                    {"_source": self.documents[index][document_id]}
+                    for document_id in sorted(matching)[:size]
+                ],
+            }
+        }
+
+
+def fake_opensearch_connector(latency: float = 0.0) -> OpenSearchConnector:
+    """Returns a real `OpenSearchConnector`, that talks to an in-process `FakeOpenSearch` client."""
+    connector = OpenSearchConnector.__new__(OpenSearchConnector)
+    connector.config = {"index_prefix": "benchmark-"}
+    connector.opensearch_client = FakeOpenSearch(latency=latency)
+    connector.available = True
+    return connector
+
+
+DEFINITION_FIELDS = ("title", "priority", "notify_changes")
+
+
+def tracking_definition(
+    *sources: str, query: str = "x", **fields
+) -> TrackingDefinition:
+    """Returns a definition with one `host_generic` query per source (Shodan by default). Keyword arguments
+    are set on the definition (see `DEFINITION_FIELDS`) or else on each query (e.g. expand, precheck)."""
+    definition = {"uuid": str(uuid4()), "query": list()}
+    query_fields = dict()
+    for key, value in fields.items():
+        if key in DEFINITION_FIELDS:
+            definition[key] = value
+        else:
+            query_fields[key] = value
+    for source in sources or ("shodan",):
+        definition["query"].append(
+            {
+                "source": source,
+                "command": "host_generic",
+                "query": query,
+                **query_fields,
+            }
+        )
+    return TrackingDefinition.from_dict(definition)
+
+
+class RecordingNotification:
+    """Records the new, removed and changed items of tracking cycles."""
+
+    def __init__(self):
+        self.new = list()
+        self.removed = list()
+        self.changed = list()
+
+    def notify(self, definition, notify_items):
+        self.new.extend(notify_items)
+
+    def notify_removed(self, definition, removed_items):
+        self.removed.extend(removed_items)
+
+    def notify_changed(self, definition, changed_items):
+        self.changed.extend(changed_items)
+
+
+def tracking_cycle(
+    definition, connections, state=None, output_connection=None
+) -> RecordingNotification:
+    """Runs one tracking cycle of a definition and returns the recorded notifications. Without an output
+    connection, a fake OpenSearch connector is used."""
+    notification = RecordingNotification()
+    Tracking.track_definitions(
+        definitions=[definition],
+        source_connections=connections
+        if isinstance(connections, list)
+        else [connections],
+        output_connection=(
+            output_connection
+            if output_connection is not None
+            else fake_opensearch_connector()
+        ),
+        notification_connection=notification,
+        state=state,
+    )
+    return notification
@@ -0,0 +1,217 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from common_osint_model import Host, Domain
+
+from .mocks import tracking_definition
+from pivot_track.lib.connectors import FileConnector, WebhookConnector
+from pivot_track.lib.connectors.notification import (
+    BufferedNotificationConnector,
+    DedupWindow,
+    NotificationGroup,
+)
+from pivot_track.lib.connectors.resilience import RetryPolicy
+
+
+def _hosts(count: int, offset: int = 0):
+    return [
+        Host(ip=f"10.0.{(offset + i) // 256}.{(offset + i) % 256}")
+        for i in range(count)
+    ]
+
+
+class RecordingConnector(BufferedNotificationConnector):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = list()
+
+    def deliver(self, notifications):
+        self.batches.append(list(notifications))
+
+
+class TestBufferedNotifications:
+    def test_batches(self):
+        connector = RecordingConnector(batch_size=400)
+        definition = tracking_definition(title="Test")
+        for offset in range(0, 1000, 100):
+            connector.notify(definition=definition, notify_items=_hosts(100, offset))
+        assert [len(batch) for batch in connector.batches] == [400, 400]
+        connector.flush()
+        assert [len(batch) for batch in connector.batches] == [400, 400, 200]
+        connector.flush()
+        assert len(connector.batches) == 3
+
+    def test_digest(self):
+        connector = RecordingConnector(batch_size=10, digest=True)
+        connector.notify(
+            definition=tracking_definition(title="Test"), notify_items=_hosts(100)
+        )
+        connector.notify_removed(
+            definition=tracking_definition(title="Test"), removed_items=_hosts(5)
+        )
+        assert connector.batches == []
+        connector.flush()
+        assert len(connector.batches) == 1
+        assert len(connector.batches[0]) == 105
+
+    def test_dedup_across_definitions(self):
+        connector = RecordingConnector(dedup_window=60)
+        connector.notify(
+            definition=tracking_definition(title="a"), notify_items=_hosts(3)
+        )
+        connector.notify(
+            definition=tracking_definition(title="b"), notify_items=_hosts(4)
+        )
+        # Removals of the same host are not duplicates of its addition
+        connector.notify_removed(
+            definition=tracking_definition(title="a"), removed_items=_hosts(1)
+        )
+        connector.flush()
+        notifications = connector.batches[0]
+        assert [(n.title, n.kind) for n in notifications] == [
+            ("a", "new"),
+            ("a", "new"),
+            ("a", "new"),
+            ("b", "new"),
+            ("a", "removed"),
+        ]
+
+    def test_dedup_window_expires(self):
+        window = DedupWindow(10)
+        assert not window.seen("a", now=0)
+        assert window.seen("a", now=5)
+        assert not window.seen("b", now=6)
+        assert not window.seen("a", now=11)
+        assert len(window) == 2
+
+    def test_group(self):
+        first, second = RecordingConnector(), RecordingConnector()
+        group = NotificationGroup([first, second])
+        group.notify(
+            definition=tracking_definition(title="Test"), notify_items=_hosts(2)
+        )
+        group.close()
+        assert len(first.batches[0]) == len(second.batches[0]) == 2
+
+
+class TestFileConnector:
+    def test_write(self, tmp_path):
+        file_path = tmp_path / "findings.txt"
+        connector = FileConnector(file_path, batch_size=1000)
+        definition = tracking_definition(title="Cobalt Strike")
+        connector.notify(
+            definition=definition,
+            notify_items=_hosts(2) + [Domain(domain="example.com")],
+        )
+        connector.notify_removed(definition=definition, removed_items=_hosts(1, 5))
+        assert not file_path.exists()
+        connector.flush()
+        content = file_path.read_text()
+        assert (
+            f'New Tracking Results for "Cobalt Strike" ({definition.uuid}):\n10.0.0.0\n10.0.0.1\nexample.com'
+            in content
+        )
+        assert "Gone Tracking Results" in content and "10.0.0.5" in content
+
+    def test_rotation(self, tmp_path):
+        file_path = tmp_path / "findings.txt"
+        connector = FileConnector(
+            file_path, batch_size=50, max_bytes=1000, backup_count=2
+        )
+        for offset in range(0, 500, 50):
+            connector.notify(
+                definition=tracking_definition(title="Test"),
+                notify_items=_hosts(50, offset),
+            )
+        connector.flush()
+        assert file_path.stat().st_size <= 1000
+        assert (tmp_path / "findings.txt.1").exists()
+        assert (tmp_path / "findings.txt.2").exists()
+        assert not (tmp_path / "findings.txt.3").exists()
+
+    def test_from_config(self, tmp_path):
+        assert FileConnector.from_config({}) is None
+        connector = FileConnector.from_config(
+            {
+                "tracking_file": str(tmp_path / "findings.txt"),
+                "notifications": {"digest": True, "file": {"max_bytes": 10}},
+            }
+        )
+        assert connector.digest and connector.max_bytes == 10
+
+
+@pytest.fixture
+def webhook_server():
+    received = {"payloads": list(), "connections": set(), "statuses": list()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            status = received["statuses"].pop(0) if received["statuses"] else 200
+            if status == 200:
+                received["payloads"].append(json.loads(body))
+                received["connections"].add(self.client_address)
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/hook", received
+    server.shutdown()
+    server.server_close()
+
+
+class TestWebhookConnector:
+    def test_batched_keep_alive(self, webhook_server):
+        url, received = webhook_server
+        connector = WebhookConnector(url, batch_size=250)
+        definition = tracking_definition(title="Test")
+        for offset in range(0, 1000, 100):
+            connector.notify(definition=definition, notify_items=_hosts(100, offset))
+        connector.close()
+        assert [len(payload["notifications"]) for payload in received["payloads"]] == [
+            250
+        ] * 4
+        assert received["payloads"][0]["summary"] == {"new": 250}
+        assert received["payloads"][0]["notifications"][0]["definition"] == str(
+            definition.uuid
+        )
+        # All requests used the same (keep-alive) connection
+        assert len(received["connections"]) == 1
+
+    def test_retry(self, webhook_server):
+        url, received = webhook_server
+        received["statuses"] = [503]
+        connector = WebhookConnector(
+            url, retry_policy=RetryPolicy(max_attempts=2, backoff_base=0.01)
+        )
+        connector.notify(
+            definition=tracking_definition(title="Test"), notify_items=_hosts(3)
+        )
+        connector.flush()
+        assert len(received["payloads"]) == 1
+
+    def test_from_config(self):
+        assert WebhookConnector.from_config({"notifications": {}}) is None
+        connector = WebhookConnector.from_config(
+            {
+                "notifications": {
+                    "batch_size": 10,
+                    "webhook": {
+                        "url": "http://127.0.0.1/hook",
+                        "headers": {"X-Key": "a"},
+                    },
+                }
+            }
+        )
+        assert connector.batch_size == 10
+        assert connector.session.headers["X-Key"] == "a"
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+
+from .mocks import FakeShodanSourceConnector, synthetic_ip
+from pivot_track.lib.connectors.parquet import COLUMNS, host_columns
+from pivot_track.lib.query import Querying
+
+
+def _hosts(size: int):
+    query_result, _ = Querying.host_query(
+        "product:nginx", FakeShodanSourceConnector(size)
+    )
+    return query_result
+
+
+class TestHostColumns:
+    def test_columns(self):
+        timestamp = datetime.now(timezone.utc)
+        columns = host_columns(
+            _hosts(3).com_result, timestamp, context="query", query="product:nginx"
+        )
+        assert set(columns) == set(COLUMNS)
+        assert columns["ip"] == [synthetic_ip(i) for i in range(3)]
+        assert columns["timestamp"] == [timestamp] * 3
+        assert columns["query"] == ["product:nginx"] * 3
+        assert columns["command"] == [None] * 3
+        assert all(isinstance(port, int) for port in columns["ports"][0])
+
+
+class TestParquetConnector:
+    def test_partitioned_output(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        from pivot_track.lib.connectors import ParquetConnector
+        from pivot_track.lib.track import TrackingDefinition
+
+        output = ParquetConnector({"path": tmp_path / "parquet"})
+        definition = TrackingDefinition.from_dict({"uuid": str(uuid4()), "query": []})
+        output.query_output(_hosts(2))
+        assert output.tracking_output(_hosts(3), definition) == []
+
+        table = output.dataset().to_table()
+        assert table.num_rows == 5
+        definitions = set(table.column("definition").to_pylist())
+        assert definitions == {"query", str(definition.uuid)}
+        assert not list(tmp_path.rglob(".*.tmp"))
+
+    def test_one_file_per_batch(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        from pivot_track.lib.connectors import ParquetConnector
+
+        output = ParquetConnector({"path": tmp_path / "parquet"})
+        output.query_output([_hosts(2), _hosts(3)])
+        assert len(list(tmp_path.rglob("*.parquet"))) == 1
+        assert output.dataset().to_table().num_rows == 5
@@ -0,0 +1,108 @@
+import pytest
+
+from .mocks import FakeCensysSourceConnector, FakeShodanSourceConnector, synthetic_ip
+from pivot_track.lib.pivot import (
+    CERTIFICATE,
+    DOMAIN,
+    IP,
+    JARM,
+    PivotEdge,
+    PivotEngine,
+    PivotNode,
+    PivotRule,
+    parse_seed,
+)
+
+
+def engine(**options) -> PivotEngine:
+    return PivotEngine(
+        [FakeShodanSourceConnector(3), FakeCensysSourceConnector(3)],
+        **options,
+    )
+
+
+class TestSeeds:
+    def test_parse_seed(self):
+        assert parse_seed("8.8.8.8") == (IP, "8.8.8.8")
+        assert parse_seed("2001:db8::1") == (IP, "2001:db8::1")
+        assert parse_seed("ip:8.8.8.8") == (IP, "8.8.8.8")
+        assert parse_seed("Example.COM") == (DOMAIN, "example.com")
+        assert parse_seed("a" * 64) == (CERTIFICATE, "a" * 64)
+        assert parse_seed("b" * 62) == (JARM, "b" * 62)
+        assert parse_seed("asn:15169") == ("asn", "15169")
+
+    def test_invalid_rule(self):
+        with pytest.raises(ValueError):
+            PivotRule(IP, "shodan", "{value}")
+
+
+class TestPivotEngine:
+    def test_graph(self):
+        pivot_engine = engine(max_depth=2)
+        elements = list(pivot_engine.run(["8.8.8.8"]))
+        nodes = [element for element in elements if isinstance(element, PivotNode)]
+        edges = [element for element in elements if isinstance(element, PivotEdge)]
+        assert nodes[0].id == "ip:8.8.8.8" and nodes[0].depth == 0
+        assert "domain:dns.google" in pivot_engine.nodes
+        assert pivot_engine.nodes["domain:dns.google"].depth == 1
+        # Both sources found the same hosts for the domain, each host is one node
+        found = [f"ip:{synthetic_ip(i)}" for i in range(3)]
+        assert all(pivot_engine.nodes[ip].depth == 2 for ip in found)
+        assert len([node for node in nodes if node.id in found]) == 3
+        assert {
+            (edge.source_id, edge.relation)
+            for edge in edges
+            if edge.target_id == found[0]
+        } == {
+            ("domain:dns.google", "shodan_domain"),
+            ("domain:dns.google", "censys_domain"),
+        }
+        assert pivot_engine.stop_reason == "depth"
+
+    def test_visited(self):
+        shodan = FakeShodanSourceConnector(3)
+        pivot_engine = PivotEngine([shodan], max_depth=3)
+        list(pivot_engine.run(["8.8.8.8", "8.8.8.8", "dns.google"]))
+        # One host lookup and one search for the domain (seed and attribute of the host)
+        assert shodan.calls == 2
+        assert len(pivot_engine.queries) == 2
+
+    def test_credit_budget(self):
+        pivot_engine = engine(max_depth=2, max_credits=1)
+        list(pivot_engine.run(["8.8.8.8"]))
+        # The Censys host lookup costs the only credit, Shodan host lookups are free
+        assert pivot_engine.credits == 1
+        assert pivot_engine.skipped == 2
+        assert pivot_engine.stop_reason == "credits"
+        assert f"ip:{synthetic_ip(0)}" not in pivot_engine.nodes
+
+    def test_time_budget(self):
+        pivot_engine = engine(max_seconds=0)
+        elements = list(pivot_engine.run(["8.8.8.8"]))
+        assert [element.id for element in elements] == ["ip:8.8.8.8"]
+        assert pivot_engine.queries == set()
+        assert pivot_engine.stop_reason == "time"
+
+    def test_node_budget(self):
+        pivot_engine = engine(max_nodes=2)
+        list(pivot_engine.run(["8.8.8.8"]))
+        assert len(pivot_engine.nodes) == 2
+        assert pivot_engine.stop_reason == "nodes"
+
+    def test_from_config(self):
+        config = {
+            "pivot": {
+                "max_depth": 3,
+                "max_credits": 10,
+                "rules": [
+                    {"kind": "jarm", "source": "shodan", "query": "ssl.jarm:{value}"}
+                ],
+            }
+        }
+        pivot_engine = PivotEngine.from_config(
+            config, [FakeShodanSourceConnector(1)], max_depth=1, workers=None
+        )
+        assert pivot_engine.max_depth == 1
+        assert pivot_engine.max_credits == 10
+        assert pivot_engine.workers == 4
+        assert [rule.name for rule in pivot_engine.rules] == ["shodan_jarm"]
@@ -0,0 +1,171 @@
+import pytest
+
+from .mocks import (
+    FakeShodanSourceConnector,
+    fake_opensearch_connector,
+    tracking_cycle,
+    tracking_definition,
+)
+from pivot_track.lib.profiling import Profiler
+from pivot_track.lib.state import TrackingState, result_hash
+from pivot_track.lib.track import Tracking
+
+
+class CountingShodanSourceConnector(FakeShodanSourceConnector):
+    def __init__(self, size: int, total: int = None):
+        super().__init__(size)
+        self.total = size if total is None else total
+        self.count_calls = 0
+
+    def query_host_count(self, query: str):
+        self.count_calls += 1
+        return self.total
+
+
+def _cycle(definition, connection, state, output_connection=None):
+    with Profiler("track", trace_memory=False) as profiler:
+        results = Tracking.execute_tracking_queries(
+            definition.queries_by_source("shodan"),
+            connection,
+            output_connection,
+            state=state,
+            definition=definition,
+        )
+    return results, profiler.report()["counters"]
+
+
+class TestTrackingState:
+    def test_query_state(self, tmp_path):
+        state = TrackingState(tmp_path / "state.sqlite")
+        assert state.query_state("a", "shodan", "x") == {"total": None, "hash": None}
+        state.update_query_state("a", "shodan", "x", total=10, hash="h")
+        state.update_query_state("a", "shodan", "x", total=11)
+        state.close()
+
+        state = TrackingState(tmp_path / "state.sqlite")
+        assert state.query_state("a", "shodan", "x") == {"total": 11, "hash": "h"}
+
+    def test_result_hash(self):
+        assert result_hash({"a": 1, "b": [1, 2]}) == result_hash({"b": [1, 2], "a": 1})
+        assert result_hash({"a": 1}) != result_hash({"a": 2})
+
+
+class TestPrecheck:
+    def test_unchanged_count_skips_search(self):
+        state, definition = (
+            TrackingState(),
+            tracking_definition(query="product:nginx", precheck=True),
+        )
+        connection = CountingShodanSourceConnector(5)
+
+        results, counters = _cycle(definition, connection, state)
+        assert len(results) == 1
+        assert connection.calls == 1
+        assert "short_circuited_queries" not in counters
+
+        results, counters = _cycle(definition, connection, state)
+        assert results == []
+        assert connection.count_calls == 2
+        assert connection.calls == 1
+        assert counters["short_circuited_queries"] == 1
+
+    def test_unchanged_hash_skips_output(self):
+        state, definition = (
+            TrackingState(),
+            tracking_definition(query="product:nginx", precheck=True),
+        )
+        connection = CountingShodanSourceConnector(5)
+        output_connection = fake_opensearch_connector()
+        _cycle(definition, connection, state, output_connection)
+        indexed = output_connection.opensearch_client.calls["index"]
+
+        # The total changed, but the result did not
+        connection.total = 6
+        results, counters = _cycle(definition, connection, state, output_connection)
+        assert results == []
+        assert connection.calls == 2
+        assert counters["short_circuited_queries"] == 1
+        assert output_connection.opensearch_client.calls["index"] == indexed
+
+    def test_changed_result(self):
+        state, definition = (
+            TrackingState(),
+            tracking_definition(query="product:nginx", precheck=True),
+        )
+        connection = CountingShodanSourceConnector(5)
+        _cycle(definition, connection, state)
+
+        connection.offset, connection.total = 1, 6
+        results, counters = _cycle(definition, connection, state)
+        assert len(results) == 1
+        assert "short_circuited_queries" not in counters
+
+    def test_without_precheck(self):
+        state, definition = TrackingState(), tracking_definition(query="product:nginx")
+        connection = CountingShodanSourceConnector(5)
+        _cycle(definition, connection, state)
+        _cycle(definition, connection, state)
+        assert connection.count_calls == 0
+        assert connection.calls == 2
+
+    def test_count_with_credit_cost(self):
+        state, definition = (
+            TrackingState(),
+            tracking_definition(query="product:nginx", precheck=True),
+        )
+        connection = CountingShodanSourceConnector(5)
+        connection.CREDIT_COSTS = {"generic": 1, "count": 1}
+        _cycle(definition, connection, state)
+        results, counters = _cycle(definition, connection, state)
+        # Counting is not free, so only the result hash is compared
+        assert connection.count_calls == 0
+        assert connection.calls == 2
+        assert results == []
+        assert counters["short_circuited_queries"] == 1
+
+    def test_count_opt_in_and_out(self):
+        state = TrackingState()
+        connection = CountingShodanSourceConnector(5)
+        connection.CREDIT_COSTS = {"generic": 1, "count": 1}
+        _cycle(
+            tracking_definition(
+                query="product:nginx", precheck=True, precheck_count=True
+            ),
+            connection,
+            state,
+        )
+        assert connection.count_calls == 1
+
+        connection = CountingShodanSourceConnector(5)
+        _cycle(
+            tracking_definition(
+                query="product:nginx", precheck=True, precheck_count=False
+            ),
+            connection,
+            state,
+        )
+        assert connection.count_calls == 0
+
+    def test_failed_output_is_retried(self):
+        state = TrackingState()
+        definition = tracking_definition(query="product:nginx", precheck=True)
+        connection = CountingShodanSourceConnector(5)
+        output_connection = fake_opensearch_connector()
+        tracking_output = output_connection.tracking_output
+
+        def failing_tracking_output(*args, **kwargs):
+            raise ConnectionError("OpenSearch is not reachable")
+
+        output_connection.tracking_output = failing_tracking_output
+        with pytest.raises(ConnectionError):
+            tracking_cycle(definition, connection, state, output_connection)
+        assert state.query_state(definition.uuid, "shodan", "product:nginx") == {
+            "total": None,
+            "hash": None,
+        }
+
+        # The result did not change, but it was never written
+        output_connection.tracking_output = tracking_output
+        notification = tracking_cycle(definition, connection, state, output_connection)
+        assert len([item for item in notification.new if hasattr(item, "ip")]) == 5
+        assert state.query_state(definition.uuid, "shodan", "product:nginx")["hash"]
@@ -0,0 +1,107 @@
+import io
+import json
+
+from rich.console import Console
+
+from .mocks import FakeShodanSourceConnector, synthetic_ip
+from pivot_track.lib.connectors import CLIPrinter, JSONPrinter
+from pivot_track.lib.connectors.printer import json_encoder
+from pivot_track.lib.query import Querying
+
+
+def _query_result(size: int):
+    query_result, _ = Querying.host_query(
+        "product:nginx", FakeShodanSourceConnector(size)
+    )
+    return query_result
+
+
+class TestJSONPrinter:
+    def test_json_lines(self):
+        stream = io.BytesIO()
+        JSONPrinter(lines=True, stream=stream).query_output(
+            [_query_result(3), _query_result(2)]
+        )
+        lines = stream.getvalue().decode().splitlines()
+        assert len(lines) == 5
+        assert [json.loads(line)["ip"] for line in lines[:3]] == [
+            synthetic_ip(i) for i in range(3)
+        ]
+
+    def test_json_lines_raw(self):
+        stream = io.BytesIO()
+        JSONPrinter(lines=True, stream=stream).query_output(_query_result(3), raw=True)
+        lines = stream.getvalue().decode().splitlines()
+        assert len(lines) == 1
+        assert len(json.loads(lines[0])["matches"]) == 3
+
+    def test_markup_is_not_parsed(self, capsys):
+        JSONPrinter().json({"banner": "[bold]x[/bold]"})
+        assert "[bold]x[/bold]" in capsys.readouterr().out
+
+    def test_encoder(self):
+        assert json.loads(json_encoder()({"a": [1, "[b]"]})) == {"a": [1, "[b]"]}
+
+    def test_encoder_large_integer(self):
+        # Certificate serial numbers (e.g. Shodan ssl.cert.serial) exceed 64 bits
+        serial = 2**127 + 1
+        document = {"ssl": {"cert": {"serial": serial}}}
+        assert json.loads(json_encoder()(document)) == document
+
+
+def _printer(**kwargs):
+    stream = io.StringIO()
+    return CLIPrinter(console=Console(file=stream, width=200), **kwargs), stream
+
+
+class TestCLIPrinter:
+    def test_pages(self):
+        printer, stream = _printer(page_size=2)
+        printer.query_output(_query_result(5))
+        output = stream.getvalue()
+        assert output.count("First Seen") == 1
+        assert all(synthetic_ip(i) in output for i in range(5))
+        assert printer._rendered_rows == 5
+
+    def test_max_rows(self):
+        printer, stream = _printer(page_size=2, max_rows=3)
+        printer.query_output([_query_result(2)])
+        printer.query_output([_query_result(4)])
+        printer.flush()
+        output = stream.getvalue()
+        assert output.count("First Seen") == 1
+        assert "3 more host(s) not shown" in output
+
+    def test_compact_threshold(self):
+        printer, stream = _printer(compact_threshold=2)
+        printer.query_output(_query_result(3))
+        assert "─" not in stream.getvalue()
+
+        printer, stream = _printer(compact_threshold=5)
+        printer.query_output(_query_result(3))
+        assert "─" in stream.getvalue()
+
+    def test_compact_output(self):
+        # The layout depends on all rows of the output, not on the size of one batch
+        printer, stream = _printer(compact_threshold=4)
+        printer.query_output([_query_result(3), _query_result(3)])
+        assert "─" not in stream.getvalue()
+
+        printer, stream = _printer(compact_threshold=4)
+        printer.query_output(_query_result(3))
+        first_batch = stream.getvalue()
+        printer.query_output(_query_result(3))
+        assert "─" in first_batch
+        assert "─" not in stream.getvalue()[len(first_batch) :]
+        printer.flush()
+        assert printer._compact_output is False
+
+        printer, stream = _printer(compact_threshold=4, max_rows=2)
+        printer.query_output(_query_result(10))
+        assert "─" in stream.getvalue()
+
+    def test_from_config(self):
+        printer = CLIPrinter.from_config({"cli": {"page_size": 10, "compact": True}})
+        assert printer.page_size == 10
+        assert printer.compact is True
+        assert CLIPrinter.from_config(None).max_rows is None
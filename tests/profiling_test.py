@@ -0,0 +1,92 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from .mocks import FakeShodanSourceConnector, tracking_cycle, tracking_definition
+from pivot_track.lib import profiling
+from pivot_track.lib.profiling import Profiler
+
+
+class TestProfiler:
+    def test_span_without_profiler(self):
+        with profiling.span("conversion", source="shodan") as node:
+            assert node is None
+        profiling.count("queries")
+        assert profiling.active_profiler() is None
+
+    def test_spans_are_merged(self):
+        with Profiler("test", trace_memory=False) as profiler:
+            with profiling.span("definition", definition="a"):
+                for _ in range(3):
+                    with profiling.span("index"):
+                        pass
+            with profiling.span("definition", definition="b"):
+                pass
+            profiling.count("new_elements", 2)
+        assert profiling.active_profiler() is None
+
+        report = profiler.report()
+        assert [span["labels"]["definition"] for span in report["spans"]] == ["a", "b"]
+        assert report["spans"][0]["children"][0]["count"] == 3
+        assert report["stages"]["index"]["count"] == 3
+        assert report["stages"]["definition"]["count"] == 2
+        assert report["counters"] == {"new_elements": 2}
+        assert "peak_memory_bytes" not in report
+
+    def test_span_in_worker_thread(self):
+        def work(index):
+            with profiling.span("worker"):
+                profiling.count("work")
+            return index
+
+        with Profiler("test", trace_memory=False) as profiler:
+            with profiling.span("fan_out"):
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    results = list(executor.map(profiling.propagate(work), range(4)))
+
+        assert results == [0, 1, 2, 3]
+        report = profiler.report()
+        assert report["spans"][0]["children"][0]["name"] == "worker"
+        assert report["stages"]["worker"]["count"] == 4
+        assert report["counters"] == {"work": 4}
+
+    def test_memory_peak(self):
+        with Profiler("test") as profiler:
+            with profiling.span("allocate"):
+                data = bytearray(1_000_000)
+                del data
+            with profiling.span("idle"):
+                pass
+        stages = profiler.report()["stages"]
+        assert stages["allocate"]["peak_memory_bytes"] >= 1_000_000
+        assert stages["idle"]["peak_memory_bytes"] < 1_000_000
+        assert profiler.report()["peak_memory_bytes"] >= 1_000_000
+
+    def test_write_report(self, tmp_path):
+        with Profiler("test", trace_memory=False, cprofile=True) as profiler:
+            with profiling.span("stage"):
+                sum(range(1000))
+        report_path = profiler.write_report(tmp_path)
+        assert json.loads(report_path.read_text())["command"] == "test"
+        assert report_path.with_suffix(".pstats").exists()
+
+
+class TestTrackingProfile:
+    def test_tracking_cycle_stages(self):
+        with Profiler("track") as profiler:
+            notification = tracking_cycle(
+                tracking_definition(), FakeShodanSourceConnector(10)
+            )
+        report = profiler.report()
+        for stage in (
+            "definition",
+            "query",
+            "source_request",
+            "conversion",
+            "tracking_output",
+            "new_element_check",
+            "index",
+            "notify",
+        ):
+            assert stage in report["stages"]
+        assert report["stages"]["new_element_check"]["count"] == 10
+        assert report["counters"]["new_elements"] == len(notification.new)
@@ -4,12 +4,15 @@ from .mocks import (
     CENSYS_SEARCH_JSON,
     CENSYS_TEST_HOST,
     CENSYS_TEST_SEARCH_QUERY,
+    FakeCensysSourceConnector,
+    FakeShodanSourceConnector,
+    MockCensysSourceConnector,
+    MockShodanSourceConnector,
     SHODAN_HOST_JSON,
     SHODAN_SEARCH_JSON,
     SHODAN_TEST_HOST,
     SHODAN_TEST_SEARCH_QUERY,
-    MockCensysSourceConnector,
-    MockShodanSourceConnector,
+    synthetic_ip,
 )
 from pivot_track.lib.query import QueryResult, Querying
 from pivot_track.lib.connectors import (
@@ -203,3 +206,112 @@ class TestQuerying:
         assert query_result_pt2 is None
         assert type(query_result_pt1.source == CensysSourceConnector)
         assert query_result_pt1.element_count == 2
+
+
+class TestBatchHosts:
+    def test_read_hosts(self):
+        lines = ["10.0.0.1, 10.0.0.2\n", "# comment\n", "10.0.0.1 no-ip\n", "\n"]
+        assert Querying.read_hosts(lines) == ["10.0.0.1", "10.0.0.2"]
+
+    def test_bulk_lookup(self):
+        connection = FakeShodanSourceConnector(0)
+        hosts = [synthetic_ip(i) for i in range(250)]
+        batches = list(Querying.hosts(hosts, connection, workers=2))
+        assert connection.calls == 3
+        results = [result for batch in batches for result in batch]
+        assert sorted(result.search_term for result in results) == sorted(hosts)
+        assert all(result.source is ShodanSourceConnector for result in results)
+
+    def test_single_lookups_without_bulk_endpoint(self):
+        connection = MockShodanSourceConnector()
+        connection.HOST_BULK_SIZE = 1
+        batches = list(Querying.hosts([SHODAN_TEST_HOST], connection))
+        assert [result.search_term for result in batches[0]] == [SHODAN_TEST_HOST]
+
+    def test_cached_hosts(self, tmp_path):
+        from pivot_track.lib.cache import QueryCache
+
+        cache = QueryCache({"path": tmp_path / "cache.sqlite"})
+        connection = FakeShodanSourceConnector(0)
+        hosts = [synthetic_ip(i) for i in range(3)]
+        list(Querying.hosts(hosts[:2], connection, cache=cache))
+        batches = list(Querying.hosts(hosts, connection, cache=cache))
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert connection.calls == 2
+
+    def test_failed_chunk_and_error_entries(self, tmp_path):
+        from pivot_track.lib.cache import QueryCache
+
+        hosts = [synthetic_ip(i) for i in range(4)]
+
+        class FailingShodanSourceConnector(FakeShodanSourceConnector):
+            def query_hosts(self, chunk: list) -> dict:
+                if hosts[0] in chunk:
+                    raise RuntimeError("chunk failed")
+                raw_results = super().query_hosts(chunk)
+                raw_results[hosts[3]] = {"error": "Not found"}
+                return raw_results
+
+        cache = QueryCache({"path": tmp_path / "cache.sqlite"})
+        connection = FailingShodanSourceConnector(0)
+        batches = list(Querying.hosts(hosts, connection, cache=cache, bulk_size=2))
+        assert [result.search_term for batch in batches for result in batch] == [
+            hosts[2]
+        ]
+        assert cache.get("shodan", "host", hosts[3]) is None
+
+    def test_unknown_hosts_are_not_looked_up_again(self):
+        from shodan import APIError
+
+        class HostClient:
+            def __init__(self, error):
+                self.error = error
+                self.calls = 0
+
+            def host(self, ips):
+                self.calls += 1
+                raise self.error
+
+        class BulkShodanSourceConnector(ShodanSourceConnector):
+            def __init__(self, error):
+                self.config = {"rate_limit": 1000, "retry": {"max_attempts": 1}}
+                self.shodan_client = HostClient(error)
+
+        hosts = [synthetic_ip(i) for i in range(3)]
+        connection = BulkShodanSourceConnector(
+            APIError("No information available for that IP.")
+        )
+        assert list(Querying.hosts(hosts, connection)) == []
+        assert connection.shodan_client.calls == 1
+
+        # After a failed bulk call, the hosts are looked up one by one
+        connection = BulkShodanSourceConnector(APIError("Bad Gateway (502)"))
+        list(Querying.hosts(hosts, connection))
+        assert connection.shodan_client.calls == 4
+
+    def test_censys_bulk_lookup(self):
+        hosts = [synthetic_ip(i) for i in range(3)]
+
+        class UnknownHostCensysSourceConnector(FakeCensysSourceConnector):
+            def query_host(self, host: str):
+                if host == hosts[1]:
+                    return None
+                if host == hosts[2]:
+                    return {"error": "Not found"}
+                return super().query_host(host)
+
+        connection = UnknownHostCensysSourceConnector(0)
+        # Hosts are viewed one by one (through the throttle of the connector), unknown ones are left out
+        assert list(connection.query_hosts(hosts)) == [hosts[0]]
+        assert connection.calls == 1
+
+    def test_output_stream(self, capsys):
+        connection = FakeShodanSourceConnector(0)
+        hosts = [synthetic_ip(i) for i in range(5)]
+        Querying.output_stream(
+            dict(),
+            Querying.hosts(hosts, connection, bulk_size=2),
+            output_format="json",
+        )
+        output = capsys.readouterr().out
+        assert all(host in output for host in hosts)
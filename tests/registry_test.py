@@ -0,0 +1,68 @@
+from importlib.metadata import EntryPoint
+
+from .mocks import MockShodanSourceConnector
+from pivot_track.lib import utils
+from pivot_track.lib.connectors import (
+    ConnectorRegistry,
+    SourceConnector,
+    OutputConnector,
+    ShodanSourceConnector,
+    OpenSearchConnector,
+)
+
+
+class TestConnectorRegistry:
+    def test_builtin_connectors(self):
+        registry = ConnectorRegistry()
+        assert registry.load("shodan") is ShodanSourceConnector
+        assert registry.load("shodan", SourceConnector) is ShodanSourceConnector
+        assert registry.load("opensearch", OutputConnector) is OpenSearchConnector
+        assert registry.load("opensearch", SourceConnector) is None
+
+    def test_no_substring_matching(self):
+        registry = ConnectorRegistry()
+        assert registry.load("shod") is None
+        assert registry.load("source") is None
+
+    def test_register_class(self):
+        registry = ConnectorRegistry()
+        registry.register("mockshodan", MockShodanSourceConnector)
+        assert registry.load("mockshodan", SourceConnector) is MockShodanSourceConnector
+        assert "mockshodan" in registry.names
+
+    def test_module_reference(self):
+        registry = ConnectorRegistry()
+        reference = "tests.mocks:MockShodanSourceConnector"
+        assert registry.load(reference) is MockShodanSourceConnector
+        assert registry.load("tests.mocks:DoesNotExist") is None
+
+    def test_entry_points(self, mocker):
+        entry_point = EntryPoint(
+            name="inhouse",
+            value="tests.mocks:MockShodanSourceConnector",
+            group="pivot_track.connectors",
+        )
+        shadowing_entry_point = EntryPoint(
+            name="shodan",
+            value="tests.mocks:MockShodanSourceConnector",
+            group="pivot_track.connectors",
+        )
+        mocker.patch(
+            "importlib.metadata.entry_points",
+            return_value=[entry_point, shadowing_entry_point],
+        )
+        registry = ConnectorRegistry()
+        assert registry.load("inhouse", SourceConnector) is MockShodanSourceConnector
+        assert registry.load("shodan") is ShodanSourceConnector
+
+    def test_classes_by_parent(self):
+        source_connectors = utils.connectors_by_parent(SourceConnector)
+        assert ShodanSourceConnector in source_connectors
+        assert OpenSearchConnector not in source_connectors
+        assert MockShodanSourceConnector not in source_connectors
+
+    def test_connector_by_config(self):
+        connector = utils.connector_by_config(
+            SourceConnector, "shodan-secondary", {"connector": "shodan"}
+        )
+        assert connector is ShodanSourceConnector
@@ -0,0 +1,216 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from shodan import APIError
+from censys.common.exceptions import (
+    CensysRateLimitExceededException,
+    CensysUnauthorizedException,
+    CensysSearchException,
+)
+
+from .mocks import SHODAN_SEARCH_JSON
+from pivot_track.lib.connectors import (
+    ShodanSourceConnector,
+    CensysSourceConnector,
+    CircuitBreaker,
+    RetryPolicy,
+    RateLimitError,
+    TransientSourceError,
+    AuthenticationError,
+    QueryError,
+    NotFoundError,
+)
+
+
+class FakeShodanClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def search(self, query):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class RetryingShodanSourceConnector(ShodanSourceConnector):
+    def __init__(self, responses, **config):
+        self.config = {
+            "rate_limit": 1000,
+            "retry": {"max_attempts": 3, "backoff_base": 0},
+            **config,
+        }
+        self.shodan_client = FakeShodanClient(responses)
+        self._update_last_call()
+
+
+class TestRetries:
+    def test_transient_error_is_retried(self):
+        connector = RetryingShodanSourceConnector(
+            [APIError("Unable to connect to Shodan"), SHODAN_SEARCH_JSON]
+        )
+        assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+        assert connector.shodan_client.calls == 2
+        assert connector.circuit_state == CircuitBreaker.CLOSED
+
+    def test_query_error_is_not_retried(self):
+        connector = RetryingShodanSourceConnector([APIError("Invalid search query")])
+        assert connector.query_host_search("x") is None
+        assert connector.shodan_client.calls == 1
+
+    def test_retries_exhausted(self):
+        connector = RetryingShodanSourceConnector([APIError("Bad Gateway (502)")] * 3)
+        assert connector.query_host_search("x") is None
+        assert connector.shodan_client.calls == 3
+
+    def test_rate_limit_with_single_key(self):
+        # Retry-After is above the maximum backoff, the retries must not find the key disabled
+        connector = RetryingShodanSourceConnector(
+            [RateLimitError("Rate limit reached", retry_after=60)] * 2
+            + [SHODAN_SEARCH_JSON],
+            retry={"max_attempts": 3, "backoff_base": 0, "backoff_max": 0.01},
+        )
+        assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+        assert connector.shodan_client.calls == 3
+        assert connector.credential_pool.available() != []
+        assert connector.circuit_breaker.failures == 0
+
+    def test_rate_limited_credentials_are_waited_for(self):
+        connector = RetryingShodanSourceConnector(
+            [SHODAN_SEARCH_JSON], retry={"max_attempts": 3, "backoff_max": 1}
+        )
+        credential = connector.credential_pool.credentials[0]
+        connector.credential_pool.take_out(credential, "rate limited", 0.05)
+        assert connector.query_host_search("x") == SHODAN_SEARCH_JSON
+
+        # A longer cooldown skips the call, but the source is not failing
+        connector.credential_pool.take_out(credential, "rate limited", 120)
+        assert connector.query_host_search("x") is None
+        assert connector.shodan_client.calls == 1
+        assert connector.circuit_breaker.failures == 0
+
+    def test_unknown_exception_is_raised(self):
+        connector = RetryingShodanSourceConnector([KeyError("x")])
+        with pytest.raises(KeyError):
+            connector.query_host_search("x")
+
+    def test_circuit_breaker_skips_source(self):
+        connector = RetryingShodanSourceConnector(
+            [APIError("Invalid API key")] * 2,
+            circuit_breaker={"failure_threshold": 2, "reset_timeout": 60},
+        )
+        connector.query_host_search("x")
+        connector.query_host_search("x")
+        assert connector.circuit_state == CircuitBreaker.OPEN
+        assert connector.query_host_search("x") is None
+        # The only API key was taken out of rotation after the first call
+        assert connector.shodan_client.calls == 1
+
+
+class TestClassification:
+    def test_shodan(self):
+        connector = RetryingShodanSourceConnector([])
+        for message, error_class in (
+            ("Rate limit reached", RateLimitError),
+            ("Unable to connect to Shodan", TransientSourceError),
+            ("Invalid API key", AuthenticationError),
+            ("No information available for that IP.", NotFoundError),
+            ("Invalid search query", QueryError),
+        ):
+            assert type(connector._classify_error(APIError(message))) is error_class
+
+    def test_censys(self):
+        connector = CensysSourceConnector.__new__(CensysSourceConnector)
+        assert isinstance(
+            connector._classify_error(
+                CensysRateLimitExceededException(429, "Rate limit exceeded")
+            ),
+            RateLimitError,
+        )
+        assert isinstance(
+            connector._classify_error(CensysUnauthorizedException(401, "Unauthorized")),
+            AuthenticationError,
+        )
+        assert isinstance(
+            connector._classify_error(CensysSearchException(503, "Unavailable")),
+            TransientSourceError,
+        )
+        assert isinstance(
+            connector._classify_error(CensysSearchException(400, "Bad query")),
+            QueryError,
+        )
+
+    def test_requests_exception(self):
+        connector = RetryingShodanSourceConnector([])
+        assert isinstance(
+            connector._classify_error(requests.exceptions.ConnectionError()),
+            TransientSourceError,
+        )
+
+
+class TestRetryPolicy:
+    def test_backoff_is_bounded(self):
+        policy = RetryPolicy(backoff_base=1, backoff_max=5)
+        for attempt in range(10):
+            assert 0 <= policy.delay(attempt) <= 5
+
+    def test_retry_after_hint(self):
+        policy = RetryPolicy(backoff_base=0, backoff_max=60)
+        assert policy.delay(0, retry_after=7) == 7
+        assert policy.delay(0, retry_after=600) == 60
+
+
+class TestCircuitBreaker:
+    def test_half_open(self):
+        states = list()
+        breaker = CircuitBreaker(
+            "test",
+            failure_threshold=1,
+            reset_timeout=0.05,
+            on_state_change=states.append,
+        )
+        breaker.record_failure()
+        assert not breaker.allow()
+        time.sleep(0.06)
+        assert breaker.allow()
+        # Only one trial call while half open
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert states == ["open", "half_open", "closed"]
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(1)
+        self.send_response(429)
+        self.send_header("Retry-After", "3")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSession:
+    @pytest.fixture
+    def server(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+
+    def test_timeout_and_rate_limit_hint(self, server):
+        connector = RetryingShodanSourceConnector([], timeout=0.2)
+        session = connector._configure_session(requests.Session())
+        session.get(f"{server}/limited")
+        assert connector._retry_after == 3
+        with pytest.raises(requests.exceptions.Timeout):
+            session.get(f"{server}/slow")
@@ -0,0 +1,101 @@
+from common_osint_model import Domain, Host
+
+from .mocks import FakeShodanSourceConnector, synthetic_ip, tracking_definition
+from pivot_track.lib.connectors import SQLiteConnector
+from pivot_track.lib.query import Querying
+from pivot_track.lib.track import Tracking
+
+
+def _query_result(size: int, offset: int = 0):
+    query_result, _ = Querying.host_query(
+        "product:nginx", FakeShodanSourceConnector(size, offset)
+    )
+    return query_result
+
+
+class TestSQLiteConnector:
+    def test_query_output(self, tmp_path):
+        output = SQLiteConnector({"path": tmp_path / "out.sqlite"})
+        query_result = _query_result(3)
+        output.query_output(query_result)
+        output.query_output(query_result, raw=True)
+
+        stored = output.lookup_ip(synthetic_ip(1))
+        assert len(stored) == 1
+        assert stored[0]["context"] == "query"
+        assert stored[0]["document"]["ip"] == synthetic_ip(1)
+        raw_count = output._connection.execute(
+            "SELECT COUNT(*) FROM raw_results"
+        ).fetchone()[0]
+        assert raw_count == 1
+        output.close()
+
+    def test_tracking_output_new_elements(self, tmp_path):
+        output = SQLiteConnector({"path": tmp_path / "out.sqlite"})
+        definition = tracking_definition(query="product:nginx")
+
+        new_items = output.tracking_output(_query_result(3), definition)
+        new_ips = [item.ip for item in new_items if hasattr(item, "ip")]
+        assert new_ips == [synthetic_ip(i) for i in range(3)]
+
+        assert output.tracking_output(_query_result(3), definition) == []
+        new_items = output.tracking_output(_query_result(3, offset=1), definition)
+        assert [item.ip for item in new_items if hasattr(item, "ip")] == [
+            synthetic_ip(3)
+        ]
+        assert len(output.tracking_history(definition.uuid)) == 9
+        # Elements are new per definition
+        assert (
+            output.tracking_output(
+                _query_result(1), tracking_definition(query="product:nginx")
+            )
+            != []
+        )
+        output.close()
+
+    def test_known_elements_are_skipped(self, tmp_path):
+        output = SQLiteConnector({"path": tmp_path / "out.sqlite"})
+        new_items = output.tracking_output(
+            _query_result(2),
+            tracking_definition(query="product:nginx"),
+            known={synthetic_ip(0)},
+        )
+        assert synthetic_ip(0) not in [getattr(item, "ip", None) for item in new_items]
+        output.close()
+
+    def test_lookup_domain_and_state(self, tmp_path):
+        output = SQLiteConnector({"path": tmp_path / "out.sqlite"})
+        definition = tracking_definition(query="product:nginx")
+        query_result = _query_result(2)
+        for host in query_result.com_result:
+            host.domains = [Domain(domain="example.com")]
+        new_items = output.tracking_output(query_result, definition)
+        assert [type(item) for item in new_items] == [Domain, Host, Host]
+
+        stored = output.lookup_domain("EXAMPLE.com", definition=definition.uuid)
+        assert {entry["document"]["ip"] for entry in stored} == {
+            synthetic_ip(0),
+            synthetic_ip(1),
+        }
+        kinds = {entry["kind"] for entry in output.element_state(definition.uuid)}
+        assert kinds == {"ip", "domain"}
+        output.close()
+
+    def test_persistence(self, tmp_path):
+        definition = tracking_definition(query="product:nginx")
+        output = SQLiteConnector({"path": tmp_path / "out.sqlite"})
+        output.tracking_output(_query_result(2), definition)
+        output.close()
+
+        output = SQLiteConnector({"path": tmp_path / "out.sqlite"})
+        assert output.tracking_output(_query_result(2), definition) == []
+        output.close()
+
+    def test_tracking_cycle(self, tmp_path):
+        output = SQLiteConnector({"path": tmp_path / "out.sqlite"})
+        definition = tracking_definition(query="product:nginx")
+        Tracking.track_definitions_for_source(
+            [definition], FakeShodanSourceConnector(4), output
+        )
+        assert len(output.tracking_history(definition.uuid)) == 4
+        output.close()
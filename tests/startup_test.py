@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import subprocess
+import sys
+
+REPOSITORY_PATH = Path(__file__).parent.parent
+
+
+def loaded_modules(statement: str, modules: list) -> list:
+    check = f"import sys; {statement}; print(','.join(m for m in {modules!r} if m in sys.modules))"
+    completed = subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=REPOSITORY_PATH,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return [module for module in completed.stdout.strip().split(",") if module]
+
+
+class TestStartup:
+    def test_cli_import_is_lazy(self):
+        heavy_modules = ["shodan", "censys", "opensearchpy", "common_osint_model"]
+        assert loaded_modules("import pivot_track.cli", heavy_modules) == []
+
+    def test_source_connector_import_is_lazy(self):
+        statement = "from pivot_track.lib.connectors import ShodanSourceConnector"
+        assert loaded_modules(statement, ["shodan", "censys", "opensearchpy"]) == []
+
+    def test_selected_connector_is_loaded(self):
+        statement = "from pivot_track.lib import utils; utils.connector_by_config(utils.OutputConnector, 'opensearch', dict())"
+        assert loaded_modules(statement, ["shodan", "opensearchpy"]) == ["opensearchpy"]
+
+    def test_lazy_connectors_are_exported(self):
+        from pivot_track.lib import connectors
+
+        assert set(connectors._LAZY_CONNECTORS) <= set(connectors.__all__)
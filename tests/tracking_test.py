@@ -1,8 +1,14 @@
 import pytest
 from .mocks import (
+    FakeCensysSourceConnector,
+    FakeShodanSourceConnector,
     MockCensysSourceConnector,
-    MockShodanSourceConnector,
     MockOpenSearchConnector,
+    MockShodanSourceConnector,
+    RecordingNotification,
+    fake_opensearch_connector,
+    synthetic_ip,
+    tracking_definition,
 )
 from pydantic import ValidationError
 import pathlib
@@ -273,7 +279,7 @@ output: opensearch"""
             "query": "example query",
         }
 
-        query_dict2 = {"source": "censys", "command": "host", "query": "example query"}
+        query_dict2 = {"source": "censys", "command": "host", "query": "192.0.2.1"}
 
         queries = [
             TrackingQuery.from_dict(query_dict1),
@@ -290,7 +296,7 @@ output: opensearch"""
             "query": "example query",
         }
 
-        query_dict2 = {"source": "censys", "command": "host", "query": "example query"}
+        query_dict2 = {"source": "censys", "command": "host", "query": "192.0.2.1"}
 
         queries = [
             TrackingQuery.from_dict(query_dict1),
@@ -440,4 +446,77 @@ output: opensearch"""
         assert spy_shodan.call_count == 2
         assert spy_censys.call_count == 1
         assert spy_opensearch_query_output.call_count == 3
-        assert spy_opensearch_tracking_output.call_count == 3
+        # One tracking output per definition, with the results of all sources
+        assert spy_opensearch_tracking_output.call_count == 2
+
+
+class TestWatchlists:
+    def test_hosts(self):
+        query = TrackingQuery.from_dict(
+            {
+                "source": "shodan",
+                "command": "host",
+                "query": ["192.0.2.1", "198.51.100.0/30, 192.0.2.1", "no-ip"],
+            }
+        )
+        assert query.query == "192.0.2.1, 198.51.100.0/30, 192.0.2.1, no-ip"
+        assert query.hosts == ["192.0.2.1", "198.51.100.1", "198.51.100.2"]
+
+    def test_too_large_network(self):
+        query = TrackingQuery.from_dict(
+            {"source": "shodan", "command": "host", "query": "10.0.0.0/8 192.0.2.1"}
+        )
+        assert query.hosts == ["192.0.2.1"]
+
+    def test_merged_bulk_lookup(self, mocker):
+        hosts = [synthetic_ip(i) for i in range(150)]
+        definition1, definition2 = (
+            tracking_definition(command="host", query=hosts[:100]),
+            tracking_definition(command="host", query=hosts[50:]),
+        )
+        connection = FakeShodanSourceConnector(0)
+        mock_opensearch = MockOpenSearchConnector()
+        spy_tracking_output = mocker.spy(mock_opensearch, "tracking_output")
+
+        Tracking.track_definitions_for_source(
+            [definition1, definition2], connection, mock_opensearch
+        )
+        # 150 distinct hosts in chunks of 100
+        assert connection.calls == 2
+        tracked = {
+            call.kwargs["definition"].uuid: [
+                result.search_term for result in call.kwargs["query_result"]
+            ]
+            for call in spy_tracking_output.call_args_list
+        }
+        assert tracked[definition1.uuid] == hosts[:100]
+        assert tracked[definition2.uuid] == hosts[50:]
+
+
+class TestSourceMerging:
+    def test_merged_entities(self, mocker):
+        definition = tracking_definition("shodan", "censys")
+        output_connection = fake_opensearch_connector()
+        notification = RecordingNotification()
+        spy_tracking_output = mocker.spy(output_connection, "tracking_output")
+        Tracking.track_definitions(
+            [definition],
+            [
+                FakeShodanSourceConnector(5),
+                FakeCensysSourceConnector(5, offset=3),
+            ],
+            output_connection,
+            notification_connection=notification,
+        )
+
+        assert spy_tracking_output.call_count == 1
+        hosts = output_connection.query_result_to_com_list(
+            spy_tracking_output.call_args.kwargs["query_result"]
+        )
+        assert [host.ip for host in hosts] == [synthetic_ip(i) for i in range(8)]
+        sources = {host.ip: host.source for host in hosts}
+        assert sources[synthetic_ip(0)] == "shodan"
+        assert sources[synthetic_ip(3)] == "shodan,censys"
+        assert sources[synthetic_ip(7)] == "censys"
+        notified_ips = [item.ip for item in notification.new if hasattr(item, "ip")]
+        assert sorted(notified_ips) == sorted(synthetic_ip(i) for i in range(8))